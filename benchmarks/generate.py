@@ -0,0 +1,101 @@
+"""Log generator.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Writes synthetic logs of any size with the format of the real ones. The hostnames are chosen with a Zipf
+distribution among a given number of hosts and the timestamps go out of order by a random jitter that
+is never greater than TIMESTAMP_MARGIN. Run it with ``python -m benchmarks.generate output_file``.
+"""
+from argparse import ArgumentParser
+from itertools import accumulate
+import json
+from random import Random
+from typing import IO, List, NamedTuple
+
+from log_parser.constants import TIMESTAMP_MARGIN
+
+CHUNK_LINES = 100000
+SIZE_SUFFIXES = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+class LogInfo(NamedTuple):
+    """Description of a generated log."""
+    lines: int
+    size: int
+    first_timestamp: int
+    last_timestamp: int
+
+
+def parse_size(size: str) -> int:
+    """Parses a number of bytes with an optional K, M or G suffix, e.g. 2G."""
+    multiplier = SIZE_SUFFIXES.get(size[-1:].upper(), 1)
+    return int(float(size[:-1] if multiplier > 1 else size) * multiplier)
+
+
+def hostname(rank: int) -> str:
+    """Returns the hostname of the host with the given rank, being host0 the most frequent."""
+    return f"host{rank}"
+
+
+def zipf_cum_weights(hosts: int, skew: float) -> List[float]:
+    """Returns the cumulative weights of a Zipf distribution of the given skew over hosts ranks."""
+    return list(accumulate(1 / (rank + 1) ** skew for rank in range(hosts)))
+
+
+def write_log(f: IO[str], size: int, hosts: int = 10000, skew: float = 1.1, jitter: int = TIMESTAMP_MARGIN,
+              init_timestamp: int = 1565647204351, interval: float = 1.0, seed: int = 0) -> LogInfo:
+    """Writes lines to f until it has at least size bytes.
+
+    Args:
+        f: The file to write.
+        size: The minimum number of bytes to write.
+        hosts: The number of distinct hostnames. { default: 10000}
+        skew: The skew of the Zipf distribution of the hostnames. { default: 1.1}
+        jitter: The maximum delay of the timestamp of a line, it can't be greater than TIMESTAMP_MARGIN.
+            { default: TIMESTAMP_MARGIN}
+        init_timestamp: The timestamp of the first line, before its jitter. { default: 1565647204351}
+        interval: The average milliseconds between two lines. { default: 1.0}
+        seed: The seed of the random generator, the same arguments always write the same log. { default: 0}
+    """
+    if not 0 <= jitter <= TIMESTAMP_MARGIN:
+        raise ValueError(f"jitter must be between 0 and TIMESTAMP_MARGIN ({TIMESTAMP_MARGIN})")
+    rng = Random(seed)
+    cum_weights = zipf_cum_weights(hosts, skew)
+    names = [hostname(rank) for rank in range(hosts)]
+    written = lines = 0
+    first_timestamp = last_timestamp = init_timestamp
+    while written < size:
+        origins = rng.choices(names, cum_weights=cum_weights, k=CHUNK_LINES)
+        ends = rng.choices(names, cum_weights=cum_weights, k=CHUNK_LINES)
+        timestamps = [
+            init_timestamp + int((lines + i) * interval) - int(rng.random() * (jitter + 1)) for i in range(CHUNK_LINES)]
+        chunk = "".join(f"{timestamp} {origin} {end}\n" for timestamp, origin, end in zip(timestamps, origins, ends))
+        if written + len(chunk) > size:
+            chunk = chunk[:chunk.index("\n", size - written - 1) + 1]
+        if not lines:
+            first_timestamp = timestamps[0]
+        f.write(chunk)
+        written += len(chunk)
+        lines += chunk.count("\n")
+        last_timestamp = int(chunk[chunk.rfind("\n", 0, -1) + 1:].split(" ", 1)[0])
+    return LogInfo(lines, written, first_timestamp, last_timestamp)
+
+
+def generate_log(output_file: str, size: int, **kwargs: float) -> LogInfo:
+    """Writes a synthetic log of at least size bytes in output_file, see write_log for the other arguments."""
+    with open(output_file, 'w', newline="\n") as f:
+        return write_log(f, size, **kwargs)  # type: ignore
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("output_file", type=str, help="File to write")
+    parser.add_argument("--size", type=str, default="100M", help="Size of the log, e.g. 500M or 2G")
+    parser.add_argument("--hosts", type=int, default=10000, help="Number of distinct hosts")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf skew of the hosts")
+    parser.add_argument("--jitter", type=int, default=TIMESTAMP_MARGIN, help="Maximum delay of a line (ms)")
+    parser.add_argument("--interval", type=float, default=1.0, help="Average time between two lines (ms)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    args = parser.parse_args()
+    info = generate_log(args.output_file, parse_size(args.size), hosts=args.hosts, skew=args.skew,
+                        jitter=args.jitter, interval=args.interval, seed=args.seed)
+    print(json.dumps(info._asdict()))
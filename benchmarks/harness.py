@@ -0,0 +1,282 @@
+"""Benchmark harness.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Measures the wall time, the throughput in lines per second and the peak RSS of the ``connected`` and
+``unlimited`` commands over a log, for every engine in single thread and multiprocess with several worker
+counts and batch sizes. Each case runs in a fresh process whose memory is sampled from ``/proc`` while it
+runs: its peak RSS is the greatest sum of the RSS of the process and its workers, and at least the high
+water mark of the process. The rusage of a process can't be used, it's inherited from the parent that
+spawns it. The worker counts greater than the CPUs available are skipped, they would only measure the
+contention. The results are output as JSON and they can be checked against a baseline. The throughput
+is compared as the speedup of each case over its reference in the same run, which doesn't depend on the
+speed of the host: the single thread cases over the lines engine, and the multiprocess cases over the
+single thread of their engine. Every case must be both measured and in the baseline, so the baseline must
+be recorded with the same options on a host with as many CPUs as workers:
+``python -m benchmarks.harness --size 20M -w 2 4 -b 200000 --baseline benchmarks/baseline.json``.
+"""
+from argparse import ArgumentParser
+import json
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import resource
+import sys
+import tempfile
+from threading import Event, Thread
+from time import perf_counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from benchmarks.generate import generate_log, hostname, parse_size
+from log_parser.connected_hostnames import (
+    _get_connected_hostnames_multithread, _get_connected_hostnames_single_thread, ENGINES)
+from log_parser.unlimited_parser import unlimited
+
+CASE_KEYS = ('command', 'engine', 'workers', 'batch_size')
+REFERENCE_CASE = ('connected', 'lines', 0, 0)
+DEFAULT_TOLERANCE = 0.2
+RSS_INTERVAL = 0.01
+
+
+def _status_bytes(pid: str, field: str) -> int:
+    """Returns a memory field (like VmRSS) of /proc/<pid>/status in bytes, 0 if the process is gone."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def _children() -> List[str]:
+    """Returns the pids of the children of this process, like its pool workers."""
+    pids: List[str] = []
+    for task in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{task}/children") as f:
+                pids.extend(f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+class RssSampler():
+    """Samples the RSS of this process plus its children in a thread, keeping the greatest sum."""
+    def __init__(self, interval: float = RSS_INTERVAL) -> None:
+        """Creates a sampler, it's started with start and stopped with stop."""
+        self.interval = interval
+        self.peak = 0
+        self.stopped = Event()
+        self.thread = Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        """Samples until it's stopped."""
+        while True:
+            rss = _status_bytes("self", "VmRSS") + sum(_status_bytes(pid, "VmRSS") for pid in _children())
+            self.peak = max(self.peak, rss)
+            if self.stopped.wait(self.interval):
+                return
+
+    def start(self) -> None:
+        """Starts sampling."""
+        self.thread.start()
+
+    def stop(self) -> int:
+        """Stops sampling and returns the peak RSS in bytes, at least the high water mark of this process."""
+        self.stopped.set()
+        self.thread.join()
+        return max(self.peak, _status_bytes("self", "VmHWM"))
+
+
+def _peak_rss() -> int:
+    """Returns the peak RSS in bytes of this process and of its finished children, where there is no /proc.
+
+    It includes the RSS of the parent when this process was spawned.
+    """
+    peak = max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _log_span(log_file: str) -> Dict[str, int]:
+    """Returns the number of lines and the first and last timestamps of log_file."""
+    lines = 0
+    with open(log_file, 'rb') as f:
+        first_timestamp = int(f.readline().split(b" ", 1)[0])
+        f.seek(0)
+        while True:
+            data = f.read(1024 * 1024)
+            if not data:
+                break
+            lines += data.count(b"\n")
+        f.seek(max(f.tell() - 4096, 0))
+        last_timestamp = int(f.read().splitlines()[-1].split(b" ", 1)[0])
+    return {'lines': lines, 'first_timestamp': first_timestamp, 'last_timestamp': last_timestamp}
+
+
+def _run_case(log_file: str, span: Dict[str, int], case: Dict[str, Any], conn: Connection) -> None:
+    """Runs a case in this process and sends back its seconds and peak RSS."""
+    logging.disable(logging.CRITICAL)
+    init_timestamp, end_timestamp = span['first_timestamp'], span['last_timestamp']
+    sampler = RssSampler() if os.path.exists("/proc/self/status") else None
+    if sampler is not None:
+        sampler.start()
+    start = perf_counter()
+    if case['command'] == 'unlimited':
+        unlimited(log_file, hostname(0), hostname(1), init_timestamp=init_timestamp, follow=False)
+    elif case['workers']:
+        _get_connected_hostnames_multithread(
+            log_file, init_timestamp, end_timestamp, hostname(0), workers=case['workers'],
+            batch_size=case['batch_size'], engine=case['engine'])
+    else:
+        _get_connected_hostnames_single_thread(log_file, init_timestamp, end_timestamp, hostname(0),
+                                               engine=case['engine'])
+    seconds = perf_counter() - start
+    conn.send({'seconds': seconds, 'peak_rss': sampler.stop() if sampler is not None else _peak_rss()})
+    conn.close()
+
+
+def measure(log_file: str, span: Dict[str, int], case: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs case over log_file in a new process and returns it with its measures."""
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_run_case, args=(log_file, span, case, child_conn))
+    process.start()
+    measures = parent_conn.recv()
+    process.join()
+    return {**case, **measures, 'lines_per_second': span['lines'] / measures['seconds']}
+
+
+def cases(engines: Sequence[str], workers: Sequence[int], batch_sizes: Sequence[int]) -> Iterator[Dict[str, Any]]:
+    """Yields the cases to measure, a worker count of 0 means single thread."""
+    for engine in engines:
+        yield {'command': 'connected', 'engine': engine, 'workers': 0, 'batch_size': 0}
+        for worker_count in workers:
+            for batch_size in batch_sizes:
+                yield {'command': 'connected', 'engine': engine, 'workers': worker_count, 'batch_size': batch_size}
+    yield {'command': 'unlimited', 'engine': 'lines', 'workers': 0, 'batch_size': 0}
+
+
+def _cpus() -> int:
+    """Returns the number of CPUs this process can run on."""
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+def run(log_file: str, engines: Sequence[str] = ENGINES, workers: Sequence[int] = (2, 4, 8),
+        batch_sizes: Sequence[int] = (50000, 200000)) -> Dict[str, Any]:
+    """Measures every case over log_file, skipping the worker counts greater than the CPUs available.
+
+    Args:
+        log_file: The log to read.
+        engines: The engines of the connected command. { default: ENGINES}
+        workers: The worker counts of the multiprocess cases. { default: (2, 4, 8)}
+        batch_sizes: The batch sizes of the multiprocess cases. { default: (50000, 200000)}
+    """
+    span = _log_span(log_file)
+    cpus = _cpus()
+    skipped = [worker_count for worker_count in workers if worker_count > cpus]
+    if skipped:
+        print(f"Skipping {skipped} workers, there are only {cpus} CPUs", file=sys.stderr)
+    workers = [worker_count for worker_count in workers if worker_count <= cpus]
+    return {
+        'log': {'size': os.path.getsize(log_file), **span},
+        'cpus': cpus,
+        'results': [measure(log_file, span, case) for case in cases(engines, workers, batch_sizes)],
+    }
+
+
+def _case_key(result: Dict[str, Any]) -> tuple:
+    """Returns the values that identify the case of a result."""
+    return tuple(result[key] for key in CASE_KEYS)
+
+
+def _case_name(case_key: tuple) -> str:
+    """Returns the description of a case."""
+    return ", ".join(f"{key}={value}" for key, value in zip(CASE_KEYS, case_key))
+
+
+def _speedups(results: List[Dict[str, Any]]) -> Dict[tuple, float]:
+    """Returns the throughput of each case relative to its reference case of the same results.
+
+    The reference of the multiprocess cases is the single thread case of their engine, and the reference of
+    the single thread cases is REFERENCE_CASE, which has no speedup.
+    """
+    lines_per_second = {_case_key(result): result['lines_per_second'] for result in results}
+    case_speedups = {}
+    for case_key, case_lines_per_second in lines_per_second.items():
+        command, engine, workers, _ = case_key
+        reference = (command, engine, 0, 0) if workers else REFERENCE_CASE
+        if case_key != reference and reference in lines_per_second:
+            case_speedups[case_key] = case_lines_per_second / lines_per_second[reference]
+    return case_speedups
+
+
+def find_regressions(report: Dict[str, Any], baseline: Dict[str, Any],
+                     tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Compares report with baseline and describes the cases that got slower or bigger than the tolerance.
+
+    The throughput is compared as the speedups over the reference cases, so the baseline can be recorded
+    on another host. The cases measured but not in the baseline, and the other way round, are regressions.
+
+    Args:
+        report: The output of run.
+        baseline: A previous output of run.
+        tolerance: The allowed relative loss of speedup or increase of peak RSS. { default: DEFAULT_TOLERANCE}
+    """
+    baseline_results = {_case_key(result): result for result in baseline['results']}
+    report_speedups, baseline_speedups = _speedups(report['results']), _speedups(baseline['results'])
+    measured = {_case_key(result) for result in report['results']}
+    regressions = [f"{_case_name(case_key)}: not measured" for case_key in baseline_results if case_key not in measured]
+    for result in report['results']:
+        case_key = _case_key(result)
+        name = _case_name(case_key)
+        expected = baseline_results.get(case_key)
+        if expected is None:
+            regressions.append(f"{name}: not in the baseline")
+            continue
+        if case_key in report_speedups and case_key in baseline_speedups and (
+                report_speedups[case_key] < baseline_speedups[case_key] * (1 - tolerance)):
+            regressions.append(
+                f"{name}: {report_speedups[case_key]:.2f}x its reference, baseline {baseline_speedups[case_key]:.2f}x")
+        if result['peak_rss'] > expected['peak_rss'] * (1 + tolerance):
+            regressions.append(f"{name}: peak RSS {result['peak_rss']} bytes, baseline {expected['peak_rss']}")
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Runs the benchmarks from the command line, returns 1 if there are regressions."""
+    parser = ArgumentParser()
+    parser.add_argument("--log", type=str, help="Log to read, by default a synthetic one is generated")
+    parser.add_argument("--size", type=str, default="100M", help="Size of the generated log, e.g. 500M or 2G")
+    parser.add_argument("--hosts", type=int, default=10000, help="Number of distinct hosts of the generated log")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf skew of the generated log")
+    parser.add_argument("-e", "--engines", nargs="+", choices=ENGINES, default=list(ENGINES), help="Engines")
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[2, 4, 8], help="Worker counts")
+    parser.add_argument("-b", "--batch-sizes", type=int, nargs="+", default=[50000, 200000], help="Batch sizes")
+    parser.add_argument("-o", "--output", type=str, help="File to write the results, e.g. a new baseline")
+    parser.add_argument("--baseline", type=str, help="Results to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file = args.log
+        if log_file is None:
+            log_file = os.path.join(tmp_dir, "log.txt")
+            generate_log(log_file, parse_size(args.size), hosts=args.hosts, skew=args.skew)
+        report = run(log_file, engines=args.engines, workers=args.workers, batch_sizes=args.batch_sizes)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
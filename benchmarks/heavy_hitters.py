@@ -0,0 +1,81 @@
+"""Heavy hitters benchmark.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Compares the accuracy, memory and time of the approximate top-k mode of the sliding window (SpaceSaving
+summaries per bucket) against its exact mode on a synthetic stream of connections between hostnames with a
+Zipf distribution, spread over a period. The memory is the peak allocated while the window aggregates the
+stream and reports it, hostname dictionary included. Run it with ``python -m benchmarks.heavy_hitters``
+and it outputs the results as JSON.
+"""
+from argparse import ArgumentParser
+import json
+from random import Random
+from time import perf_counter
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+from log_parser.constants import HOUR_TIMESTAMP
+from log_parser.window import SlidingWindow
+
+
+def zipf_stream(length: int, hosts: int, skew: float, seed: int = 0) -> List[str]:
+    """Returns a stream of length hostnames chosen from hosts with a Zipf distribution of the given skew."""
+    weights = [1 / (rank + 1) ** skew for rank in range(hosts)]
+    return [f"host-{rank}" for rank in Random(seed).choices(range(hosts), weights=weights, k=length)]
+
+
+def _measure(count: Callable[[], Tuple[Dict, int]]) -> Tuple[Dict, int, float, int]:
+    """Runs count and returns its result, the seconds it took and its peak of allocated memory."""
+    tracemalloc.start()
+    start = perf_counter()
+    state, hostnames = count()
+    elapsed = perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return state, hostnames, elapsed, peak
+
+
+def aggregate(stream: List[str], k: int = 0, capacity: int = 0) -> Tuple[Dict, int]:
+    """Adds the stream to a sliding window as connections spread over an hour and returns the state of the hour.
+
+    The pairs of consecutive hostnames of the stream are the origin and the end of each connection. With
+    k the window counts them approximately with capacity counters per bucket. Returns the state and the
+    size of the hostname dictionary.
+    """
+    sliding_window = SlidingWindow(stream[0], stream[1], 0, top_k=k, capacity=capacity)
+    pairs = len(stream) // 2
+    for position, origin, end in zip(range(pairs), stream[::2], stream[1::2]):
+        sliding_window.add(position * HOUR_TIMESTAMP // pairs, origin, end)
+    return next(sliding_window.advance(2 * HOUR_TIMESTAMP))[1], len(sliding_window.hostnames)
+
+
+def compare(stream: List[str], k: int, capacity: int) -> Dict:
+    """Counts stream exactly and approximately in a sliding window and compares the top k of both."""
+    exact_state, exact_hostnames, exact_seconds, exact_memory = _measure(lambda: aggregate(stream))
+    approximate_state, approximate_hostnames, approximate_seconds, approximate_memory = _measure(
+        lambda: aggregate(stream, k, capacity))
+    exact_counts = exact_state['counter_connections']
+    exact = {hostname for hostname, _ in exact_counts.most_common(k)}
+    approximate = [(hostname, count) for hostname, count, _ in approximate_state['top_connections']]
+    return {
+        'k': k,
+        'capacity': capacity,
+        'recall': len(exact & {hostname for hostname, _ in approximate}) / k,
+        'max_relative_error': max(
+            (count - exact_counts[hostname]) / exact_counts[hostname] for hostname, count in approximate),
+        'exact': {'seconds': exact_seconds, 'peak_memory': exact_memory, 'hostnames': exact_hostnames},
+        'approximate': {
+            'seconds': approximate_seconds, 'peak_memory': approximate_memory, 'hostnames': approximate_hostnames},
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("-n", "--lines", type=int, default=10**6, help="Number of connections")
+    parser.add_argument("--hosts", type=int, default=100000, help="Number of distinct hosts")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf skew")
+    parser.add_argument("-k", "--top-k", type=int, default=10, help="Number of top hosts")
+    parser.add_argument("-c", "--capacities", type=int, nargs="+", default=[100, 1000, 10000], help="Capacities")
+    args = parser.parse_args()
+    stream = zipf_stream(args.lines, args.hosts, args.skew)
+    print(json.dumps([compare(stream, args.top_k, capacity) for capacity in args.capacities], indent=2))
@@ -0,0 +1,127 @@
+"""Startup benchmark.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Measures how long ``main.py`` takes to start each command over a tiny log, so the time is spent importing
+and not reading. Each command runs several times with ``python -X importtime`` and the fastest run is kept:
+its wall time, its total import time (the cumulative time of the top level imports) and the ``log_parser``
+modules it imported. The results are output as JSON and they can be checked against a baseline:
+``python -m benchmarks.startup --baseline benchmarks/startup_baseline.json``.
+"""
+from argparse import ArgumentParser
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Sequence
+
+from benchmarks.generate import generate_log, hostname
+
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.5
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def commands(log_file: str, first_timestamp: int) -> Dict[str, List[str]]:
+    """Returns the arguments of main.py of each command to measure."""
+    end_timestamp = first_timestamp + 60 * 60 * 1000
+    return {
+        'help': ["--help"],
+        'connected': [log_file, "connected", str(first_timestamp), str(end_timestamp), hostname(0)],
+        'unlimited': [log_file, "unlimited", hostname(0), hostname(1), "-i", str(first_timestamp), "--no-follow"],
+        'index': [log_file, "index"],
+    }
+
+
+def parse_importtime(output: str) -> Dict[str, Any]:
+    """Returns the total import time in microseconds and the log_parser modules of a -X importtime output."""
+    import_us = 0
+    modules = set()
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            import_us += int(cumulative)
+        if name.strip().startswith("log_parser"):
+            modules.add(name.strip())
+    return {'import_us': import_us, 'modules': sorted(modules)}
+
+
+def measure(name: str, args: Sequence[str], logs_dir: str, repeat: int = DEFAULT_REPEAT) -> Dict[str, Any]:
+    """Runs main.py with args repeat times and returns the measures of the fastest run."""
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", MAIN, *args], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            universal_newlines=True, env={**os.environ, 'LOGS_DIR': logs_dir}, check=True)
+        runs.append({'seconds': perf_counter() - start, **parse_importtime(process.stderr)})
+    return {'command': name, **min(runs, key=lambda run: run['import_us'])}
+
+
+def run(repeat: int = DEFAULT_REPEAT) -> Dict[str, Any]:
+    """Measures the startup of every command over a tiny generated log.
+
+    Args:
+        repeat: Number of runs of each command. { default: DEFAULT_REPEAT}
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file = os.path.join(tmp_dir, "log.txt")
+        info = generate_log(log_file, 16 * 1024, hosts=100)
+        return {'results': [
+            measure(name, args, os.path.join(tmp_dir, "logs"), repeat)
+            for name, args in commands(log_file, info.first_timestamp).items()
+        ]}
+
+
+def find_regressions(report: Dict[str, Any], baseline: Dict[str, Any],
+                     tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Compares report with baseline and describes the commands that import more modules or import slower.
+
+    Args:
+        report: The output of run.
+        baseline: A previous output of run.
+        tolerance: The allowed relative increase of the import time. { default: DEFAULT_TOLERANCE}
+    """
+    baseline_results = {result['command']: result for result in baseline['results']}
+    regressions = []
+    for result in report['results']:
+        expected = baseline_results.get(result['command'])
+        if expected is None:
+            continue
+        if result['import_us'] > expected['import_us'] * (1 + tolerance):
+            regressions.append(
+                f"{result['command']}: imports in {result['import_us']} us, baseline {expected['import_us']}")
+        new_modules = sorted(set(result['modules']) - set(expected['modules']))
+        if new_modules:
+            regressions.append(f"{result['command']}: imports {', '.join(new_modules)}")
+    return regressions
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    """Runs the benchmark from the command line, returns 1 if there are regressions."""
+    parser = ArgumentParser()
+    parser.add_argument("-r", "--repeat", type=int, default=DEFAULT_REPEAT, help="Runs of each command")
+    parser.add_argument("-o", "--output", type=str, help="File to write the results, e.g. a new baseline")
+    parser.add_argument("--baseline", type=str, help="Results to compare with")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+    report = run(args.repeat)
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Batch query.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+"""
+from collections import defaultdict
+from typing import DefaultDict, Iterable, List, NamedTuple
+
+from log_parser.columnar import ColumnarLog, is_columnar
+from log_parser.compression import compression_of, open_log
+from log_parser.constants import TIMESTAMP_MARGIN
+from log_parser.files import select_files
+from log_parser.logger import logger
+from log_parser.seek import find_offset
+
+
+class Query(NamedTuple):
+    """A query for the hostnames connected to hostname during [init_timestamp, end_timestamp)."""
+    hostname: str
+    init_timestamp: int
+    end_timestamp: int
+
+
+def read_queries(queries_file: str) -> List[Query]:
+    """Reads the queries of queries_file.
+
+    Each line of the file is a query with the format ``hostname init_timestamp end_timestamp``.
+    Empty lines and lines starting with ``#`` are ignored.
+
+    Args:
+        queries_file: The file to read.
+    """
+    queries = []
+    with open(queries_file) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            hostname, init_timestamp, end_timestamp = line.split()
+            queries.append(Query(hostname, int(init_timestamp), int(end_timestamp)))
+    return queries
+
+
+def process_queries(lines: Iterable[str], queries: List[Query]) -> List[set]:
+    """Process the lines and returns, for each query, the set of hostnames that have been connected.
+
+    The lines are dispatched to the queries through a lookup on their destination host, so the lines are
+    read only once whatever the number of queries is.
+
+    Args:
+        lines: The lines to process.
+        queries: The queries to answer.
+    """
+    results: List[set] = [set() for _ in queries]
+    if not queries:
+        return results
+    queries_by_host: DefaultDict[str, List[int]] = defaultdict(list)
+    for position, query in enumerate(queries):
+        queries_by_host[query.hostname].append(position)
+    last_timestamp = max(query.end_timestamp for query in queries) + TIMESTAMP_MARGIN
+    for line in lines:
+        timestamp_str, origin, end = line.split()
+        timestamp = int(timestamp_str)
+        if timestamp > last_timestamp:
+            break
+        for position in queries_by_host.get(end, ()):
+            query = queries[position]
+            if query.init_timestamp <= timestamp < query.end_timestamp:
+                results[position].add(origin)
+    return results
+
+
+def get_batch_connected_hostnames(input_file: str, queries_file: str, use_seek: bool = False) -> None:
+    """Reads input_file once and reports the hostnames connected for each query of queries_file.
+
+    Args:
+        input_file: The file to read, or a directory or a glob of files to read one after the other skipping
+            the ones without lines in the periods of the queries.
+        queries_file: The file with the queries, see read_queries.
+        use_seek: If it's True the file is bisected to start reading just before the first period, the
+            compressed files are read from their beginning. { default: False}
+    """
+    queries = read_queries(queries_file)
+    results: List[set] = [set() for _ in queries]
+    if queries:
+        init_timestamp = min(query.init_timestamp for query in queries)
+        end_timestamp = max(query.end_timestamp for query in queries)
+        for span in select_files(input_file, init_timestamp, end_timestamp):
+            if is_columnar(span.path):
+                columnar_log = ColumnarLog(span.path)
+                file_results = [
+                    columnar_log.connected_hostnames(query.init_timestamp, query.end_timestamp, query.hostname)
+                    for query in queries
+                ]
+            else:
+                with open_log(span.path) as f:
+                    if use_seek and compression_of(span.path) is None:
+                        f.seek(find_offset(span.path, init_timestamp))
+                    file_results = process_queries(f, queries)
+            for result, file_result in zip(results, file_results):
+                result |= file_result
+    logger.log_query_results(queries, results)
@@ -0,0 +1,176 @@
+"""Result cache.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Caches the hostnames connected to a hostname during each whole hour of a log file, so the queries over
+periods that overlap reuse the hours already read and only scan the missing ones. The results are kept
+in memory with LRU eviction and can be saved to a binary file with a fixed header, the hostname
+dictionary, the fingerprint of each file and the packed hostname ids of each entry, oldest first.
+
+A file is identified by its device and inode, and its fingerprint (size, modification time and crc32 of
+its head and tail) tells whether it's unchanged, has only grown by appending or has been rewritten. When
+it has grown, the lines appended can only be in the hours that end after its last line minus
+TIMESTAMP_MARGIN, so only those trailing hours are invalidated. Otherwise all its entries are dropped.
+"""
+from array import array
+from collections import OrderedDict
+import os
+from struct import error as struct_error, Struct
+from typing import Dict, FrozenSet, IO, Iterable, List, NamedTuple, Optional, Tuple
+from zlib import crc32
+
+from log_parser.config import CACHE_SIZE
+from log_parser.constants import HOUR_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.files import file_span
+from log_parser.hostnames import HostnameDictionary
+
+CACHE_MAGIC = b"LPRC"
+CACHE_VERSION = 1
+HEAD_BYTES = 4096
+TAIL_BYTES = 4096
+_HEADER = Struct("<4sHIIQ")
+_FILE = Struct("<QQQqIIq")
+_ENTRY = Struct("<QQIqI")
+
+FileKey = Tuple[int, int]
+EntryKey = Tuple[int, int, str, int]
+
+
+class Fingerprint(NamedTuple):
+    """The identity of a file when its entries were cached, last_timestamp is None if it's unknown."""
+    size: int
+    mtime: int
+    head_crc: int
+    tail_crc: int
+    last_timestamp: Optional[int]
+
+
+def _crc(f: IO[bytes], start: int, end: int) -> int:
+    """Returns the crc32 of the bytes of f in [start, end)."""
+    f.seek(start)
+    return crc32(f.read(end - start))
+
+
+def hours_of(int_timestamp: int, end_timestamp: int) -> List[Tuple[int, int, bool]]:
+    """Splits [int_timestamp, end_timestamp) in pieces at the hour boundaries.
+
+    Returns the (start, end, whole) of each piece, whole is True if the piece is an entire hour.
+    """
+    pieces = []
+    start = int_timestamp
+    while start < end_timestamp:
+        end = min(start - start % HOUR_TIMESTAMP + HOUR_TIMESTAMP, end_timestamp)
+        pieces.append((start, end, end - start == HOUR_TIMESTAMP))
+        start = end
+    return pieces
+
+
+class ResultCache():
+    """LRU cache of the hostnames connected to a hostname during an hour of a file."""
+    def __init__(self, size: int = CACHE_SIZE) -> None:
+        """Creates an empty cache.
+
+        Args:
+            size: Maximum number of entries, the least recently used ones are evicted. { default: CACHE_SIZE}
+        """
+        self.size = size
+        self.fingerprints: Dict[FileKey, Fingerprint] = {}
+        self.entries: 'OrderedDict[EntryKey, FrozenSet[str]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        """Returns the number of entries."""
+        return len(self.entries)
+
+    def _drop(self, file_key: FileKey, from_hour: Optional[int] = None) -> None:
+        """Drops the entries of a file, or only the ones of the hours that end after from_hour."""
+        for key in [key for key in self.entries if key[:2] == file_key]:
+            if from_hour is None or key[3] + HOUR_TIMESTAMP > from_hour:
+                del self.entries[key]
+
+    def validate(self, input_file: str) -> FileKey:
+        """Invalidates the entries of input_file that may have changed, returns the key of the file."""
+        stat = os.stat(input_file)
+        file_key = (stat.st_dev, stat.st_ino)
+        cached = self.fingerprints.get(file_key)
+        with open(input_file, 'rb') as f:
+            head_crc = _crc(f, 0, min(HEAD_BYTES, stat.st_size))
+            tail_crc = _crc(f, max(stat.st_size - TAIL_BYTES, 0), stat.st_size)
+            if cached is not None and (cached.size, cached.mtime, cached.head_crc, cached.tail_crc) == (
+                    stat.st_size, stat.st_mtime_ns, head_crc, tail_crc):
+                return file_key
+            appended = (
+                cached is not None and cached.size < stat.st_size
+                and cached.head_crc == _crc(f, 0, min(HEAD_BYTES, cached.size))
+                and cached.tail_crc == _crc(f, max(cached.size - TAIL_BYTES, 0), cached.size))
+        if cached is not None:
+            self._drop(file_key, (cached.last_timestamp - TIMESTAMP_MARGIN) if appended
+                       and cached.last_timestamp is not None else None)
+        span = file_span(input_file)
+        self.fingerprints[file_key] = Fingerprint(
+            stat.st_size, stat.st_mtime_ns, head_crc, tail_crc, span.last_timestamp if span else None)
+        return file_key
+
+    def get(self, file_key: FileKey, hostname: str, hour: int) -> Optional[FrozenSet[str]]:
+        """Returns the hostnames cached for hostname during the hour beginning at hour, or None."""
+        key = (*file_key, hostname, hour)
+        hostnames = self.entries.get(key)
+        if hostnames is not None:
+            self.entries.move_to_end(key)
+        return hostnames
+
+    def put(self, file_key: FileKey, hostname: str, hour: int, hostnames: Iterable[str]) -> None:
+        """Caches the hostnames connected to hostname during the hour beginning at hour."""
+        self.entries[(*file_key, hostname, hour)] = frozenset(hostnames)
+        self.entries.move_to_end((*file_key, hostname, hour))
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def save(self, cache_file: str) -> None:
+        """Writes the cache atomically, with the entries ordered from the least to the most recently used."""
+        hostnames = HostnameDictionary()
+        for (_, _, hostname, _), connected in self.entries.items():
+            hostnames.add(hostname)
+            for connected_hostname in connected:
+                hostnames.add(connected_hostname)
+        file_keys = {key[:2] for key in self.entries}
+        table = hostnames.to_bytes()
+        tmp_cache_file = f"{cache_file}.tmp"
+        with open(tmp_cache_file, 'wb') as f:
+            f.write(_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, len(file_keys), len(self.entries), len(table)))
+            f.write(table)
+            for file_key in file_keys:
+                fingerprint = self.fingerprints[file_key]
+                f.write(_FILE.pack(*file_key, *fingerprint[:4], (
+                    -1 if fingerprint.last_timestamp is None else fingerprint.last_timestamp)))
+            for (device, inode, hostname, hour), connected in self.entries.items():
+                f.write(_ENTRY.pack(device, inode, hostnames.add(hostname), hour, len(connected)))
+                array('I', map(hostnames.add, connected)).tofile(f)
+        os.replace(tmp_cache_file, cache_file)
+
+
+def load_cache(cache_file: str, size: int = CACHE_SIZE) -> ResultCache:
+    """Reads the cache, returns an empty one if it doesn't exist or it isn't valid.
+
+    Args:
+        cache_file: The file to read.
+        size: Maximum number of entries, the least recently used ones are evicted. { default: CACHE_SIZE}
+    """
+    cache = ResultCache(size)
+    try:
+        with open(cache_file, 'rb') as f:
+            magic, version, files_len, entries_len, table_len = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != CACHE_MAGIC or version != CACHE_VERSION:
+                return cache
+            hostnames = HostnameDictionary.from_bytes(f.read(table_len))
+            for _ in range(files_len):
+                device, inode, file_size, mtime, head_crc, tail_crc, last_timestamp = _FILE.unpack(f.read(_FILE.size))
+                cache.fingerprints[(device, inode)] = Fingerprint(
+                    file_size, mtime, head_crc, tail_crc, None if last_timestamp == -1 else last_timestamp)
+            for _ in range(entries_len):
+                device, inode, hostname_id, hour, connected_len = _ENTRY.unpack(f.read(_ENTRY.size))
+                connected_ids = array('I')
+                connected_ids.fromfile(f, connected_len)
+                cache.put((device, inode), hostnames.hostname(hostname_id), hour,
+                          hostnames.hostnames_of(connected_ids))
+    except (OSError, EOFError, UnicodeDecodeError, IndexError, struct_error):
+        return ResultCache(size)
+    return cache
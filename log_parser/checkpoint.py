@@ -0,0 +1,106 @@
+"""Checkpoint.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Saves and restores the state of the unlimited parser: the position in the log file and the buckets of
+its sliding window. The checkpoint is a binary file with a fixed header, the hostname dictionary
+and, for each bucket, packed arrays of hostname ids and counts.
+"""
+from array import array
+import os
+from struct import error as struct_error, Struct
+from typing import IO, List, NamedTuple, Optional
+
+from log_parser.hostnames import HostnameDictionary
+from log_parser.window import Bucket, SlidingWindow
+
+CHECKPOINT_MAGIC = b"LPCK"
+CHECKPOINT_VERSION = 1
+_HEADER = Struct("<4sHQQqqqqqqIIIIQ")
+_BUCKET = Struct("<qIII")
+
+
+class Checkpoint(NamedTuple):
+    """The state of the unlimited parser."""
+    position: int
+    inode: int
+    sliding_window: SlidingWindow
+
+
+def _read_array(f: IO[bytes], typecode: str, length: int) -> array:
+    """Reads an array of length items from f."""
+    items = array(typecode)
+    items.fromfile(f, length)
+    return items
+
+
+def save_checkpoint(checkpoint_file: str, position: int, inode: int, sliding_window: SlidingWindow) -> None:
+    """Writes the checkpoint atomically.
+
+    Args:
+        checkpoint_file: The file to write.
+        position: The offset of the log file up to which the lines are aggregated in sliding_window.
+        inode: The inode of the log file.
+        sliding_window: The sliding window to save, it can't be in approximate mode. Its dictionary is
+            compacted first, so only the hostnames of its buckets are written.
+    """
+    if sliding_window.top_k:
+        raise ValueError("The sliding windows in approximate mode can't be checkpointed")
+    sliding_window.compact()
+    buckets = sliding_window.live_buckets()
+    table = sliding_window.hostnames.to_bytes()
+    tmp_checkpoint_file = f"{checkpoint_file}.tmp"
+    with open(tmp_checkpoint_file, 'wb') as f:
+        f.write(_HEADER.pack(
+            CHECKPOINT_MAGIC, CHECKPOINT_VERSION, position, inode, sliding_window.init_timestamp,
+            sliding_window.window, sliding_window.slide, sliding_window.margin, sliding_window.bucket,
+            sliding_window.window_end, sliding_window.origin_host_id, sliding_window.end_host_id,
+            len(sliding_window.hostnames), len(buckets), len(table)
+        ))
+        f.write(table)
+        for bucket in buckets:
+            f.write(_BUCKET.pack(
+                bucket.index, len(bucket.connected_to), len(bucket.connected_from), len(bucket.counter_connections)))
+            array('I', bucket.connected_to).tofile(f)
+            array('I', bucket.connected_from).tofile(f)
+            array('I', bucket.counter_connections).tofile(f)
+            array('Q', bucket.counter_connections.values()).tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_checkpoint_file, checkpoint_file)
+
+
+def load_checkpoint(checkpoint_file: str) -> Optional[Checkpoint]:
+    """Reads the checkpoint, returns None if it doesn't exist or it isn't valid.
+
+    Args:
+        checkpoint_file: The file to read.
+    """
+    try:
+        with open(checkpoint_file, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return None
+            (magic, version, position, inode, init_timestamp, window, slide, margin, bucket_length, window_end,
+             origin_host_id, end_host_id, hostnames_len, buckets_len, table_len) = _HEADER.unpack(header)
+            if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+                return None
+            hostnames = HostnameDictionary.from_bytes(f.read(table_len))
+            if len(hostnames) != hostnames_len or max(origin_host_id, end_host_id) >= hostnames_len:
+                return None
+            buckets: List[Bucket] = []
+            for _ in range(buckets_len):
+                index, to_len, from_len, counter_len = _BUCKET.unpack(f.read(_BUCKET.size))
+                bucket = Bucket(index)
+                bucket.connected_to.update(_read_array(f, 'I', to_len))
+                bucket.connected_from.update(_read_array(f, 'I', from_len))
+                counter_ids = _read_array(f, 'I', counter_len)
+                bucket.counter_connections.update(dict(zip(counter_ids, _read_array(f, 'Q', counter_len))))
+                buckets.append(bucket)
+    except (OSError, EOFError, UnicodeDecodeError, struct_error):
+        return None
+    sliding_window = SlidingWindow(
+        hostnames.hostname(origin_host_id), hostnames.hostname(end_host_id), init_timestamp, window=window,
+        slide=slide, margin=margin, bucket=bucket_length, hostnames=hostnames
+    )
+    sliding_window.restore(window_end, buckets)
+    return Checkpoint(position, inode, sliding_window)
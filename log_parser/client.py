@@ -0,0 +1,57 @@
+"""Query client.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+A thin client of the query server (see server): it sends each query as a JSON line and reads a JSON line
+back. It imports nothing of the parser, so asking the server is much cheaper than reading the log.
+"""
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+SOCKET_SUFFIX = ".sock"
+RESPONSE_LIMIT = 1 << 28
+
+
+def socket_path(input_file: str) -> str:
+    """Returns the default path of the Unix socket of the server of input_file."""
+    return f"{input_file}{SOCKET_SUFFIX}"
+
+
+async def request(queries: List[Dict[str, Any]], path: Optional[str] = None, host: str = 'localhost',
+                  port: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Sends queries to the server through a single connection and returns its responses in the same order.
+
+    Args:
+        queries: The queries, see server.ResidentLog.answer.
+        path: The Unix socket of the server, used if port isn't given.
+        host: The host of the server, used with port. { default: 'localhost'}
+        port: The TCP port of the server. { default: None, the Unix socket is used}
+    """
+    if port is None:
+        reader, writer = await asyncio.open_unix_connection(path, limit=RESPONSE_LIMIT)
+    else:
+        reader, writer = await asyncio.open_connection(host, port, limit=RESPONSE_LIMIT)
+    try:
+        writer.write(b"".join(json.dumps(query).encode() + b"\n" for query in queries))
+        await writer.drain()
+        return [json.loads(await reader.readline()) for _ in queries]
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+def query_server(query: Dict[str, Any], input_file: str, path: Optional[str] = None, host: str = 'localhost',
+                 port: Optional[int] = None) -> Dict[str, Any]:
+    """Sends a query to the server of input_file and returns its response, raises ValueError if it failed.
+
+    Args:
+        query: The query, see server.ResidentLog.answer.
+        input_file: The log served.
+        path: The Unix socket of the server. { default: socket_path(input_file)}
+        host: The host of the server, used with port. { default: 'localhost'}
+        port: The TCP port of the server. { default: None, the Unix socket is used}
+    """
+    response = asyncio.run(request([query], path or socket_path(input_file), host, port))[0]
+    if 'error' in response:
+        raise ValueError(response['error'])
+    return response
@@ -0,0 +1,169 @@
+"""Columnar logs.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Converts text logs to a columnar binary file that is queried without parsing text. The file has a fixed
+header followed by three memory mappable arrays sorted by timestamp (the int64 timestamps and the uint32
+ids of the origin and end hostnames of each line) and the hostname dictionary. The queries need the
+optional ``numpy`` package: the period is found with a binary search and the hostnames are filtered and
+counted with vectorized operations.
+"""
+from array import array
+from collections import Counter
+import os
+from struct import Struct
+from typing import Any, Dict, Optional, Tuple
+
+from log_parser.compression import open_log
+from log_parser.constants import HOUR_TIMESTAMP
+from log_parser.hostnames import HostnameDictionary
+from log_parser.logger import logger
+from log_parser.stats import stats
+
+COLUMNAR_SUFFIX = ".lpc"
+COLUMNAR_MAGIC = b"LPCO"
+COLUMNAR_VERSION = 1
+_HEADER = Struct("<4sHQIQ")
+DATA_OFFSET = 64
+
+
+def _numpy() -> Any:
+    """Imports the numpy module on first use (it's slow to import), raises a ValueError if it isn't installed."""
+    try:
+        import numpy
+    except ImportError:  # pragma: no cover
+        raise ValueError("The numpy package is needed for columnar logs, install it with pip install numpy") from None
+    return numpy
+
+
+def is_columnar(input_file: str) -> bool:
+    """Checks if input_file is a columnar log."""
+    with open(input_file, 'rb') as f:
+        return f.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+
+
+def _read_header(input_file: str) -> Tuple[int, int, int]:
+    """Returns the number of lines, the number of hostnames and the length of the dictionary of a columnar log."""
+    with open(input_file, 'rb') as f:
+        magic, version, lines, hostnames, table_len = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+        raise ValueError(f"{input_file} isn't a columnar log")
+    return lines, hostnames, table_len
+
+
+def columnar_span(input_file: str) -> Optional[Tuple[int, int]]:
+    """Returns the first and last timestamps of a columnar log, or None if it's empty."""
+    lines, _, _ = _read_header(input_file)
+    if not lines:
+        return None
+    with open(input_file, 'rb') as f:
+        f.seek(DATA_OFFSET)
+        first_timestamp = array('q', f.read(8))[0]
+        f.seek(DATA_OFFSET + 8 * (lines - 1))
+        return first_timestamp, array('q', f.read(8))[0]
+
+
+def convert(input_file: str, output_file: str) -> int:
+    """Converts the text log input_file (it can be compressed) to a columnar log, returns its number of lines.
+
+    Args:
+        input_file: The text log to read.
+        output_file: The columnar log to write.
+    """
+    np = _numpy()
+    hostnames = HostnameDictionary()
+    timestamps, origins, ends = array('q'), array('I'), array('I')
+    with open_log(input_file) as f:
+        for line in f:
+            timestamp, origin, end = line.split()
+            timestamps.append(int(timestamp))
+            origins.append(hostnames.add(origin))
+            ends.append(hostnames.add(end))
+    order = np.argsort(np.frombuffer(timestamps, dtype=np.int64), kind='stable')
+    table = hostnames.to_bytes()
+    tmp_output_file = f"{output_file}.tmp"
+    with open(tmp_output_file, 'wb') as f:
+        f.write(_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, len(timestamps), len(hostnames), len(table)).ljust(
+            DATA_OFFSET, b"\0"))
+        for column, dtype in ((timestamps, np.int64), (origins, np.uint32), (ends, np.uint32)):
+            f.write(np.frombuffer(column, dtype=dtype)[order].tobytes())
+        f.write(table)
+    os.replace(tmp_output_file, output_file)
+    return len(timestamps)
+
+
+class ColumnarLog():
+    """A columnar log mapped in memory."""
+    def __init__(self, input_file: str) -> None:
+        """Maps the arrays of input_file and reads its hostname dictionary.
+
+        Args:
+            input_file: The columnar log to read.
+        """
+        np = _numpy()
+        lines, hostnames_len, table_len = _read_header(input_file)
+        self.timestamps = np.memmap(input_file, dtype=np.int64, mode='r', offset=DATA_OFFSET, shape=(lines,)) \
+            if lines else np.empty(0, dtype=np.int64)
+        origins_offset = DATA_OFFSET + 8 * lines
+        self.origins = np.memmap(input_file, dtype=np.uint32, mode='r', offset=origins_offset, shape=(lines,)) \
+            if lines else np.empty(0, dtype=np.uint32)
+        self.ends = np.memmap(input_file, dtype=np.uint32, mode='r', offset=origins_offset + 4 * lines,
+                              shape=(lines,)) if lines else np.empty(0, dtype=np.uint32)
+        with open(input_file, 'rb') as f:
+            f.seek(origins_offset + 8 * lines)
+            self.hostnames = HostnameDictionary.from_bytes(f.read(table_len))
+        if len(self.hostnames) != hostnames_len:
+            raise ValueError(f"{input_file} isn't a valid columnar log")
+
+    def _period(self, int_timestamp: int, end_timestamp: int) -> slice:
+        """Returns the slice of the lines in [int_timestamp, end_timestamp)."""
+        start, end = _numpy().searchsorted(self.timestamps, [int_timestamp, end_timestamp])
+        return slice(int(start), int(end))
+
+    def _connected(self, sources: Any, targets: Any, hostname: str, period: slice) -> set:
+        """Returns the hostnames of sources in the lines of period whose target is hostname."""
+        hostname_id = self.hostnames.get(hostname)
+        if hostname_id is None:
+            return set()
+        return self.hostnames.hostnames_of(
+            _numpy().unique(sources[period][targets[period] == hostname_id]).tolist())
+
+    def connected_hostnames(self, int_timestamp: int, end_timestamp: int, hostname: str) -> set:
+        """Returns the hostnames connected to hostname during [int_timestamp, end_timestamp)."""
+        period = self._period(int_timestamp, end_timestamp)
+        stats.count(lines=period.stop - period.start)
+        return self._connected(self.origins, self.ends, hostname, period)
+
+    def state(self, origin_host: str, end_host: str, int_timestamp: int, end_timestamp: int) -> Dict:
+        """Returns the aggregates of [int_timestamp, end_timestamp) like SlidingWindow.state."""
+        np = _numpy()
+        period = self._period(int_timestamp, end_timestamp)
+        counts = np.bincount(self.origins[period], minlength=len(self.hostnames)) + np.bincount(
+            self.ends[period], minlength=len(self.hostnames))
+        hostname_ids = np.flatnonzero(counts)
+        return {
+            'connected_to': self._connected(self.origins, self.ends, end_host, period),
+            'connected_from': self._connected(self.ends, self.origins, origin_host, period),
+            'counter_connections': Counter(dict(zip(
+                (self.hostnames.hostname(hostname_id) for hostname_id in hostname_ids.tolist()),
+                counts[hostname_ids].tolist()))),
+        }
+
+
+def report(input_file: str, origin_host: str, end_host: str, init_timestamp: int, end_timestamp: int,
+           window: int = HOUR_TIMESTAMP, slide: int = HOUR_TIMESTAMP) -> None:
+    """Logs the resume of each period of a columnar log, like unlimited does while reading a text log.
+
+    Args:
+        input_file: The columnar log to read.
+        origin_host: The hostname to report the list of hostnames connected from.
+        end_host: The hostname to report the list of hostnames connected to.
+        init_timestamp: The beginning of the first period.
+        end_timestamp: The periods that end after it aren't reported.
+        window: The length of each period. { default: HOUR_TIMESTAMP}
+        slide: The time between the beginnings of two periods. { default: HOUR_TIMESTAMP}
+    """
+    columnar_log = ColumnarLog(input_file)
+    for window_start in range(init_timestamp, end_timestamp - window + 1, slide):
+        logger.log_resume_last_hour(
+            window_start, origin_host, end_host,
+            columnar_log.state(origin_host, end_host, window_start, window_start + window), window=window)
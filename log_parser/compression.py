@@ -0,0 +1,229 @@
+"""Compressed logs.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Reads logs compressed with gzip, bz2 or zstd (the last one needs the optional ``zstandard`` package)
+as streams, without decompressing them to disk. The compression is detected by the magic bytes of the file
+or, if they don't match, by its extension.
+
+Files made of several gzip members, bz2 streams or zstd frames can be split in byte ranges that are
+decompressed independently. The zstd frames are found exactly walking their block headers, but the gzip
+and bz2 boundaries can only be guessed from their magic bytes, so the ranges are speculative: the members
+decompressed from a range are only valid if the range begins where the members of the previous one end.
+"""
+import bz2
+import gzip
+import io
+import os
+import re
+import struct
+from typing import Any, IO, Iterator, List, Optional, Tuple, Type
+import zlib
+
+from log_parser.config import READ_BUFFER_SIZE
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSED_CHUNK_SIZE = 256 * 1024
+MAGIC_BYTES = (('gzip', b"\x1f\x8b"), ('bz2', b"BZh"), ('zstd', b"\x28\xb5\x2f\xfd"))
+EXTENSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.bz2': 'bz2', '.zst': 'zstd', '.zstd': 'zstd'}
+MEMBER_PATTERNS = {'gzip': re.compile(b"\x1f\x8b\x08[\x00-\x1f]"), 'bz2': re.compile(b"BZh[1-9]1AY&SY")}
+
+ZSTD_MAGIC = 0xFD2FB528
+ZSTD_SKIPPABLE_MASK = 0xFFFFFFF0
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A50
+
+
+def compression_of(input_file: str) -> Optional[str]:
+    """Returns the compression of input_file ('gzip', 'bz2' or 'zstd') or None if it isn't compressed."""
+    with open(input_file, 'rb') as f:
+        head = f.read(4)
+    for compression, magic in MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+    return EXTENSIONS.get(os.path.splitext(input_file)[1].lower()) if head else None
+
+
+def _zstandard() -> Any:
+    """Returns the zstandard module, raises a ValueError if it isn't installed."""
+    if zstandard is None:
+        raise ValueError("The zstandard package is needed to read zstd files, install it with pip install zstandard")
+    return zstandard
+
+
+def open_binary(input_file: str, compression: Optional[str] = None) -> IO[bytes]:
+    """Opens input_file for reading its decompressed bytes with a large buffer.
+
+    Args:
+        input_file: The file to open.
+        compression: The compression of the file. { default: None, not compressed}
+    """
+    if compression is None:
+        return open(input_file, 'rb', buffering=READ_BUFFER_SIZE)
+    if compression == 'gzip':
+        raw: Any = gzip.GzipFile(input_file, 'rb')
+    elif compression == 'bz2':
+        raw = bz2.BZ2File(input_file, 'rb')
+    elif compression == 'zstd':
+        raw = _zstandard().ZstdDecompressor().stream_reader(
+            open(input_file, 'rb'), read_size=READ_BUFFER_SIZE, read_across_frames=True, closefd=True)
+    else:
+        raise ValueError(f"Unknown compression {compression}")
+    return io.BufferedReader(raw, buffer_size=READ_BUFFER_SIZE)
+
+
+def open_log(input_file: str) -> IO[str]:
+    """Opens input_file in text mode, decompressing it if it's compressed."""
+    compression = compression_of(input_file)
+    if compression is None:
+        return open(input_file, buffering=READ_BUFFER_SIZE)
+    return io.TextIOWrapper(open_binary(input_file, compression))
+
+
+def _zstd_frames(f: IO[bytes]) -> Iterator[int]:
+    """Yields the offsets of the zstd frames of f, skipping the skippable frames."""
+    offset = 0
+    while True:
+        f.seek(offset)
+        head = f.read(8)
+        if len(head) < 6:
+            return
+        magic, = struct.unpack_from("<I", head)
+        if magic & ZSTD_SKIPPABLE_MASK == ZSTD_SKIPPABLE_MAGIC:
+            if len(head) < 8:
+                return
+            offset += 8 + struct.unpack_from("<I", head, 4)[0]
+            continue
+        if magic != ZSTD_MAGIC:
+            raise ValueError(f"Invalid zstd frame at offset {offset}")
+        yield offset
+        descriptor = head[4]
+        single_segment = descriptor >> 5 & 1
+        offset += 5 + (not single_segment) + (0, 1, 2, 4)[descriptor & 3] + (single_segment, 2, 4, 8)[descriptor >> 6]
+        while True:
+            f.seek(offset)
+            block = f.read(3)
+            if len(block) < 3:
+                return
+            header = int.from_bytes(block, 'little')
+            offset += 3 + (1 if header >> 1 & 3 == 1 else header >> 3)
+            if header & 1:
+                break
+        offset += 4 * (descriptor >> 2 & 1)
+
+
+def _find_member(f: IO[bytes], compression: str, start: int, end: int) -> Optional[int]:
+    """Returns the offset of the first candidate gzip member or bz2 stream beginning in [start, end)."""
+    pattern = MEMBER_PATTERNS[compression]
+    overlap = 16
+    position = start
+    while position < end:
+        f.seek(position)
+        data = f.read(min(READ_BUFFER_SIZE, end - position) + overlap)
+        match = pattern.search(data, 0, min(len(data), end - position + overlap))
+        if match and position + match.start() < end:
+            return position + match.start()
+        if len(data) <= overlap:
+            return None
+        position += len(data) - overlap
+    return None
+
+
+def split_members(input_file: str, compression: str, parts: int) -> List[Tuple[int, int]]:
+    """Splits input_file in about parts byte ranges beginning at a member, stream or frame.
+
+    For gzip and bz2 the beginnings are only candidates, see MemberReader.
+
+    Args:
+        input_file: The compressed file to split.
+        compression: Its compression.
+        parts: The wanted number of ranges.
+    """
+    size = os.path.getsize(input_file)
+    part_size = max(-(-size // max(parts, 1)), 1)
+    starts = [0]
+    with open(input_file, 'rb') as f:
+        if compression == 'zstd':
+            for frame in _zstd_frames(f):
+                if frame >= starts[-1] + part_size:
+                    starts.append(frame)
+        else:
+            for part in range(1, parts):
+                member = _find_member(f, compression, max(part * part_size, starts[-1] + 1), (part + 1) * part_size)
+                if member is not None:
+                    starts.append(member)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _decompressor(compression: str) -> Any:
+    """Returns a new decompressor of a single gzip member, bz2 stream or zstd frame."""
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    return _zstandard().ZstdDecompressor().decompressobj()
+
+
+class MemberReader():
+    """Decompresses the members (or streams, or frames) of a file that begin in a byte range."""
+    def __init__(self, input_file: str, compression: str, start: int, end: int) -> None:
+        """Creates a reader of the members of input_file that begin in [start, end).
+
+        Args:
+            input_file: The compressed file to read.
+            compression: Its compression.
+            start: The offset of the first member, if it isn't the beginning of a member the decompression
+                fails and the data read, if any, isn't valid.
+            end: The end of the range, the last member read is the one that ends at or after it.
+        """
+        self.input_file = input_file
+        self.compression = compression
+        self.start = start
+        self.end = end
+        self.position = start
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Yields the decompressed data in chunks.
+
+        After the iteration, position is the offset just after the last member decompressed completely,
+        so it's start if start wasn't the beginning of a member.
+        """
+        errors: Tuple[Type[BaseException], ...] = (zlib.error, OSError, EOFError)
+        if zstandard is not None:
+            errors += (zstandard.ZstdError,)
+        with open(self.input_file, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            f.seek(self.start)
+            offset = self.start
+            data = b""
+            decompressor = None
+            while True:
+                if not data:
+                    data = f.read(COMPRESSED_CHUNK_SIZE)
+                    if not data:
+                        return
+                if decompressor is None:
+                    stripped = data.lstrip(b"\x00")
+                    offset += len(data) - len(stripped)
+                    data = stripped
+                    if not data:
+                        continue
+                    decompressor = _decompressor(self.compression)
+                try:
+                    chunk = decompressor.decompress(data)
+                except errors:
+                    return
+                if chunk:
+                    yield chunk
+                if not decompressor.eof:
+                    offset += len(data)
+                    data = b""
+                    continue
+                unused_data = decompressor.unused_data
+                offset += len(data) - len(unused_data)
+                self.position = offset
+                if offset >= self.end:
+                    return
+                data = unused_data
+                decompressor = None
@@ -4,3 +4,13 @@ import os
 LOGS_DIR = os.getenv('LOGS_DIR', 'logs')
 MAX_BYTES = int(os.getenv('MAX_BYTES', 10**6))
 BACKUP_COUNT = int(os.getenv('BACKUP_COUNT', 5))
+INDEX_STRIDE = int(os.getenv('INDEX_STRIDE', 10000))
+MMAP_MIN_SIZE = int(os.getenv('MMAP_MIN_SIZE', 10**7))
+CHECKPOINT_INTERVAL = float(os.getenv('CHECKPOINT_INTERVAL', 60))
+READ_BUFFER_SIZE = int(os.getenv('READ_BUFFER_SIZE', 1024 * 1024))
+CACHE_SIZE = int(os.getenv('CACHE_SIZE', 100000))
+RESULTS_FILE = os.getenv('RESULTS_FILE')
+RESULTS_FORMAT = os.getenv('RESULTS_FORMAT', 'json')
+STATS_INTERVAL = float(os.getenv('STATS_INTERVAL', 60))
+WATERMARK_SLACK = int(os.getenv('WATERMARK_SLACK', 10000))
+SERVER_RETENTION = int(os.getenv('SERVER_RETENTION', 24))
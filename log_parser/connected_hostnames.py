@@ -1,87 +1,547 @@
 """Connected hostnames.
 ~~~~~~~~~~~~~~~~~~~~~~~~~
 """
-from itertools import zip_longest
-import multiprocessing
-from typing import Any, Iterable, Iterator, Optional, Union
+from contextlib import nullcontext
+from mmap import ACCESS_READ, mmap
+from os import path
+from typing import Any, Dict, IO, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
 
-from log_parser.constants import TIMESTAMP_MARGIN
+from log_parser.cache import hours_of, load_cache, ResultCache
+from log_parser.columnar import ColumnarLog, is_columnar
+from log_parser.compression import compression_of, MemberReader, open_log, split_members
+from log_parser.config import CACHE_SIZE, MMAP_MIN_SIZE
+from log_parser.constants import ENGINES, HOUR_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.files import select_files
+from log_parser.hostnames import pack_hostnames, pack_hours, unpack_hostnames, unpack_hours
+from log_parser.index import refresh_index
 from log_parser.logger import logger
+from log_parser.seek import bisect_end_offset, find_offset
+from log_parser.stats import imap, starmap, stats
+from log_parser.watermark import Watermark
 
 
-def grouper(iterable: Union[Iterator, Iterable], n: int, fillvalue: Optional[Any] = None) -> Iterator:
-    """Collect data into fixed-length chunks or blocks."""
-    args = [iter(iterable)] * n
-    return zip_longest(*args, fillvalue=fillvalue)
+SAMPLE_BYTES = 64 * 1024
 
 
-def process_batch(batch_lines: Iterable, int_timestamp: int, end_timestamp: int, hostname: str, host_len: int) -> set:
-    """Process a batch of lines and returns the set of hostnames that have been conected to hostname."""
+def _pool(workers: int) -> Any:
+    """Returns a pool of workers processes, multiprocessing is imported only when it's needed."""
+    from multiprocessing import Pool
+    return Pool(workers)
+
+
+class _SharedPool():
+    """A pool of workers created the first time it's needed, so several scans can share it."""
+    def __init__(self, workers: int) -> None:
+        """Creates the shared pool, without any worker yet."""
+        self.workers = workers
+        self.pool: Any = None
+
+    def get(self) -> Any:
+        """Returns the pool, creating it if it's the first time."""
+        if self.pool is None:
+            self.pool = _pool(self.workers)
+        return self.pool
+
+    def __enter__(self) -> '_SharedPool':
+        """Returns the shared pool."""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Terminates the workers, if they have been created."""
+        if self.pool is not None:
+            self.pool.__exit__(*args)
+
+
+def process_batch(batch_lines: Iterable, int_timestamp: int, end_timestamp: int, hostname: str, host_len: int,
+                  watermark: Optional[Watermark] = None, hours: Optional[Dict[int, Set[str]]] = None) -> set:
+    """Process a batch of lines and returns the set of hostnames that have been conected to hostname.
+
+    The lines are read until the watermark passes end_timestamp. If watermark is given it's updated with the
+    lines read, so an adaptive margin can stop the batch earlier, otherwise the margin is TIMESTAMP_MARGIN.
+    The late lines are counted, but they are processed as the others. If hours is given, the hostnames are
+    also added to the set of the hour of their line.
+    """
+    if watermark is None:
+        watermark = Watermark()
     hostnames = set()
+    lines = skipped_lines = matches = late_lines = 0
+    max_timestamp, lateness, margin = watermark.max_timestamp, watermark.lateness, watermark.margin
+    threshold = min(lateness, margin)
+    last_timestamp = end_timestamp + margin
     for line in batch_lines:
         if line is None:
             break
+        lines += 1
         timestamp = int(line[:13])
-        if timestamp > end_timestamp + TIMESTAMP_MARGIN:
-            break
+        if timestamp >= max_timestamp:
+            if timestamp > last_timestamp:
+                break
+            max_timestamp = timestamp
+        elif max_timestamp - timestamp > threshold:
+            behind = max_timestamp - timestamp
+            if behind > margin:
+                late_lines += 1
+            if behind > lateness:
+                watermark.lateness = lateness = behind
+                margin = watermark.margin
+                last_timestamp = end_timestamp + margin
+            threshold = min(lateness, margin)
         if timestamp < int_timestamp:
+            skipped_lines += 1
             continue
         if line[-host_len - 1:-1] != hostname:
             continue
         if timestamp < end_timestamp:
+            matches += 1
             hostnames.add(line[14:-host_len - 2])
+            if hours is not None:
+                hours.setdefault(timestamp - timestamp % HOUR_TIMESTAMP, set()).add(line[14:-host_len - 2])
+    watermark.max_timestamp = max_timestamp
+    watermark.late_lines += late_lines
+    stats.count(lines=lines, skipped_lines=skipped_lines, matches=matches, late_lines=late_lines)
+    return hostnames
+
+
+def _read_range(f: IO[bytes], start: int, end: int) -> Iterator[str]:
+    """Yields the lines of f that begin in the byte range [start, end) with their newlines translated."""
+    f.seek(start)
+    position = start
+    for line in f:
+        if position >= end:
+            break
+        position += len(line)
+        if line.endswith(b"\r\n"):
+            line = line[:-2] + b"\n"
+        yield line.decode()
+
+
+def process_mmap_range(input_file: str, start: int, end: int, int_timestamp: int, end_timestamp: int,
+                       hostname: str, hours: Optional[Dict[int, Set[str]]] = None) -> set:
+    """Process the lines of input_file that begin in the byte range [start, end) over a memory map of the file.
+
+    Instead of parsing every line, the lines ending with the hostname are searched as bytes and only then
+    their timestamp and origin are read. The timestamps are compared as fixed-width byte strings. It returns
+    the same set of hostnames as process_batch, assuming that lines are never more than TIMESTAMP_MARGIN
+    out of order, and fills hours like it.
+    """
+    if start >= end:
+        return set()
+    origins = set()
+    matches = 0
+    with open(input_file, 'rb') as f, mmap(f.fileno(), 0, access=ACCESS_READ) as mm:
+        end = min(end, bisect_end_offset(mm, end_timestamp, len(mm)))
+        first_newline = mm.find(b"\n", start, end)
+        newline = b"\r\n" if first_newline > 0 and mm[first_newline - 1:first_newline] == b"\r" else b"\n"
+        needle = b" " + hostname.encode() + newline
+        init_bytes = b"%013d" % int_timestamp
+        end_bytes = b"%013d" % end_timestamp
+        last_bytes = b"%013d" % (end_timestamp + TIMESTAMP_MARGIN)
+        position = mm.find(needle, start, end)
+        while position != -1:
+            line_start = max(mm.rfind(b"\n", start, position) + 1, start)
+            timestamp = mm[line_start:line_start + 13]
+            if timestamp > last_bytes:
+                break
+            if init_bytes <= timestamp < end_bytes:
+                matches += 1
+                origins.add(mm[line_start + 14:position])
+                if hours is not None:
+                    hour = int(timestamp) - int(timestamp) % HOUR_TIMESTAMP
+                    hours.setdefault(hour, set()).add(mm[line_start + 14:position].decode())
+            position = mm.find(needle, position + len(needle), end)
+    stats.count(bytes_read=max(end - start, 0), matches=matches)
+    return {origin.decode() for origin in origins}
+
+
+def process_range(input_file: str, start: int, end: int, int_timestamp: int, end_timestamp: int,
+                  hostname: str, engine: str = 'lines', hours: Optional[Dict[int, Set[str]]] = None) -> set:
+    """Process the lines of input_file that begin in the byte range [start, end).
+
+    Returns the set of hostnames that have been conected to hostname, see process_batch for hours.
+    """
+    if engine == 'mmap':
+        return process_mmap_range(input_file, start, end, int_timestamp, end_timestamp, hostname, hours)
+    with open(input_file, 'rb') as f:
+        hostnames = process_batch(_read_range(f, start, end), int_timestamp, end_timestamp, hostname, len(hostname),
+                                  hours=hours)
+        stats.count(bytes_read=min(f.tell(), end) - start)
     return hostnames
 
 
+def _process_range_packed(input_file: str, start: int, end: int, int_timestamp: int, end_timestamp: int,
+                          hostname: str, engine: str = 'lines', by_hour: bool = False) -> bytes:
+    """Like process_range but returns the hostnames packed, so they are cheap to send back from a worker.
+
+    If by_hour is True the hostnames of each hour are packed with pack_hours.
+    """
+    if not by_hour:
+        return pack_hostnames(process_range(input_file, start, end, int_timestamp, end_timestamp, hostname, engine))
+    hours: Dict[int, Set[str]] = {}
+    process_range(input_file, start, end, int_timestamp, end_timestamp, hostname, engine, hours)
+    return pack_hours(hours)
+
+
+class CompressedRange(NamedTuple):
+    """The hostnames of the members of a compressed file that begin in a byte range.
+
+    The lines split between two ranges are returned in pieces to be joined: head is the first line of the
+    range (None if the range has no newline) and tail is its incomplete last line. If done is True the
+    period has been passed and the following ranges don't need to be processed.
+    """
+    start: int
+    position: int
+    head: Optional[bytes]
+    tail: bytes
+    hostnames: bytes
+    done: bool
+
+
+class _RangeLines():
+    """Splits decompressed chunks in lines, keeping apart the first line and the incomplete last one."""
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        """Creates the lines of chunks."""
+        self.chunks = chunks
+        self.head: Optional[bytes] = None
+        self.tail = b""
+        self.finished = False
+
+    def __iter__(self) -> Iterator[str]:
+        """Yields the complete lines after the first one, with their newlines translated."""
+        for chunk in self.chunks:
+            data = self.tail + chunk
+            end = data.rfind(b"\n") + 1
+            self.tail = data[end:]
+            if self.head is None and end:
+                head_end = data.index(b"\n") + 1
+                self.head = data[:head_end]
+                data = data[head_end:end]
+            else:
+                data = data[:end]
+            yield from data.replace(b"\r\n", b"\n").decode().splitlines(keepends=True)
+        self.finished = True
+
+
+def process_compressed_range(input_file: str, compression: str, start: int, end: int, int_timestamp: int,
+                             end_timestamp: int, hostname: str, by_hour: bool = False) -> CompressedRange:
+    """Process the lines of the members of input_file that begin in the byte range [start, end).
+
+    Returns the hostnames that have been conected to hostname packed (with pack_hours if by_hour is True),
+    with the pieces of the lines split with the neighbour ranges.
+    """
+    reader = MemberReader(input_file, compression, start, end)
+    chunks = iter(reader)
+    lines = _RangeLines(chunks)
+    hours: Optional[Dict[int, Set[str]]] = {} if by_hour else None
+    hostnames = process_batch(lines, int_timestamp, end_timestamp, hostname, len(hostname), hours=hours)
+    chunks.close()  # type: ignore
+    stats.count(compressed_bytes_read=reader.position - start)
+    return CompressedRange(start, reader.position, lines.head, lines.tail,
+                           pack_hostnames(hostnames) if hours is None else pack_hours(hours), not lines.finished)
+
+
+def split_ranges(input_file: str, start: int, batch_size: int, end: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Splits input_file from start into byte ranges aligned to newlines of about batch_size lines each.
+
+    Args:
+        input_file: The file to split.
+        start: The offset where the first range begins, it must be the beginning of a line.
+        batch_size: Approximate number of lines in each range.
+        end: The offset where the last range ends, it must be the beginning of a line. { default: the size of
+            the file}
+    """
+    size = path.getsize(input_file) if end is None else end
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        sample = f.read(SAMPLE_BYTES)
+        line_length = len(sample) / max(sample.count(b"\n"), 1)
+        range_bytes = max(int(batch_size * line_length), 1)
+        boundaries = [start]
+        while boundaries[-1] + range_bytes < size:
+            f.seek(boundaries[-1] + range_bytes - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            boundaries.append(f.tell())
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
 def _get_connected_hostnames_multithread(input_file: str, int_timestamp: int, end_timestamp: int, hostname: str,
-                                         workers: int = 8, batch_size: int = 200000) -> set:
-    """Get connected hostnames using multithread."""
-    host_len = len(hostname)
-    with multiprocessing.Pool(workers) as p:
-        batches = iter(
-            (batch, int_timestamp, end_timestamp, hostname, host_len) for batch in grouper(open(input_file), batch_size)
+                                         workers: int = 8, batch_size: int = 200000, offset: int = 0,
+                                         engine: str = 'lines', hours: Optional[Dict[int, Set[str]]] = None,
+                                         pool: Any = None) -> set:
+    """Get connected hostnames using multithread.
+
+    Each worker receives only a byte range of the file, reads it by itself and sends back its hostnames packed.
+    If hours is given it's filled like process_batch does. If pool is given its workers are used instead of
+    a new pool.
+    """
+    with stats.timer('split'):
+        ranges = split_ranges(input_file, offset, batch_size)
+    with _pool(workers) if pool is None else nullcontext(pool) as p:
+        packed_hostnames = starmap(
+            p, _process_range_packed,
+            ((input_file, start, end, int_timestamp, end_timestamp, hostname, engine, hours is not None)
+             for start, end in ranges)
         )
-        hostnames_list = p.starmap(process_batch, batches)
-        return set().union(*hostnames_list)
+    with stats.timer('merge'):
+        if hours is None:
+            return set().union(*map(unpack_hostnames, packed_hostnames))
+        for packed in packed_hostnames:
+            unpack_hours(packed, hours)
+        return set().union(*hours.values())
+
+
+def _get_connected_hostnames_compressed(input_file: str, compression: str, int_timestamp: int, end_timestamp: int,
+                                        hostname: str, workers: int = 8, hours: Optional[Dict[int, Set[str]]] = None,
+                                        pool: Any = None) -> set:
+    """Get connected hostnames of a compressed file, decompressing its members in parallel.
+
+    The ranges are merged in order: a range that doesn't begin where the members of the previous one end
+    (its beginning was a false member) is read again from there in this process, and the lines split
+    between ranges are joined and processed here. hours and pool are used like in
+    _get_connected_hostnames_multithread.
+    """
+    with stats.timer('split'):
+        ranges = split_members(input_file, compression, workers * 4)
+    hostnames: set = set()
+    by_hour = hours is not None
+    position = 0
+    carry = b""
+    with _pool(workers) if pool is None else nullcontext(pool) as p:
+        results = imap(p, process_compressed_range, (
+            (input_file, compression, start, end, int_timestamp, end_timestamp, hostname, by_hour)
+            for start, end in ranges))
+        for (start, end), result in zip(ranges, results):
+            if position < start:
+                raise ValueError(f"Invalid {compression} data at offset {position} of {input_file}")
+            if result.start != position:
+                if position >= end:
+                    continue
+                result = process_compressed_range(
+                    input_file, compression, position, end, int_timestamp, end_timestamp, hostname, by_hour)
+            if hours is None:
+                hostnames.update(unpack_hostnames(result.hostnames))
+            else:
+                unpack_hours(result.hostnames, hours)
+            if result.head is None:
+                carry += result.tail
+            else:
+                hostnames |= process_batch(
+                    [(carry + result.head).replace(b"\r\n", b"\n").decode()], int_timestamp, end_timestamp,
+                    hostname, len(hostname), hours=hours)
+                carry = result.tail
+            position = result.position
+            if result.done:
+                break
+        else:
+            if carry:
+                hostnames |= process_batch([carry.decode() + "\n"], int_timestamp, end_timestamp, hostname,
+                                           len(hostname), hours=hours)
+    return hostnames if hours is None else hostnames.union(*hours.values())
 
 
 def _get_connected_hostnames_single_thread(input_file: str, int_timestamp: int, end_timestamp: int,
-                                           hostname: str) -> set:
-    """Get connected hostnames using single thread."""
-    hostnames = set()
-    host_len = len(hostname)
-    for line in open(input_file):
-        timestamp = int(line[:13])
-        if timestamp > end_timestamp + TIMESTAMP_MARGIN:
-            break
-        if timestamp < int_timestamp:
-            continue
-        if line[-host_len - 1:-1] != hostname:
-            continue
-        if timestamp < end_timestamp:
-            hostnames.add(line[14:-host_len - 2])
+                                           hostname: str, offset: int = 0, engine: str = 'lines',
+                                           watermark: Optional[Watermark] = None,
+                                           hours: Optional[Dict[int, Set[str]]] = None) -> set:
+    """Get connected hostnames using single thread, the watermark is used only by the lines engine.
+
+    If hours is given it's filled like process_batch does.
+    """
+    if engine == 'mmap':
+        return process_mmap_range(
+            input_file, offset, path.getsize(input_file), int_timestamp, end_timestamp, hostname, hours)
+    with open_log(input_file) as f:
+        if offset:
+            f.seek(offset)
+        hostnames = process_batch(f, int_timestamp, end_timestamp, hostname, len(hostname), watermark, hours)
+        if stats.enabled:
+            stats.count(bytes_read=f.buffer.tell() - offset)  # type: ignore
+    return hostnames
+
+
+def _get_connected_hostnames_of_file(input_file: str, int_timestamp: int, end_timestamp: int, hostname: str,
+                                     use_multithread: bool = False, workers: int = 8, batch_size: int = 200000,
+                                     use_seek: bool = False, use_index: bool = False,
+                                     engine: Optional[str] = None, watermark: Optional[Watermark] = None,
+                                     hours: Optional[Dict[int, Set[str]]] = None, pool: Any = None) -> set:
+    """Get connected hostnames of a single file, see get_connected_hostnames.
+
+    The watermark, if it's given, is updated by the scans that read the lines in order in a single thread.
+    If hours is given, the hostnames of each hour of the period are also added to it, keyed by the beginning
+    of the hour. With multithreading, if pool is given its workers are used instead of a new pool.
+    """
+    if is_columnar(input_file):
+        columnar_log = ColumnarLog(input_file)
+        if hours is None:
+            return columnar_log.connected_hostnames(int_timestamp, end_timestamp, hostname)
+        for start, end, _ in hours_of(int_timestamp, end_timestamp):
+            hours[start - start % HOUR_TIMESTAMP] = columnar_log.connected_hostnames(start, end, hostname)
+        return set().union(*hours.values())
+    compression = compression_of(input_file)
+    engine = engine or ('mmap' if compression is None and path.getsize(input_file) >= MMAP_MIN_SIZE else 'lines')
+    if compression is not None and engine != 'lines':
+        raise ValueError(f"The {engine} engine can't read compressed files")
+    offset = 0
+    with stats.timer('seek'):
+        if use_index and compression is None:
+            offset = refresh_index(input_file).offset_for(int_timestamp)
+        elif use_seek and compression is None:
+            offset = find_offset(input_file, int_timestamp)
+    if use_multithread and compression is not None:
+        return _get_connected_hostnames_compressed(
+            input_file, compression, int_timestamp, end_timestamp, hostname, workers=workers, hours=hours, pool=pool)
+    if use_multithread:
+        return _get_connected_hostnames_multithread(
+            input_file, int_timestamp, end_timestamp, hostname, workers=workers, batch_size=batch_size, offset=offset,
+            engine=engine, hours=hours, pool=pool)
+    return _get_connected_hostnames_single_thread(
+        input_file, int_timestamp, end_timestamp, hostname, offset=offset, engine=engine, watermark=watermark,
+        hours=hours)
+
+
+def _get_connected_hostnames_of_file_packed(input_file: str, int_timestamp: int, end_timestamp: int, hostname: str,
+                                            use_seek: bool, use_index: bool, engine: Optional[str],
+                                            adaptive_margin: bool) -> Tuple[bytes, int, int]:
+    """Like _get_connected_hostnames_of_file in a single thread but returns the hostnames packed.
+
+    The number of late lines and the greatest lateness observed are returned with them, to be reported here.
+    """
+    watermark = Watermark(adaptive=adaptive_margin)
+    hostnames = _get_connected_hostnames_of_file(
+        input_file, int_timestamp, end_timestamp, hostname, use_seek=use_seek, use_index=use_index, engine=engine,
+        watermark=watermark)
+    return pack_hostnames(hostnames), watermark.late_lines, watermark.lateness
+
+
+def _warn_late_lines(input_file: str, late_lines: int, lateness: int) -> None:
+    """Logs the number of lines of input_file that arrived behind the watermark, if there are any."""
+    if late_lines:
+        logger.warning(f"{late_lines} lines of {input_file} arrived behind the watermark, "
+                       f"up to {lateness} ms out of order")
+
+
+def _get_connected_hostnames_of_file_cached(cache: ResultCache, input_file: str, int_timestamp: int,
+                                            end_timestamp: int, hostname: str, use_multithread: bool = False,
+                                            workers: int = 8, batch_size: int = 200000, use_index: bool = False,
+                                            engine: Optional[str] = None, adaptive_margin: bool = False,
+                                            pool: Optional[_SharedPool] = None) -> set:
+    """Get connected hostnames of a single file reading only the whole hours that aren't in cache.
+
+    Each run of consecutive missing hours (with the partial hours at the edges of the period) is scanned in
+    a single pass, bisecting the file to reach it unless it's compressed or the index is used, and its
+    hostnames are split by hour to cache them. With multithreading the workers of pool are used, if it's given.
+    """
+    file_key = cache.validate(input_file)
+    use_seek = not use_index and compression_of(input_file) is None
+    hostnames: set = set()
+    runs: List[List[Tuple[int, int, bool]]] = []
+    for start, end, whole in hours_of(int_timestamp, end_timestamp):
+        cached = cache.get(file_key, hostname, start) if whole else None
+        if cached is not None:
+            hostnames |= cached
+        elif runs and runs[-1][-1][1] == start:
+            runs[-1].append((start, end, whole))
+        else:
+            runs.append([(start, end, whole)])
+    for run in runs:
+        watermark = Watermark(adaptive=adaptive_margin)
+        hours: Dict[int, Set[str]] = {}
+        hostnames |= _get_connected_hostnames_of_file(
+            input_file, run[0][0], run[-1][1], hostname, use_multithread=use_multithread, workers=workers,
+            batch_size=batch_size, use_seek=use_seek, use_index=use_index, engine=engine, watermark=watermark,
+            hours=hours, pool=pool.get() if pool is not None and use_multithread else None)
+        _warn_late_lines(input_file, watermark.late_lines, watermark.lateness)
+        for start, _, whole in run:
+            if whole:
+                cache.put(file_key, hostname, start, hours.get(start, set()))
+    return hostnames
+
+
+def _get_connected_hostnames_of_files(files: List[str], int_timestamp: int, end_timestamp: int, hostname: str,
+                                      use_multithread: bool = False, workers: int = 8, batch_size: int = 200000,
+                                      use_seek: bool = False, use_index: bool = False, engine: Optional[str] = None,
+                                      cache_file: Optional[str] = None, cache_size: int = CACHE_SIZE,
+                                      adaptive_margin: bool = False) -> set:
+    """Get connected hostnames of several files, see get_connected_hostnames."""
+    hostnames: set = set()
+    if cache_file:
+        cache = load_cache(cache_file, cache_size)
+        with _SharedPool(workers) as pool:
+            for log_file in files:
+                hostnames |= _get_connected_hostnames_of_file_cached(
+                    cache, log_file, int_timestamp, end_timestamp, hostname, use_multithread=use_multithread,
+                    workers=workers, batch_size=batch_size, use_index=use_index, engine=engine,
+                    adaptive_margin=adaptive_margin, pool=pool)
+        cache.save(cache_file)
+    elif use_multithread and len(files) > 1:
+        with _pool(min(workers, len(files))) as p:
+            results = starmap(p, _get_connected_hostnames_of_file_packed, (
+                (log_file, int_timestamp, end_timestamp, hostname, use_seek, use_index, engine, adaptive_margin)
+                for log_file in files))
+        for log_file, (packed_hostnames, late_lines, lateness) in zip(files, results):
+            hostnames.update(unpack_hostnames(packed_hostnames))
+            _warn_late_lines(log_file, late_lines, lateness)
+    else:
+        for log_file in files:
+            watermark = Watermark(adaptive=adaptive_margin)
+            hostnames |= _get_connected_hostnames_of_file(
+                log_file, int_timestamp, end_timestamp, hostname, use_multithread=use_multithread, workers=workers,
+                batch_size=batch_size, use_seek=use_seek, use_index=use_index, engine=engine, watermark=watermark)
+            _warn_late_lines(log_file, watermark.late_lines, watermark.lateness)
     return hostnames
 
 
 def get_connected_hostnames(input_file: str, int_timestamp: int, end_timestamp: int, hostname: str,
-                            use_multithread: bool = False, workers: int = 8, batch_size: int = 200000) -> None:
+                            use_multithread: bool = False, workers: int = 8, batch_size: int = 200000,
+                            use_seek: bool = False, use_index: bool = False, engine: Optional[str] = None,
+                            cache_file: Optional[str] = None, cache_size: int = CACHE_SIZE,
+                            adaptive_margin: bool = False) -> None:
     """Reads input_file and reports a list hostnames connected to the given host during the given period.
 
     Args:
-        input_file: The file to read.
+        input_file: The file to read, or a directory or a glob of files to read.
         int_timestamp: The beginning of the period.
         end_timestamp: The end of the period.
         hostname: The host to check connetions.
         use_multithread: If it's True multithreading is used. { default: False}.
         workers: Number of workers to use if multithreading it's enabled. { default: 8}
-        batch_size: Number of lines in each batch (used only in multithreading). { default: 200000}
+        batch_size: Approximate number of lines in each byte range (used only in multithreading). { default: 200000}
+        use_seek: If it's True the file is bisected to start reading just before the period. { default: False}
+        use_index: If it's True the index sidecar is used (and refreshed) to start reading at the period.
+            { default: False}
+        engine: The scanning engine, 'lines' parses every line and 'mmap' searches the hostname over a memory
+            map of the file. { default: 'mmap' if the file has at least MMAP_MIN_SIZE bytes else 'lines'}
+        cache_file: File of the result cache, the whole hours already read are taken from it and the ones read
+            are added to it. { default: None, no cache}
+        cache_size: Maximum number of hours kept in the cache. { default: CACHE_SIZE}
+        adaptive_margin: If it's True the scans stop once the greatest lateness observed plus WATERMARK_SLACK has
+            passed the end of the period, instead of TIMESTAMP_MARGIN, see Watermark. { default: False}
+
+    The lines more than the margin out of order are counted and a warning is logged. The adaptive margin is
+    used by the 'lines' engine reading a file in order, the 'mmap' engine and the byte ranges read in parallel
+    keep TIMESTAMP_MARGIN.
+
+    Compressed files (gzip, bz2 or zstd) are decompressed as they are read, only with the 'lines' engine and
+    from their beginning, ignoring seek and index (so a directory can mix plain and rotated compressed logs).
+    With multithreading their members are decompressed in parallel and batch_size is ignored.
+
+    Columnar logs (see convert) are queried with numpy, ignoring the engine, seek, index and multithreading.
+
+    The files whose first and last lines show that they can't have lines in the period are skipped. With
+    multithreading, if several files are left each worker reads whole files, unless the cache is used.
     """
     workers = workers or 8
     batch_size = batch_size or 200000
-    if use_multithread:
-        hostnames = _get_connected_hostnames_multithread(
-            input_file, int_timestamp, end_timestamp, hostname, workers=workers, batch_size=batch_size)
-    else:
-        hostnames = _get_connected_hostnames_single_thread(input_file, int_timestamp, end_timestamp, hostname)
-
-    logger.log_connected_hostnames(hostname, hostnames)
+    if engine is not None and engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine}, it must be one of {', '.join(ENGINES)}")
+    with stats.timer('select'):
+        files = [span.path for span in select_files(input_file, int_timestamp, end_timestamp)]
+    with stats.timer('scan'):
+        hostnames = _get_connected_hostnames_of_files(
+            files, int_timestamp, end_timestamp, hostname, use_multithread=use_multithread, workers=workers,
+            batch_size=batch_size, use_seek=use_seek, use_index=use_index, engine=engine, cache_file=cache_file,
+            cache_size=cache_size, adaptive_margin=adaptive_margin)
+    with stats.timer('output'):
+        logger.log_connected_hostnames(hostname, hostnames)
@@ -1,3 +1,6 @@
 """Constants module."""
 TIMESTAMP_MARGIN = 5 * 60 * 1000
 HOUR_TIMESTAMP = 60 * 60 * 1000
+MINUTE_TIMESTAMP = 60 * 1000
+ENGINES = ('lines', 'mmap')
+RESULTS_FORMATS = ('json', 'text')
@@ -0,0 +1,112 @@
+"""Log files.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+The input of the commands can be a file, a directory or a glob matching several files (e.g. the rotated
+logs of a day). The files are ordered by the timestamp of their first line and the ones whose lines can't
+be in the period of a query are skipped without reading them, looking only at their first and last lines
+(or the first line of the next file, for the compressed ones).
+"""
+import glob
+import os
+from typing import List, NamedTuple, Optional
+
+from log_parser.columnar import columnar_span, is_columnar
+from log_parser.compression import compression_of, open_log
+from log_parser.constants import TIMESTAMP_MARGIN
+from log_parser.index import INDEX_SUFFIX
+
+TAIL_BYTES = 4096
+
+
+class FileSpan(NamedTuple):
+    """The first and last timestamps of a file, the last one is None if the file is compressed."""
+    path: str
+    inode: int
+    first_timestamp: int
+    last_timestamp: Optional[int]
+
+
+def is_multiple(input_path: str) -> bool:
+    """Checks if input_path is a directory or a glob instead of a single file."""
+    return os.path.isdir(input_path) or glob.has_magic(input_path)
+
+
+def input_files(input_path: str) -> List[str]:
+    """Returns the files of input_path: itself, the files of the directory or the files matching the glob.
+
+    The hidden files and the index sidecars are skipped.
+    """
+    if not is_multiple(input_path):
+        return [input_path]
+    pattern = os.path.join(input_path, '*') if os.path.isdir(input_path) else input_path
+    return sorted(
+        path for path in glob.glob(pattern)
+        if os.path.isfile(path) and not path.endswith(INDEX_SUFFIX) and not os.path.basename(path).startswith('.')
+    )
+
+
+def _last_timestamp(input_file: str) -> Optional[int]:
+    """Returns the timestamp of the last complete line of an uncompressed file reading only its tail."""
+    size = os.path.getsize(input_file)
+    tail_bytes = TAIL_BYTES
+    with open(input_file, 'rb') as f:
+        while True:
+            f.seek(max(size - tail_bytes, 0))
+            tail = f.read()
+            end = tail.rfind(b"\n")
+            start = tail.rfind(b"\n", 0, max(end, 0)) + 1
+            if end >= 0 and (start or tail_bytes >= size):
+                return int(tail[start:start + 13])
+            if tail_bytes >= size:
+                return None
+            tail_bytes *= 2
+
+
+def file_span(input_file: str) -> Optional[FileSpan]:
+    """Returns the span of input_file or None if it has no complete line or it isn't a log."""
+    try:
+        if is_columnar(input_file):
+            timestamps = columnar_span(input_file)
+            return FileSpan(input_file, os.stat(input_file).st_ino, *timestamps) if timestamps else None
+        with open_log(input_file) as f:
+            first_line = f.readline()
+        if not first_line.endswith("\n"):
+            return None
+        first_timestamp = int(first_line[:13])
+        compressed = compression_of(input_file) is not None
+        last_timestamp = None if compressed else _last_timestamp(input_file)
+    except FileNotFoundError:
+        raise
+    except (ValueError, OSError, EOFError):
+        return None
+    return FileSpan(input_file, os.stat(input_file).st_ino, first_timestamp, last_timestamp)
+
+
+def select_files(input_path: str, init_timestamp: Optional[int] = None,
+                 end_timestamp: Optional[int] = None) -> List[FileSpan]:
+    """Returns the spans of the files of input_path that can have lines in [init_timestamp, end_timestamp).
+
+    Being the lines at most TIMESTAMP_MARGIN out of order, a file is skipped if its last line is before
+    init_timestamp - TIMESTAMP_MARGIN or its first line is after end_timestamp + TIMESTAMP_MARGIN. The last
+    line of a compressed file isn't read, it's bounded by the first line of the next file.
+
+    Args:
+        input_path: A file, a directory or a glob.
+        init_timestamp: The beginning of the period. { default: None, unbounded}
+        end_timestamp: The end of the period. { default: None, unbounded}
+    """
+    spans = sorted(
+        (span for span in map(file_span, input_files(input_path)) if span is not None),
+        key=lambda span: (span.first_timestamp, span.path))
+    selected = []
+    for position, span in enumerate(spans):
+        if end_timestamp is not None and span.first_timestamp >= end_timestamp + TIMESTAMP_MARGIN:
+            continue
+        last_timestamp = span.last_timestamp
+        if last_timestamp is None and position + 1 < len(spans):
+            last_timestamp = spans[position + 1].first_timestamp
+        if (init_timestamp is not None and last_timestamp is not None
+                and last_timestamp < init_timestamp - TIMESTAMP_MARGIN):
+            continue
+        selected.append(span)
+    return selected
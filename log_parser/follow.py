@@ -0,0 +1,283 @@
+"""File follower.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Follows a growing file like ``tail -F``: it reads the new data in big chunks, waits for changes with
+inotify where it's available (with an adaptive polling backoff as fallback) and reopens the file when
+it's rotated or truncated. Compressed files are decompressed as they are read and they are never
+followed, since they don't grow. When the file is part of a chain (a directory or a glob of rotated
+logs), at its end the follower moves on to the next file of the chain as soon as it's created. The next
+file is only looked for when the file is opened, when a file is created in (or moved to) the directory of
+the chain or the followed file is moved or deleted, and every SUCCESSOR_INTERVAL seconds, not at every
+wake up, and the first timestamps of the files of the chain are cached.
+"""
+import asyncio
+import ctypes
+import glob
+import os
+from struct import Struct
+from time import monotonic
+from typing import AsyncIterator, Dict, IO, List, Optional, Set, Tuple
+
+from log_parser.compression import compression_of, open_binary
+from log_parser.files import file_span, input_files
+
+CHUNK_SIZE = 1024 * 1024
+POLL_MIN_DELAY = 0.05
+POLL_MAX_DELAY = 2.0
+SUCCESSOR_INTERVAL = 10.0
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+DIRECTORY_MASK = IN_CREATE | IN_MOVED_TO
+_EVENT = Struct("iIII")
+
+
+class Inotify():
+    """Notifies the changes of a file using inotify, if inotify isn't available it never notifies.
+
+    The files created in a directory can be watched too, files_changed is set when one is created or the
+    watched file is moved or deleted.
+    """
+    def __init__(self) -> None:
+        """Creates the inotify instance."""
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+        self.fd = -1
+        self.wd = -1
+        self.directory_wd = -1
+        self.files_changed = False
+        try:
+            self.libc: Optional[ctypes.CDLL] = ctypes.CDLL(None, use_errno=True)
+            self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            self.libc = None
+        if self.fd >= 0:
+            self.loop.add_reader(self.fd, self._on_event)
+
+    @property
+    def available(self) -> bool:
+        """True if the changes are notified."""
+        return self.fd >= 0
+
+    def _on_event(self) -> None:
+        """Drains the pending events, noting the ones that change the files, and wakes up the waiters."""
+        try:
+            while True:
+                data = os.read(self.fd, 4096)
+                if not data:
+                    break
+                offset = 0
+                while offset + _EVENT.size <= len(data):
+                    wd, mask, _, name_len = _EVENT.unpack_from(data, offset)
+                    if wd == self.directory_wd or mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                        self.files_changed = True
+                    offset += _EVENT.size + name_len
+        except BlockingIOError:
+            pass
+        self.event.set()
+
+    def watch(self, path: str) -> None:
+        """Watches path, replacing the previously watched file."""
+        if not self.available or self.libc is None:
+            return
+        if self.wd >= 0:
+            self.libc.inotify_rm_watch(self.fd, self.wd)
+        self.wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+
+    def watch_directory(self, path: str) -> None:
+        """Watches the files created in or moved to the directory path."""
+        if self.available and self.libc is not None:
+            self.directory_wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), DIRECTORY_MASK)
+
+    async def wait(self, timeout: float) -> None:
+        """Waits for a change of the watched file or for timeout seconds."""
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
+
+    def close(self) -> None:
+        """Closes the inotify instance."""
+        if self.available:
+            self.loop.remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = -1
+
+
+class Follower():
+    """Reads the lines of a file as it grows."""
+    def __init__(self, path: str, offset: int = 0, chunk_size: int = CHUNK_SIZE, chain: Optional[str] = None) -> None:
+        """Creates a follower of path.
+
+        Args:
+            path: The file to follow.
+            offset: The offset where the reading begins, it must be the beginning of a line.
+            chunk_size: The number of bytes read at once. { default: CHUNK_SIZE}
+            chain: The directory or glob of the files that follow path, ordered by their first line.
+                { default: None, only path is followed}
+        """
+        self.path = path
+        self.position = offset
+        self.chunk_size = chunk_size
+        self.chain = chain
+        self.inode = -1
+        self.compression: Optional[str] = None
+        self.first_timestamp: Optional[int] = None
+        self.finished: Set[int] = set()
+        self.first_timestamps: Dict[Tuple[str, int], int] = {}
+        self.incomplete_files = False
+        self.restarts = 0
+
+    def _open(self) -> IO[bytes]:
+        """Opens the file at the current position."""
+        self.compression = compression_of(self.path)
+        f = open_binary(self.path, self.compression)
+        self.inode = os.fstat(f.fileno()).st_ino
+        f.seek(self.position)
+        if self.chain is not None:
+            span = file_span(self.path)
+            self.first_timestamp = span.first_timestamp if span is not None else None
+        return f
+
+    def _successor(self) -> Optional[str]:
+        """Returns the file of the chain that follows the current one, if it has been created.
+
+        Only the files that aren't in first_timestamps are opened. If a file has no complete line yet,
+        incomplete_files is set so it's looked at again.
+        """
+        if self.chain is None:
+            return None
+        first_timestamps = {}
+        self.incomplete_files = False
+        for path in input_files(self.chain):
+            try:
+                inode = os.stat(path).st_ino
+                if inode == self.inode or inode in self.finished:
+                    continue
+                first_timestamp = self.first_timestamps.get((path, inode))
+                if first_timestamp is None:
+                    span = file_span(path)
+                    if span is None:
+                        self.incomplete_files = True
+                        continue
+                    first_timestamp = span.first_timestamp
+            except FileNotFoundError:
+                continue
+            first_timestamps[(path, inode)] = first_timestamp
+        self.first_timestamps = first_timestamps
+        for first_timestamp, path in sorted((first_timestamp, path)
+                                            for (path, _), first_timestamp in first_timestamps.items()):
+            if self.first_timestamp is None or first_timestamp >= self.first_timestamp:
+                return path
+        return None
+
+    def _chain_directory(self) -> Optional[str]:
+        """Returns the directory where the files of the chain are created, None if it can't be watched."""
+        if self.chain is None or os.path.isdir(self.chain):
+            return self.chain
+        directory = os.path.dirname(self.chain) or "."
+        return None if glob.has_magic(directory) else directory
+
+    def _rotated(self, f: IO[bytes]) -> bool:
+        """Checks if the path points to another file than f."""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    async def batches(self, follow: bool = True) -> AsyncIterator[List[str]]:
+        """Yields the complete lines appended to the file, in batches.
+
+        After each batch, position is the offset just after its last line and restarts is the number of
+        times the reading has started again at the beginning of a file (rotated, truncated or the next one of
+        the chain). Before restarting, the rest of the previous file is yielded, with its last line even if
+        it isn't complete. The event loop runs between batches, so the timers aren't starved while the data flows.
+
+        Args:
+            follow: If it's False the iteration stops at the end of the file, yielding its last line
+                even if it isn't complete. { default: True}
+        """
+        inotify = Inotify()
+        f = self._open()
+        inotify.watch(self.path)
+        directory = self._chain_directory()
+        if directory is not None:
+            inotify.watch_directory(directory)
+        look_for_successor = self.chain is not None
+        next_look = monotonic() + SUCCESSOR_INTERVAL
+        pending = b""
+        delay = POLL_MIN_DELAY
+        try:
+            while True:
+                data = f.read(self.chunk_size)
+                if data:
+                    delay = POLL_MIN_DELAY
+                    data = pending + data
+                    end = data.rfind(b"\n") + 1
+                    pending = data[end:]
+                    if end:
+                        self.position += end
+                        yield data[:end].decode().splitlines()
+                        await asyncio.sleep(0)
+                    continue
+                successor = None
+                if self.chain is not None and (
+                        look_for_successor or inotify.files_changed or self.incomplete_files
+                        or monotonic() >= next_look):
+                    look_for_successor = inotify.files_changed = False
+                    next_look = monotonic() + SUCCESSOR_INTERVAL
+                    successor = self._successor()
+                if successor is not None:
+                    if pending:
+                        self.position += len(pending)
+                        yield [pending.decode()]
+                    f.close()
+                    self.finished.add(self.inode)
+                    self.path = successor
+                    self.position = 0
+                    self.restarts += 1
+                    f = self._open()
+                    inotify.watch(self.path)
+                    look_for_successor = True
+                    pending = b""
+                    continue
+                if not follow or (self.compression is not None and self.chain is None):
+                    if pending:
+                        self.position += len(pending)
+                        yield [pending.decode()]
+                    return
+                if self.compression is None and self._rotated(f):
+                    data = pending + f.read()
+                    if data:
+                        self.position += len(data)
+                        yield data.decode().splitlines()
+                    f.close()
+                    self.position = 0
+                    self.restarts += 1
+                    f = self._open()
+                    inotify.watch(self.path)
+                    look_for_successor = self.chain is not None
+                    pending = b""
+                    continue
+                if self.compression is None and os.fstat(f.fileno()).st_size < self.position + len(pending):
+                    if pending:
+                        self.position += len(pending)
+                        yield [pending.decode()]
+                    self.position = 0
+                    self.restarts += 1
+                    f.seek(0)
+                    pending = b""
+                    continue
+                await inotify.wait(delay)
+                delay = min(delay * 2, POLL_MAX_DELAY)
+        finally:
+            f.close()
+            inotify.close()
@@ -0,0 +1,107 @@
+"""Heavy hitters.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+"""
+from heapq import heapify, heappop, heappush, nlargest
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+
+class SpaceSaving():
+    """Approximate counter of the most frequent items using the Space-Saving algorithm.
+
+    It keeps at most capacity counters. The count of each kept item overestimates its true count by at
+    most its error, and any item whose true count is greater than the total count / capacity is kept.
+    """
+    def __init__(self, capacity: int) -> None:
+        """Creates an empty summary.
+
+        Args:
+            capacity: The maximum number of counters.
+        """
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        self.errors: Dict[Hashable, int] = {}
+        self.heap: List[Tuple[int, int, Hashable]] = []
+        self.pushes = 0
+        self.total = 0
+
+    def __len__(self) -> int:
+        """Returns the number of kept items."""
+        return len(self.counts)
+
+    def _push(self, item: Hashable) -> None:
+        """Pushes the current count of item in the heap."""
+        self.pushes += 1
+        heappush(self.heap, (self.counts[item], self.pushes, item))
+
+    def _pop_min(self) -> Tuple[Hashable, int]:
+        """Removes the item with the minimum count and returns it with its count.
+
+        The heap has an entry per item, which is only updated when it reaches the top with a stale count,
+        so incrementing a kept item doesn't touch the heap.
+        """
+        while True:
+            count, _, item = heappop(self.heap)
+            if self.counts[item] == count:
+                del self.counts[item]
+                del self.errors[item]
+                return item, count
+            self._push(item)
+
+    def update(self, item: Hashable, count: int = 1) -> None:
+        """Counts count occurrences of item."""
+        self.total += count
+        if item in self.counts:
+            self.counts[item] += count
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            _, min_count = self._pop_min()
+            self.counts[item] = min_count + count
+            self.errors[item] = min_count
+        self._push(item)
+
+    def min_count(self) -> int:
+        """Returns the upper bound of the count of any item that isn't kept."""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def top(self, k: int) -> List[Tuple[Hashable, int, int]]:
+        """Returns the k items with the greatest counts as (item, count, error) tuples.
+
+        The true count of each item is between count - error and count.
+        """
+        return [(item, count, self.errors[item]) for item, count in nlargest(
+            k, self.counts.items(), key=lambda item_count: item_count[1])]
+
+    @classmethod
+    def merge(cls, summaries: Iterable['SpaceSaving'], capacity: int) -> 'SpaceSaving':
+        """Merges summaries into a new summary with the given capacity.
+
+        The items that aren't kept by a summary are counted with its min_count, which is added to their error.
+        """
+        summaries = list(summaries)
+        counts: Dict[Hashable, int] = {}
+        errors: Dict[Hashable, int] = {}
+        for summary in summaries:
+            for item in summary.counts:
+                counts.setdefault(item, 0)
+                errors.setdefault(item, 0)
+        for summary in summaries:
+            min_count = summary.min_count()
+            for item in counts:
+                if item in summary.counts:
+                    counts[item] += summary.counts[item]
+                    errors[item] += summary.errors[item]
+                else:
+                    counts[item] += min_count
+                    errors[item] += min_count
+        merged = cls(capacity)
+        merged.total = sum(summary.total for summary in summaries)
+        for item, count in nlargest(capacity, counts.items(), key=lambda item_count: item_count[1]):
+            merged.counts[item] = count
+            merged.errors[item] = errors[item]
+        merged.heap = [(count, position, item) for position, (item, count) in enumerate(merged.counts.items())]
+        heapify(merged.heap)
+        merged.pushes = len(merged.heap)
+        return merged
@@ -0,0 +1,83 @@
+"""Hostname dictionary.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+"""
+from typing import Dict, Iterable, List, Optional, Set
+
+
+class HostnameDictionary():
+    """Maps each hostname to a dense integer id, so the aggregates can hold ids instead of strings."""
+    def __init__(self, hostnames: Iterable[str] = ()) -> None:
+        """Creates a dictionary with the given hostnames, whose ids are their positions.
+
+        Args:
+            hostnames: The initial hostnames.
+        """
+        self.hostnames: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for hostname in hostnames:
+            self.add(hostname)
+
+    def __len__(self) -> int:
+        """Returns the number of hostnames."""
+        return len(self.hostnames)
+
+    def add(self, hostname: str) -> int:
+        """Returns the id of hostname, adding it if it's new."""
+        hostname_id = self.ids.get(hostname)
+        if hostname_id is None:
+            hostname_id = self.ids[hostname] = len(self.hostnames)
+            self.hostnames.append(hostname)
+        return hostname_id
+
+    def get(self, hostname: str) -> Optional[int]:
+        """Returns the id of hostname or None if it isn't in the dictionary."""
+        return self.ids.get(hostname)
+
+    def hostname(self, hostname_id: int) -> str:
+        """Returns the hostname of the id."""
+        return self.hostnames[hostname_id]
+
+    def hostnames_of(self, hostname_ids: Iterable[int]) -> Set[str]:
+        """Returns the hostnames of the ids."""
+        return {self.hostnames[hostname_id] for hostname_id in hostname_ids}
+
+    def compact(self, hostname_ids: Iterable[int]) -> Dict[int, int]:
+        """Keeps only the hostnames of hostname_ids, renumbering them densely in the same order.
+
+        Returns the new id of each kept id.
+        """
+        kept_ids = sorted(set(hostname_ids))
+        self.hostnames = [self.hostnames[hostname_id] for hostname_id in kept_ids]
+        self.ids = {hostname: hostname_id for hostname_id, hostname in enumerate(self.hostnames)}
+        return {hostname_id: new_id for new_id, hostname_id in enumerate(kept_ids)}
+
+    def to_bytes(self) -> bytes:
+        """Returns the hostnames packed in bytes, in the order of their ids."""
+        return pack_hostnames(self.hostnames)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HostnameDictionary':
+        """Creates a dictionary from hostnames packed by to_bytes."""
+        return cls(unpack_hostnames(data))
+
+
+def pack_hostnames(hostnames: Iterable[str]) -> bytes:
+    """Packs hostnames in a single bytes object, cheaper to pickle than a set of strings."""
+    return "\n".join(hostnames).encode()
+
+
+def unpack_hostnames(data: bytes) -> List[str]:
+    """Unpacks the hostnames packed by pack_hostnames."""
+    return data.decode().split("\n") if data else []
+
+
+def pack_hours(hours: Dict[int, Set[str]]) -> bytes:
+    """Packs the hostnames of each hour like pack_hostnames, each one preceded by its hour."""
+    return "\n".join(f"{hour} {hostname}" for hour, hostnames in hours.items() for hostname in hostnames).encode()
+
+
+def unpack_hours(data: bytes, hours: Dict[int, Set[str]]) -> None:
+    """Adds the hostnames packed by pack_hours to the sets of their hours."""
+    for item in unpack_hostnames(data):
+        hour, hostname = item.split(" ", 1)
+        hours.setdefault(int(hour), set()).add(hostname)
@@ -0,0 +1,172 @@
+"""Log index.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+A sparse index that maps timestamps to byte offsets of a log file. It is stored next to the log in a
+sidecar file (``<input_file>.idx``) with a fixed header followed by two packed arrays: the maximum
+timestamp of the lines before each indexed offset and the offsets themselves.
+"""
+from array import array
+from bisect import bisect_left
+import os
+from struct import Struct
+from typing import Optional
+from zlib import crc32
+
+from log_parser.compression import compression_of
+from log_parser.config import INDEX_STRIDE
+
+INDEX_SUFFIX = ".idx"
+INDEX_MAGIC = b"LPIX"
+INDEX_VERSION = 1
+HEAD_BYTES = 4096
+_HEADER = Struct("<4sHIQQqIIIQ")
+
+
+def index_path(input_file: str) -> str:
+    """Returns the path of the index sidecar of input_file."""
+    return f"{input_file}{INDEX_SUFFIX}"
+
+
+def _head_crc(input_file: str, head_len: int) -> int:
+    """Returns the crc32 of the first head_len bytes of input_file."""
+    with open(input_file, 'rb') as f:
+        return crc32(f.read(head_len))
+
+
+class LogIndex():
+    """Sparse timestamp to byte offset index of a log file."""
+    def __init__(self, inode: int, stride: int = INDEX_STRIDE) -> None:
+        """Creates an empty index for the file with the given inode.
+
+        Args:
+            inode: The inode of the indexed file.
+            stride: Number of lines between two index entries.
+        """
+        self.inode = inode
+        self.stride = stride
+        self.size = 0
+        self.max_timestamp = -1
+        self.pending_lines = 0
+        self.head_len = 0
+        self.head_crc = 0
+        self.timestamps = array('q', [-1])
+        self.offsets = array('q', [0])
+
+    def offset_for(self, timestamp: int) -> int:
+        """Returns the offset of a line such that all lines before it have a timestamp lower than timestamp."""
+        return self.offsets[bisect_left(self.timestamps, timestamp) - 1]
+
+    def matches(self, input_file: str) -> bool:
+        """Checks that input_file is the indexed file, not rotated nor truncated since it was indexed."""
+        stat = os.stat(input_file)
+        if stat.st_ino != self.inode or stat.st_size < self.size:
+            return False
+        return _head_crc(input_file, self.head_len) == self.head_crc
+
+    def extend(self, input_file: str) -> bool:
+        """Indexes the lines appended to input_file since the last update.
+
+        Only complete lines are indexed, so a line being written is indexed in the next update.
+        Returns True if the index has changed.
+        """
+        size = self.size
+        with open(input_file, 'rb') as f:
+            f.seek(size)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                size += len(line)
+                self.max_timestamp = max(self.max_timestamp, int(line[:13]))
+                self.pending_lines += 1
+                if self.pending_lines == self.stride:
+                    self.timestamps.append(self.max_timestamp)
+                    self.offsets.append(size)
+                    self.pending_lines = 0
+        if size == self.size:
+            return False
+        self.size = size
+        if self.head_len < HEAD_BYTES:
+            self.head_len = min(HEAD_BYTES, size)
+            self.head_crc = _head_crc(input_file, self.head_len)
+        return True
+
+    def add(self, offset: int, max_timestamp: int) -> None:
+        """Adds an entry at offset, the end of lines read elsewhere (e.g. by a follower) up to max_timestamp.
+
+        The offsets before the end of the indexed lines are ignored. The lines aren't counted, so an index
+        updated this way is kept in memory and not extended from the file.
+        """
+        self.max_timestamp = max(self.max_timestamp, max_timestamp)
+        if offset <= self.size:
+            return
+        self.timestamps.append(self.max_timestamp)
+        self.offsets.append(offset)
+        self.size = offset
+
+    def save(self, input_file: str) -> None:
+        """Writes the index sidecar of input_file atomically."""
+        sidecar = index_path(input_file)
+        tmp_sidecar = f"{sidecar}.tmp"
+        with open(tmp_sidecar, 'wb') as f:
+            f.write(_HEADER.pack(
+                INDEX_MAGIC, INDEX_VERSION, self.stride, self.inode, self.size, self.max_timestamp,
+                self.pending_lines, self.head_len, self.head_crc, len(self.offsets)
+            ))
+            self.timestamps.tofile(f)
+            self.offsets.tofile(f)
+        os.replace(tmp_sidecar, sidecar)
+
+
+def load_index(input_file: str) -> Optional[LogIndex]:
+    """Reads the index sidecar of input_file, returns None if it doesn't exist or it isn't valid.
+
+    Args:
+        input_file: The indexed file.
+    """
+    try:
+        with open(index_path(input_file), 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return None
+            magic, version, stride, inode, size, max_timestamp, pending_lines, head_len, head_crc, entries = (
+                _HEADER.unpack(header))
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                return None
+            index = LogIndex(inode, stride)
+            index.timestamps = array('q')
+            index.offsets = array('q')
+            index.timestamps.fromfile(f, entries)
+            index.offsets.fromfile(f, entries)
+    except (OSError, EOFError):
+        return None
+    index.size = size
+    index.max_timestamp = max_timestamp
+    index.pending_lines = pending_lines
+    index.head_len = head_len
+    index.head_crc = head_crc
+    return index
+
+
+def refresh_index(input_file: str, stride: Optional[int] = None) -> LogIndex:
+    """Returns the up to date index of input_file, building or updating its sidecar if needed.
+
+    The index is extended incrementally when the file has grown by appending, and it's rebuilt
+    from scratch when the file has been rotated or truncated, or when another stride is requested.
+
+    Args:
+        input_file: The file to index.
+        stride: Number of lines between two index entries, if it's None the stride of the sidecar is kept
+            (INDEX_STRIDE for a new one). { default: None}
+    """
+    if compression_of(input_file) is not None:
+        raise ValueError(f"{input_file} is compressed, it can't be indexed")
+    index = load_index(input_file)
+    changed = False
+    if index is None or stride not in (None, index.stride) or not index.matches(input_file):
+        if stride is None:
+            stride = index.stride if index is not None else INDEX_STRIDE
+        index = LogIndex(os.stat(input_file).st_ino, stride)
+        changed = True
+    if index.extend(input_file) or changed:
+        index.save(input_file)
+    return index
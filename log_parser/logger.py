@@ -1,14 +1,39 @@
 """Logger class.
 ~~~~~~~~~~~~~~~~~~
+
+The records are put in a queue and written to the handlers by a background thread, so the parsing isn't
+blocked by the output. Each result is a single record with all its lines, and it can also be written to a
+results file (as a JSON line or as plain text) apart from the diagnostic logs. Importing the module has no
+side effects: the logs directory and the handlers are created on the first output.
 """
+import atexit
 from datetime import datetime
-from logging import DEBUG, Formatter, getLogger, INFO, StreamHandler
-from logging.handlers import RotatingFileHandler
+import json
+import logging
+from logging import DEBUG, FileHandler, Filter, Formatter, getLogger, Handler, INFO, LogRecord, StreamHandler
 from os import mkdir, path
-from typing import Dict
+from queue import SimpleQueue
+from typing import Any, cast, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from log_parser.config import BACKUP_COUNT, LOGS_DIR, MAX_BYTES, RESULTS_FILE, RESULTS_FORMAT
+from log_parser.constants import HOUR_TIMESTAMP, RESULTS_FORMATS
+
+if TYPE_CHECKING:  # pragma: no cover
+    from logging.handlers import QueueListener
+
+
+class _ResultFilter(Filter):
+    """Lets pass only the records of results."""
+    def filter(self, record: LogRecord) -> bool:
+        """Checks if the record is a result."""
+        return hasattr(record, 'result')
+
 
-from log_parser.config import BACKUP_COUNT, LOGS_DIR, MAX_BYTES
-from log_parser.constants import HOUR_TIMESTAMP
+class JsonResultFormatter(Formatter):
+    """Formats the result of a record as a JSON line."""
+    def format(self, record: LogRecord) -> str:
+        """Returns the result of the record in JSON."""
+        return json.dumps(record.result)  # type: ignore
 
 
 class Logger():
@@ -16,10 +41,31 @@ class Logger():
     def __init__(self) -> None:
         """Creates a logger instance.
 
-        This logger uses a RotationFileHandler with a limit of max_bytes.
+        Nothing is created until the first output: then the logs directory is created if it doesn't exist
+        and the handlers are opened. This logger uses a RotationFileHandler with a limit of max_bytes.
         """
-        if not path.isdir(LOGS_DIR):
-            mkdir(LOGS_DIR)
+        self.logs_dir = LOGS_DIR
+        self.handlers: List[Handler] = []
+        self.results_handler: Optional[Handler] = None
+        self.listener: Optional['QueueListener'] = None
+        self.queue: SimpleQueue = SimpleQueue()
+        self._logger: Optional[logging.Logger] = None
+        if RESULTS_FILE:
+            self.set_results_file(RESULTS_FILE, RESULTS_FORMAT)
+
+    @property
+    def logger(self) -> logging.Logger:
+        """Returns the logger of the package, creating its handlers on first use."""
+        if self._logger is None:
+            self._setup()
+        return cast(logging.Logger, self._logger)
+
+    def _setup(self) -> None:
+        """Creates the logs directory and the handlers and starts the thread that writes the records."""
+        from logging.handlers import QueueHandler, RotatingFileHandler
+
+        if not path.isdir(self.logs_dir):
+            mkdir(self.logs_dir)
         log_console_format = "%(message)s"
         log_file_format = "[%(levelname)s] - %(asctime)s - %(name)s - : %(message)s in %(pathname)s:%(lineno)d"
 
@@ -30,51 +76,151 @@ class Logger():
         console_handler.setLevel(INFO)
         console_handler.setFormatter(Formatter(log_console_format))
 
-        file_handler = RotatingFileHandler(f"{LOGS_DIR}/debug_logs.log", maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+        file_handler = RotatingFileHandler(
+            f"{self.logs_dir}/debug_logs.log", maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
         file_handler.setLevel(DEBUG)
         file_handler.setFormatter(Formatter(log_file_format))
 
-        file_handler_info = RotatingFileHandler(f"{LOGS_DIR}/info_logs.log", maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+        file_handler_info = RotatingFileHandler(
+            f"{self.logs_dir}/info_logs.log", maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
         file_handler_info.setLevel(INFO)
         file_handler_info.setFormatter(Formatter(log_console_format))
 
-        logger.addHandler(console_handler)
-        logger.addHandler(file_handler)
-        logger.addHandler(file_handler_info)
-        self.logger = logger
+        self.handlers = [console_handler, file_handler, file_handler_info]
+        logger.handlers = [QueueHandler(self.queue)]
+        self._logger = logger
+        self._start()
+        atexit.register(self.stop)
+
+    def _start(self) -> None:
+        """Starts the thread that writes the records to the handlers."""
+        from logging.handlers import QueueListener
+
+        handlers = self.handlers + ([self.results_handler] if self.results_handler else [])
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Writes the pending records and stops the thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def flush(self) -> None:
+        """Waits until the pending records are written."""
+        if self.listener is not None:
+            self.stop()
+            self._start()
+
+    def set_results_file(self, results_file: Optional[str], results_format: str = 'json') -> None:
+        """Writes the results also to results_file, apart from the diagnostic logs.
+
+        Args:
+            results_file: The file where the results are appended, None to stop writing them.
+            results_format: 'json' writes each result as a JSON line and 'text' as it's logged. { default: 'json'}
+        """
+        if results_format not in RESULTS_FORMATS:
+            raise ValueError(
+                f"Unknown results format {results_format}, it must be one of {', '.join(RESULTS_FORMATS)}")
+        running = self.listener is not None
+        self.stop()
+        if self.results_handler is not None:
+            self.results_handler.close()
+            self.results_handler = None
+        if results_file:
+            self.results_handler = FileHandler(results_file, delay=True)
+            self.results_handler.addFilter(_ResultFilter())
+            self.results_handler.setFormatter(
+                JsonResultFormatter() if results_format == 'json' else Formatter("%(message)s"))
+        if running:
+            self._start()
 
     def info(self, message: str) -> None:
         """Logs info message."""
         self.logger.info(message)
 
+    def warning(self, message: str) -> None:
+        """Logs warning message."""
+        self.logger.warning(message)
+
+    def log_result(self, lines: List[str], result: Any) -> None:
+        """Logs the lines of a result in a single record, result is what's written to the JSON results file."""
+        self.logger.info("\n".join(lines), extra={'result': result})
+
     def log_connected_hostnames(self, end_host: str, hostnames: set) -> None:
         """Logs connected hostnames."""
-        self.info("#" * 100)
-        self.info(f"The hostnames connected to {end_host} are:")
-        for hostname in hostnames:
-            self.info(f"- {hostname}")
-        self.info("#" * 100)
-
-    def log_resume_last_hour(self, init_timestamp: int, origin_host: str, end_host: str, state: Dict) -> None:
-        """Logs the resume of last hour."""
-        self.info("#" * 100)
+        lines = ["#" * 100, f"The hostnames connected to {end_host} are:"]
+        lines.extend(f"- {hostname}" for hostname in hostnames)
+        lines.append("#" * 100)
+        self.log_result(lines, {'hostname': end_host, 'hostnames': sorted(hostnames)})
+
+    def log_query_results(self, queries: Sequence[Tuple[str, int, int]], results: List[set]) -> None:
+        """Logs the result of each query as a JSON line."""
+        for (hostname, init_timestamp, end_timestamp), hostnames in zip(queries, results):
+            result = {
+                'hostname': hostname,
+                'init_timestamp': init_timestamp,
+                'end_timestamp': end_timestamp,
+                'hostnames': sorted(hostnames)
+            }
+            self.log_result([json.dumps(result)], result)
+
+    def log_resume_last_hour(self, init_timestamp: int, origin_host: str, end_host: str, state: Dict,
+                             window: int = HOUR_TIMESTAMP) -> None:
+        """Logs the resume of last hour (or of the last window if it's given)."""
+        init_datetime = datetime.fromtimestamp(init_timestamp / 1000)
+        end_datetime = datetime.fromtimestamp((init_timestamp + window) / 1000)
+        lines = ["#" * 100, f"From {init_datetime} to {end_datetime}", f"The hostnames connected to {end_host} are:"]
+        lines.extend(f"- {hostname}" for hostname in state['connected_to'])
+        lines.extend(("-" * 10, f"The hostnames that has been connected from {origin_host} are:"))
+        lines.extend(f"- {hostname}" for hostname in state['connected_from'])
+        lines.append("-" * 10)
+        result = {
+            'init_timestamp': init_timestamp,
+            'end_timestamp': init_timestamp + window,
+            'origin_host': origin_host,
+            'end_host': end_host,
+            'connected_to': sorted(state['connected_to']),
+            'connected_from': sorted(state['connected_from']),
+        }
+        if 'top_connections' in state:
+            lines.extend(self._top_connections_lines(state['top_connections']))
+            result['top_connections'] = [list(connections) for connections in state['top_connections']]
+        else:
+            max_connections = (
+                state['counter_connections'].most_common(1)[0][0] if state['counter_connections'] else None)
+            if max_connections:
+                lines.append(f"The hostname with more connections is {max_connections}")
+            else:
+                lines.append("There is no connections in the last hour")
+            result['max_connections'] = max_connections
+        lines.append("#" * 100)
+        self.log_result(lines, result)
+
+    def log_top_connections(self, init_timestamp: int, end_timestamp: int, top: List[Tuple[str, int]]) -> None:
+        """Logs the hostnames with more connections during a period with their number of connections."""
         init_datetime = datetime.fromtimestamp(init_timestamp / 1000)
-        end_datetime = datetime.fromtimestamp((init_timestamp + HOUR_TIMESTAMP) / 1000)
-        self.info(f"From {init_datetime} to {end_datetime}")
-        self.info(f"The hostnames connected to {end_host} are:")
-        for hostname in state['connected_to']:
-            self.info(f"- {hostname}")
-        self.info("-" * 10)
-        self.info(f"The hostnames that has been connected from {origin_host} are:")
-        for hostname in state['connected_from']:
-            self.info(f"- {hostname}")
-        self.info("-" * 10)
-        max_connections = state['counter_connections'].most_common(1)[0][0] if state['counter_connections'] else None
-        if max_connections:
-            self.info(f"The hostname with more connections is {max_connections}")
+        end_datetime = datetime.fromtimestamp(end_timestamp / 1000)
+        lines = ["#" * 100, f"From {init_datetime} to {end_datetime}"]
+        if top:
+            lines.append("The hostnames with more connections are:")
+            lines.extend(f"- {hostname}: {count} connections" for hostname, count in top)
         else:
-            self.info("There is no connections in the last hour")
-        self.info("#" * 100)
+            lines.append("There is no connections in the period")
+        lines.append("#" * 100)
+        self.log_result(lines, {
+            'init_timestamp': init_timestamp,
+            'end_timestamp': end_timestamp,
+            'top_connections': [list(connections) for connections in top],
+        })
+
+    def _top_connections_lines(self, top_connections: List[Tuple[str, int, int]]) -> List[str]:
+        """Returns the lines of the approximate hostnames with more connections, with the bounds of their counts."""
+        if not top_connections:
+            return ["There is no connections in the last hour"]
+        return ["The hostnames with more connections are:"] + [
+            f"- {hostname}: between {count - error} and {count} connections"
+            for hostname, count, error in top_connections]
 
 
 logger = Logger()
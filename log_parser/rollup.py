@@ -0,0 +1,484 @@
+"""Hourly rollups.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Pre-aggregates logs in hourly summaries of who connected to whom: the number of lines of each pair of
+origin and end hostnames during each hour. The resumes of unlimited for any pair of hosts and any past
+hour are computed from them without reading the logs again. The summaries are additive, so the logs are
+rolled up by hour-aligned byte shards in parallel and the lines appended later, even the late lines of an
+hour already rolled up, are just added to them.
+
+The rollups are saved to a binary file with a fixed header, the hostname dictionary, the sources rolled up
+and, for each hour, its pairs (packed origin and end ids) sorted with their counts, the same pairs sorted
+by end hostname and the number of connections of each hostname. A source is recognised by the crc32 of its
+first decompressed bytes, not by its inode, so a log that has been rotated and compressed is still the
+source already rolled up and only the bytes after the ones rolled up are read.
+"""
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import chain, islice, repeat
+import os
+from struct import error as struct_error, Struct
+from typing import Dict, IO, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from zlib import crc32
+
+from log_parser.columnar import is_columnar
+from log_parser.compression import compression_of, open_binary
+from log_parser.config import READ_BUFFER_SIZE
+from log_parser.connected_hostnames import _pool, split_ranges
+from log_parser.constants import HOUR_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.files import select_files
+from log_parser.hostnames import HostnameDictionary
+from log_parser.logger import logger
+from log_parser.seek import bisect_offset
+from log_parser.stats import starmap, stats
+
+ROLLUP_MAGIC = b"LPRU"
+ROLLUP_VERSION = 1
+HEAD_BYTES = 4096
+TAIL_BYTES = 4096
+ID_BITS = 32
+ID_SHIFT = 1 << ID_BITS
+ID_MASK = ID_SHIFT - 1
+_HEADER = Struct("<4sHIIQ")
+_SOURCE = Struct("<IIQ")
+_HOUR = Struct("<qII")
+
+PackedHours = Dict[int, Tuple[bytes, bytes, bytes]]
+
+
+class RolledRange(NamedTuple):
+    """The result of roll_range: the hostnames and hours packed by _pack_hours, the lines read and their end."""
+    hostnames: bytes
+    hours: PackedHours
+    lines: int
+    position: int
+
+
+class Source(NamedTuple):
+    """A log rolled up: the length and crc32 of its head and the number of (decompressed) bytes rolled up."""
+    head_len: int
+    head_crc: int
+    size: int
+
+
+def _host_counts(origins: List[int], ends: List[int], counts: List[int]) -> Dict[int, int]:
+    """Returns the connections of each hostname id, adding the count of each pair to its origin and its end."""
+    connections: Dict[int, int] = {}
+    get = connections.get
+    for origin, end, count in zip(origins, ends, counts):
+        connections[origin] = get(origin, 0) + count
+        connections[end] = get(end, 0) + count
+    return connections
+
+
+class HourRollup():
+    """The connections of an hour: the pairs of hostname ids with their number of lines."""
+    __slots__ = ('start', 'pairs', 'counts', 'end_pairs', 'host_ids', 'host_counts')
+
+    def __init__(self, start: int, pairs: array, counts: array, end_pairs: array, host_ids: array,
+                 host_counts: array) -> None:
+        """Creates the rollup of an hour from its arrays, see from_counts."""
+        self.start = start
+        self.pairs = pairs
+        self.counts = counts
+        self.end_pairs = end_pairs
+        self.host_ids = host_ids
+        self.host_counts = host_counts
+
+    @classmethod
+    def from_counts(cls, start: int, pair_counts: Dict[int, int]) -> 'HourRollup':
+        """Creates the rollup of the hour beginning at start from the number of lines of each pair.
+
+        A pair is the origin id shifted ID_BITS to the left plus the end id. The pairs are handled by
+        builtins (map, sorted) and the counts of each pair are added to its hostnames, so it takes a time
+        proportional to the pairs, not to the lines.
+        """
+        pairs = sorted(pair_counts)
+        counts = list(map(pair_counts.__getitem__, pairs))
+        origins = list(map(int.__rshift__, pairs, repeat(ID_BITS)))
+        ends = list(map(ID_MASK.__and__, pairs))
+        connections = _host_counts(origins, ends, counts)
+        host_ids = sorted(connections)
+        return cls(
+            start, array('q', pairs), array('I', counts),
+            array('q', sorted(map(int.__or__, map(ID_SHIFT.__mul__, ends), origins))),
+            array('I', host_ids), array('q', map(connections.__getitem__, host_ids)))
+
+    def merge(self, pair_counts: Dict[int, int]) -> None:
+        """Adds the number of lines of each pair.
+
+        The counts of the pairs and hostnames already in the hour are incremented in place, the new ones
+        are merged into the sorted arrays, so the hour isn't built again.
+        """
+        new_pairs = []
+        for pair, count in pair_counts.items():
+            position = bisect_left(self.pairs, pair)
+            if position < len(self.pairs) and self.pairs[position] == pair:
+                self.counts[position] += count
+            else:
+                new_pairs.append(pair)
+        connections = _host_counts(list(map(int.__rshift__, pair_counts, repeat(ID_BITS))),
+                                   list(map(ID_MASK.__and__, pair_counts)), list(pair_counts.values()))
+        new_host_ids = []
+        for hostname_id, count in connections.items():
+            position = bisect_left(self.host_ids, hostname_id)
+            if position < len(self.host_ids) and self.host_ids[position] == hostname_id:
+                self.host_counts[position] += count
+            else:
+                new_host_ids.append(hostname_id)
+        if new_pairs:
+            pairs = sorted(chain(zip(self.pairs, self.counts), zip(new_pairs, map(pair_counts.__getitem__, new_pairs))))
+            self.pairs, self.counts = array('q', [pair for pair, _ in pairs]), array('I', [count for _, count in pairs])
+            self.end_pairs = array('q', sorted(chain(self.end_pairs, (
+                (pair & ID_MASK) << ID_BITS | pair >> ID_BITS for pair in new_pairs))))
+        if new_host_ids:
+            hosts = sorted(chain(zip(self.host_ids, self.host_counts),
+                                 zip(new_host_ids, map(connections.__getitem__, new_host_ids))))
+            self.host_ids = array('I', [hostname_id for hostname_id, _ in hosts])
+            self.host_counts = array('q', [count for _, count in hosts])
+
+    @staticmethod
+    def _others(pairs: array, hostname_id: int) -> List[int]:
+        """Returns the second ids of the sorted pairs whose first id is hostname_id."""
+        start = bisect_left(pairs, hostname_id << ID_BITS)
+        end = bisect_left(pairs, (hostname_id + 1) << ID_BITS, start)
+        return [pair & ID_MASK for pair in pairs[start:end]]
+
+    def connected_to(self, end_id: int) -> List[int]:
+        """Returns the ids of the hostnames connected to end_id."""
+        return self._others(self.end_pairs, end_id)
+
+    def connected_from(self, origin_id: int) -> List[int]:
+        """Returns the ids of the hostnames connected from origin_id."""
+        return self._others(self.pairs, origin_id)
+
+
+class Rollups():
+    """The hourly rollups of some logs."""
+    def __init__(self) -> None:
+        """Creates empty rollups."""
+        self.hostnames = HostnameDictionary()
+        self.sources: List[Source] = []
+        self.hours: Dict[int, HourRollup] = {}
+
+    def find_source(self, head: bytes) -> Optional[int]:
+        """Returns the position in sources of the log that begins with head, or None if it isn't rolled up."""
+        for position, source in enumerate(self.sources):
+            if len(head) >= source.head_len and crc32(head[:source.head_len]) == source.head_crc:
+                return position
+        return None
+
+    def add(self, start: int, pair_counts: Dict[int, int]) -> None:
+        """Adds the number of lines of each pair to the hour beginning at start."""
+        hour = self.hours.get(start)
+        if hour is None:
+            self.hours[start] = HourRollup.from_counts(start, pair_counts)
+        else:
+            hour.merge(pair_counts)
+
+    def state(self, origin_host: str, end_host: str, int_timestamp: int, end_timestamp: int) -> Dict:
+        """Returns the aggregates of the hours in [int_timestamp, end_timestamp) like SlidingWindow.state."""
+        origin_id = self.hostnames.get(origin_host)
+        end_id = self.hostnames.get(end_host)
+        connected_to: set = set()
+        connected_from: set = set()
+        connections: Counter = Counter()
+        for start in range(int_timestamp, end_timestamp, HOUR_TIMESTAMP):
+            hour = self.hours.get(start)
+            if hour is None:
+                continue
+            if end_id is not None:
+                connected_to.update(hour.connected_to(end_id))
+            if origin_id is not None:
+                connected_from.update(hour.connected_from(origin_id))
+            for hostname_id, count in zip(hour.host_ids, hour.host_counts):
+                connections[hostname_id] += count
+        hostname = self.hostnames.hostname
+        return {
+            'connected_to': self.hostnames.hostnames_of(connected_to),
+            'connected_from': self.hostnames.hostnames_of(connected_from),
+            'counter_connections': Counter({
+                hostname(hostname_id): count for hostname_id, count in connections.items()}),
+        }
+
+    def save(self, rollup_file: str) -> None:
+        """Writes the rollups atomically, with the hours sorted."""
+        table = self.hostnames.to_bytes()
+        tmp_rollup_file = f"{rollup_file}.tmp"
+        with open(tmp_rollup_file, 'wb') as f:
+            f.write(_HEADER.pack(ROLLUP_MAGIC, ROLLUP_VERSION, len(self.sources), len(self.hours), len(table)))
+            f.write(table)
+            for source in self.sources:
+                f.write(_SOURCE.pack(*source))
+            for start in sorted(self.hours):
+                hour = self.hours[start]
+                f.write(_HOUR.pack(start, len(hour.pairs), len(hour.host_ids)))
+                for column in (hour.pairs, hour.counts, hour.end_pairs, hour.host_ids, hour.host_counts):
+                    column.tofile(f)
+        os.replace(tmp_rollup_file, rollup_file)
+
+
+def is_rollup(input_file: str) -> bool:
+    """Checks if input_file is a rollup file."""
+    with open(input_file, 'rb') as f:
+        return f.read(len(ROLLUP_MAGIC)) == ROLLUP_MAGIC
+
+
+def _read_array(f: IO[bytes], typecode: str, length: int) -> array:
+    """Reads an array of length items of typecode from f."""
+    column = array(typecode)
+    column.fromfile(f, length)
+    return column
+
+
+def load_rollups(rollup_file: str) -> Rollups:
+    """Reads the rollups, returns empty ones if the file doesn't exist.
+
+    Unlike the result cache, the rollups may be the only copy of logs already deleted, so a file that isn't
+    valid raises a ValueError instead of being replaced.
+
+    Args:
+        rollup_file: The file to read.
+    """
+    rollups = Rollups()
+    if not os.path.exists(rollup_file):
+        return rollups
+    if not is_rollup(rollup_file):
+        raise ValueError(f"{rollup_file} isn't a rollup file")
+    try:
+        with open(rollup_file, 'rb') as f:
+            _, version, sources_len, hours_len, table_len = _HEADER.unpack(f.read(_HEADER.size))
+            if version != ROLLUP_VERSION:
+                raise ValueError(f"unsupported version {version}")
+            rollups.hostnames = HostnameDictionary.from_bytes(f.read(table_len))
+            rollups.sources = [Source(*_SOURCE.unpack(f.read(_SOURCE.size))) for _ in range(sources_len)]
+            for _ in range(hours_len):
+                start, pairs_len, hosts_len = _HOUR.unpack(f.read(_HOUR.size))
+                rollups.hours[start] = HourRollup(
+                    start, _read_array(f, 'q', pairs_len), _read_array(f, 'I', pairs_len),
+                    _read_array(f, 'q', pairs_len), _read_array(f, 'I', hosts_len), _read_array(f, 'q', hosts_len))
+    except (ValueError, EOFError, struct_error) as error:
+        raise ValueError(f"{rollup_file} isn't a valid rollup file: {error}") from None
+    return rollups
+
+
+def _count_lines(lines: List[bytes], hours: Dict[int, Counter]) -> None:
+    """Counts the lines of each pair of hostnames (the line without its timestamp) in the counter of its hour.
+
+    The lines of the hour of the first line are counted at once comparing their timestamps as bytes, then
+    the ones left, usually none or the few lines out of order around an hour boundary, the same way.
+    """
+    while lines:
+        hour = int(lines[0][:13]) // HOUR_TIMESTAMP * HOUR_TIMESTAMP
+        init_bytes, end_bytes = b"%013d" % hour, b"%013d" % (hour + HOUR_TIMESTAMP)
+        counter = hours.get(hour)
+        if counter is None:
+            counter = hours[hour] = Counter()
+        pairs = [line[14:] for line in lines if init_bytes <= line < end_bytes]
+        counter.update(pairs)
+        lines = [line for line in lines if not init_bytes <= line < end_bytes] if len(pairs) < len(lines) else []
+
+
+def _pack_hours(hours: Dict[int, Counter]) -> Tuple[bytes, PackedHours]:
+    """Packs the counters of the hours: the hostnames seen and the origin ids, end ids and counts of each hour.
+
+    The pairs are split all at once and only the new hostnames are handled one by one.
+    """
+    ids: Dict[bytes, int] = {}
+    packed_hours = {}
+    for hour, counter in hours.items():
+        hostnames = b" ".join(counter).split(b" ")
+        if len(hostnames) != 2 * len(counter):
+            raise ValueError("Invalid line, the lines must be 'timestamp origin_host end_host'")
+        new_hostnames = [hostname for hostname in dict.fromkeys(hostnames) if hostname not in ids]
+        ids.update(zip(new_hostnames, range(len(ids), len(ids) + len(new_hostnames))))
+        hostname_ids = array('I', map(ids.__getitem__, hostnames))
+        packed_hours[hour] = (
+            hostname_ids[0::2].tobytes(), hostname_ids[1::2].tobytes(), array('I', counter.values()).tobytes())
+    return b"\n".join(ids), packed_hours
+
+
+def roll_range(input_file: str, start: int, end: Optional[int] = None) -> RolledRange:
+    """Counts the lines of each pair of hostnames and hour in the range [start, end) of the bytes of input_file.
+
+    The bytes are the decompressed ones if input_file is compressed. The range is read in chunks of
+    READ_BUFFER_SIZE bytes, counting the lines of each chunk at once.
+
+    Args:
+        input_file: The file to read.
+        start: The offset of the first line to read.
+        end: The end of the range, the beginning of a line. { default: None, up to the last complete line}
+    """
+    compression = compression_of(input_file)
+    hours: Dict[int, Counter] = {}
+    position = start
+    lines = 0
+    with open_binary(input_file, compression) as f:
+        if compression is None:
+            f.seek(start)
+        else:
+            skipped = 0
+            while skipped < start:
+                skipped_bytes = len(f.read(min(READ_BUFFER_SIZE, start - skipped)))
+                if not skipped_bytes:
+                    break
+                skipped += skipped_bytes
+        remaining = None if end is None else end - start
+        tail = b""
+        while remaining is None or remaining > 0:
+            chunk = f.read(READ_BUFFER_SIZE if remaining is None else min(READ_BUFFER_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            chunk = tail + chunk
+            lines_end = chunk.rfind(b"\n") + 1
+            tail = chunk[lines_end:]
+            chunk_lines = chunk[:lines_end].splitlines()
+            lines += len(chunk_lines)
+            _count_lines(chunk_lines, hours)
+            position += lines_end
+    stats.count(lines=lines, bytes_read=position - start)
+    return RolledRange(*_pack_hours(hours), lines, position)
+
+
+def _lines_end(input_file: str) -> int:
+    """Returns the end of the last complete line of an uncompressed file."""
+    size = os.path.getsize(input_file)
+    with open(input_file, 'rb') as f:
+        f.seek(max(size - TAIL_BYTES, 0))
+        tail = f.read()
+    return size - len(tail) + tail.rfind(b"\n") + 1 if b"\n" in tail else 0
+
+
+def split_hours(input_file: str, start: int, end: int, batch_size: int) -> List[Tuple[int, int]]:
+    """Splits the range [start, end) of input_file into byte ranges that begin near the hour boundaries.
+
+    Each range holds the lines of about an hour, so its counters are merged with few others, but any
+    boundary between lines is valid: the lines out of order just go to the counter of their hour.
+
+    Args:
+        input_file: The uncompressed file to split.
+        start: The beginning of the first line of the range.
+        end: The end of the range, the end of a line.
+        batch_size: The hours with more lines are split in ranges of about batch_size lines.
+    """
+    if start >= end:
+        return []
+    boundaries = [start]
+    with open(input_file, 'rb') as f:
+        f.seek(start)
+        first_timestamp = int(f.readline()[:13])
+        f.seek(max(end - TAIL_BYTES, start))
+        tail = f.read(end - f.tell())
+        last_timestamp = int(tail[tail.rfind(b"\n", 0, len(tail) - 1) + 1:][:13])
+        for hour in range(first_timestamp - first_timestamp % HOUR_TIMESTAMP + HOUR_TIMESTAMP, last_timestamp + 1,
+                          HOUR_TIMESTAMP):
+            offset = bisect_offset(f, hour + TIMESTAMP_MARGIN, end)
+            if boundaries[-1] < offset < end:
+                boundaries.append(offset)
+    boundaries.append(end)
+    return [
+        shard for hour_start, hour_end in zip(boundaries[:-1], boundaries[1:])
+        for shard in split_ranges(input_file, hour_start, batch_size, hour_end)
+    ]
+
+
+def _merge(rollups: Rollups, results: Iterable[RolledRange]) -> Dict[int, Dict[int, int]]:
+    """Merges the results of roll_range by hour, translating their hostname ids to the ones of rollups."""
+    hours: Dict[int, Dict[int, int]] = {}
+    for result in results:
+        translate = [
+            rollups.hostnames.add(hostname) for hostname in result.hostnames.decode().split("\n")
+        ] if result.hostnames else []
+        for hour, (packed_origins, packed_ends, packed_counts) in result.hours.items():
+            origins, ends, counts = array('I'), array('I'), array('I')
+            origins.frombytes(packed_origins)
+            ends.frombytes(packed_ends)
+            counts.frombytes(packed_counts)
+            pairs = map(int.__or__, map(ID_SHIFT.__mul__, map(translate.__getitem__, origins)),
+                        map(translate.__getitem__, ends))
+            pair_counts = hours.get(hour)
+            if pair_counts is None:
+                # The ranges begin at the hour boundaries, so most hours come from a single range
+                hours[hour] = dict(zip(pairs, counts))
+                continue
+            for pair, count in zip(pairs, counts):
+                pair_counts[pair] = pair_counts.get(pair, 0) + count
+    return hours
+
+
+def build_rollups(input_path: str, rollup_file: str, use_multithread: bool = False, workers: int = 8,
+                  batch_size: int = 200000) -> int:
+    """Rolls up the lines of the logs of input_path not rolled up yet in rollup_file, returns their number.
+
+    Args:
+        input_path: The log, or a directory or a glob of logs (they can be compressed).
+        rollup_file: The rollup file, it's created if it doesn't exist.
+        use_multithread: If it's True the uncompressed logs are split in hour-aligned byte ranges, and the
+            hours with more than batch_size lines in several ranges, that are rolled up in parallel together
+            with the compressed logs, each one by a single worker. { default: False}
+        workers: Number of workers to use if multithreading it's enabled. { default: 8}
+        batch_size: Approximate number of lines of the ranges (used only in multithreading). { default: 200000}
+    """
+    rollups = load_rollups(rollup_file)
+    tasks: List[Tuple[str, int, Optional[int]]] = []
+    sources: List[Tuple[Optional[int], bytes, int]] = []
+    with stats.timer('split'):
+        for span in select_files(input_path):
+            if is_columnar(span.path):
+                continue
+            compression = compression_of(span.path)
+            with open_binary(span.path, compression) as f:
+                head = f.read(HEAD_BYTES)
+            position = rollups.find_source(head)
+            offset = rollups.sources[position].size if position is not None else 0
+            if compression is not None:
+                ranges: Sequence[Tuple[int, Optional[int]]] = [(offset, None)]
+            elif use_multithread:
+                ranges = split_hours(span.path, offset, _lines_end(span.path), batch_size)
+            else:
+                ranges = [(offset, _lines_end(span.path))]
+            tasks.extend((span.path, start, end) for start, end in ranges)
+            sources.append((position, head, len(ranges)))
+    with stats.timer('scan'):
+        if use_multithread and len(tasks) > 1:
+            with _pool(workers) as p:
+                results = starmap(p, roll_range, tasks)
+        else:
+            results = [roll_range(*task) for task in tasks]
+    with stats.timer('merge'):
+        for hour, pair_counts in _merge(rollups, results).items():
+            rollups.add(hour, pair_counts)
+        source_results = iter(results)
+        for position, head, ranges_len in sources:
+            size = max((result.position for result in islice(source_results, ranges_len)), default=0)
+            if position is None and size:
+                rollups.sources.append(Source(min(len(head), size), crc32(head[:size]), size))
+            elif position is not None and size > rollups.sources[position].size:
+                rollups.sources[position] = Source(min(len(head), size), crc32(head[:size]), size)
+        rollups.save(rollup_file)
+    return sum(result.lines for result in results)
+
+
+def report_rollups(rollup_file: str, origin_host: str, end_host: str, init_timestamp: int, end_timestamp: int,
+                   window: int = HOUR_TIMESTAMP, slide: int = HOUR_TIMESTAMP) -> None:
+    """Logs the resume of each period from the rollups, like unlimited does while reading the logs.
+
+    Args:
+        rollup_file: The rollup file to read.
+        origin_host: The hostname to report the list of hostnames connected from.
+        end_host: The hostname to report the list of hostnames connected to.
+        init_timestamp: The beginning of the first period, the beginning of an hour.
+        end_timestamp: The periods that end after it aren't reported.
+        window: The length of each period, a multiple of an hour. { default: HOUR_TIMESTAMP}
+        slide: The time between the beginnings of two periods, a multiple of an hour. { default: HOUR_TIMESTAMP}
+    """
+    if init_timestamp % HOUR_TIMESTAMP or window % HOUR_TIMESTAMP or slide % HOUR_TIMESTAMP:
+        raise ValueError("The rollups are hourly, the periods must begin at an hour and last whole hours")
+    rollups = load_rollups(rollup_file)
+    for window_start in range(init_timestamp, end_timestamp - window + 1, slide):
+        logger.log_resume_last_hour(
+            window_start, origin_host, end_host,
+            rollups.state(origin_host, end_host, window_start, window_start + window), window=window)
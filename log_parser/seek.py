@@ -0,0 +1,98 @@
+"""Seek helpers.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+"""
+from mmap import mmap
+from os import path
+from typing import IO, Optional, Tuple, Union
+
+from log_parser.compression import compression_of
+from log_parser.constants import TIMESTAMP_MARGIN
+
+BinaryFile = Union[IO[bytes], mmap]
+
+
+def _line_at(f: BinaryFile, offset: int) -> Tuple[int, Optional[int]]:
+    """Returns the start and the timestamp of the first line beginning at or after offset.
+
+    The timestamp is None when there is no complete line after offset.
+    """
+    if offset > 0:
+        f.seek(offset - 1)
+        f.readline()
+    else:
+        f.seek(0)
+    start = f.tell()
+    line = f.readline()
+    if not line.endswith(b"\n"):
+        return start, None
+    return start, int(line[:13])
+
+
+def _bisect(f: BinaryFile, target: int, size: int) -> Tuple[int, int]:
+    """Bisects f looking for the first line with a timestamp greater or equal than target.
+
+    Returns two offsets, the first line beginning at or after the first one has a timestamp lower than target
+    (or the offset is 0) and the first line beginning at or after the second one has a timestamp greater or
+    equal than target (or there is no complete line after it).
+    """
+    low, high = 0, size
+    while high - low > 1:
+        middle = (low + high) // 2
+        _, middle_timestamp = _line_at(f, middle)
+        if middle_timestamp is None or middle_timestamp >= target:
+            high = middle
+        else:
+            low = middle
+    return low, high
+
+
+def bisect_offset(f: BinaryFile, timestamp: int, size: Optional[int] = None) -> int:
+    """Returns the offset of a line that starts before any line with a timestamp greater or equal than timestamp.
+
+    The file is bisected on the 13-digit timestamp prefix of the lines. The returned offset is always the
+    start of a line whose timestamp is lower than timestamp - TIMESTAMP_MARGIN (or 0), so assuming that lines
+    are never more than TIMESTAMP_MARGIN out of order, no line with a timestamp greater or equal than
+    timestamp is before it.
+
+    Args:
+        f: The file to bisect, opened in binary mode or memory mapped.
+        timestamp: The timestamp to look for.
+        size: The size of the file. { default: the size of f}
+    """
+    if size is None:
+        f.seek(0, 2)
+        size = f.tell()
+    low, _ = _bisect(f, timestamp - TIMESTAMP_MARGIN, size)
+    return _line_at(f, low)[0]
+
+
+def bisect_end_offset(f: BinaryFile, timestamp: int, size: Optional[int] = None) -> int:
+    """Returns the offset of a line that starts after any line with a timestamp lower or equal than timestamp.
+
+    The returned offset is the start of a line whose timestamp is greater than timestamp + TIMESTAMP_MARGIN,
+    or the end of the complete lines of the file, so assuming that lines are never more than TIMESTAMP_MARGIN
+    out of order, no line with a timestamp lower or equal than timestamp is after it.
+
+    Args:
+        f: The file to bisect, opened in binary mode or memory mapped.
+        timestamp: The timestamp to look for.
+        size: The size of the file. { default: the size of f}
+    """
+    if size is None:
+        f.seek(0, 2)
+        size = f.tell()
+    _, high = _bisect(f, timestamp + TIMESTAMP_MARGIN + 1, size)
+    return _line_at(f, high)[0]
+
+
+def find_offset(input_file: str, timestamp: int) -> int:
+    """Returns the offset where a scan of input_file looking for lines from timestamp can start.
+
+    Args:
+        input_file: The file to bisect.
+        timestamp: The timestamp to look for.
+    """
+    if compression_of(input_file) is not None:
+        raise ValueError(f"{input_file} is compressed, it can't be bisected")
+    with open(input_file, 'rb') as f:
+        return bisect_offset(f, timestamp, path.getsize(input_file))
@@ -0,0 +1,350 @@
+"""Query server.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Keeps a log resident in memory to answer many queries without reading it again: an asyncio server, on a
+Unix socket (``<input_file>.sock`` by default) or a TCP port, follows the log and keeps its index, the
+hostname dictionary and the aggregates of its last hours up to date. Each connection is served by its own
+task, so the clients are answered concurrently while the log is read.
+
+The aggregates of each hour are the hostnames connected to each host, in the whole hour and in each
+minute, and the connections of each host by minute, so their size depends on the distinct hostnames of
+each minute and not on the lines. The hours that a period covers partially are answered with the minutes
+it covers, and the minutes it covers partially are read from the log through the index. The hours older
+than the retention are evicted; the connected queries that reach them are answered scanning the log
+from the index too. The log is read in the default executor, so the other clients and the reading go on
+meanwhile.
+
+The protocol is a JSON line per query and per response, see ResidentLog.answer and client.
+"""
+import asyncio
+from collections import Counter
+import json
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from log_parser.client import socket_path
+from log_parser.columnar import is_columnar
+from log_parser.compression import compression_of, open_log
+from log_parser.config import SERVER_RETENTION
+from log_parser.connected_hostnames import process_batch
+from log_parser.constants import HOUR_TIMESTAMP, MINUTE_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.files import is_multiple
+from log_parser.follow import Follower
+from log_parser.hostnames import HostnameDictionary
+from log_parser.index import LogIndex, refresh_index
+from log_parser.logger import logger
+from log_parser.stats import stats
+
+
+def _partial_minutes(int_timestamp: int, end_timestamp: int) -> List[Tuple[int, int]]:
+    """Returns the parts of [int_timestamp, end_timestamp) that cover a minute partially."""
+    if int_timestamp >= end_timestamp:
+        return []
+    first_minute = int_timestamp - int_timestamp % MINUTE_TIMESTAMP
+    last_minute = end_timestamp - end_timestamp % MINUTE_TIMESTAMP
+    if first_minute == last_minute:
+        return [(int_timestamp, end_timestamp)]
+    partial_minutes = []
+    if int_timestamp != first_minute:
+        partial_minutes.append((int_timestamp, first_minute + MINUTE_TIMESTAMP))
+    if end_timestamp != last_minute:
+        partial_minutes.append((last_minute, end_timestamp))
+    return partial_minutes
+
+
+class HourAggregate():
+    """The connections of an hour, with the hostnames as ids."""
+    __slots__ = ('start', 'origins', 'minute_origins', 'minutes', 'connections')
+
+    def __init__(self, start: int) -> None:
+        """Creates the empty aggregate of the hour beginning at start."""
+        self.start = start
+        self.origins: Dict[int, Set[int]] = {}
+        self.minute_origins: Dict[int, Dict[int, Set[int]]] = {}
+        self.minutes: List[Counter] = [Counter() for _ in range(HOUR_TIMESTAMP // MINUTE_TIMESTAMP)]
+        self.connections: Counter = Counter()
+
+    def add(self, timestamp: int, origin_id: int, end_id: int) -> None:
+        """Adds a connection from origin_id to end_id."""
+        origins = self.origins.get(end_id)
+        if origins is None:
+            origins = self.origins[end_id] = set()
+            self.minute_origins[end_id] = {}
+        origins.add(origin_id)
+        minute_index = (timestamp - self.start) // MINUTE_TIMESTAMP
+        minute_origins = self.minute_origins[end_id].get(minute_index)
+        if minute_origins is None:
+            minute_origins = self.minute_origins[end_id][minute_index] = set()
+        minute_origins.add(origin_id)
+        minute = self.minutes[minute_index]
+        minute[origin_id] += 1
+        minute[end_id] += 1
+        self.connections[origin_id] += 1
+        self.connections[end_id] += 1
+
+    def covered(self, int_timestamp: int, end_timestamp: int) -> bool:
+        """Checks if the hour is within [int_timestamp, end_timestamp)."""
+        return int_timestamp <= self.start and self.start + HOUR_TIMESTAMP <= end_timestamp
+
+    def connected(self, end_id: int, int_timestamp: int, end_timestamp: int) -> Set[int]:
+        """Returns the ids of the hostnames connected to end_id during the whole minutes within the period."""
+        if self.covered(int_timestamp, end_timestamp):
+            return self.origins.get(end_id, set())
+        first_minute = -(-(int_timestamp - self.start) // MINUTE_TIMESTAMP)
+        last_minute = (end_timestamp - self.start) // MINUTE_TIMESTAMP
+        origin_ids: Set[int] = set()
+        for minute_index, minute_origins in self.minute_origins.get(end_id, {}).items():
+            if first_minute <= minute_index < last_minute:
+                origin_ids |= minute_origins
+        return origin_ids
+
+    def minute_connected(self, end_id: int, timestamp: int) -> Set[int]:
+        """Returns the ids of the hostnames connected to end_id during the minute of timestamp."""
+        return self.minute_origins.get(end_id, {}).get((timestamp - self.start) // MINUTE_TIMESTAMP, set())
+
+    def top(self, int_timestamp: int, end_timestamp: int) -> Counter:
+        """Returns the connections of each hostname id during the minutes that overlap the period."""
+        if self.covered(int_timestamp, end_timestamp):
+            return self.connections
+        first_minute = max(int_timestamp - self.start, 0) // MINUTE_TIMESTAMP
+        last_minute = -(-(min(end_timestamp, self.start + HOUR_TIMESTAMP) - self.start) // MINUTE_TIMESTAMP)
+        connections: Counter = Counter()
+        for minute in self.minutes[first_minute:last_minute]:
+            connections.update(minute)
+        return connections
+
+
+class ResidentLog():
+    """The aggregates of the last hours of a log, updated as it's read."""
+    def __init__(self, input_file: str, retention: int = SERVER_RETENTION, index: Optional[LogIndex] = None) -> None:
+        """Creates the resident log of input_file, the lines must be added from the first retained hour.
+
+        Args:
+            input_file: The log.
+            retention: The number of hours kept in memory. { default: SERVER_RETENTION}
+            index: The index of the log. { default: an empty index}
+        """
+        if retention < 1:
+            raise ValueError("The retention must be at least one hour")
+        self.input_file = input_file
+        self.retention = retention
+        self.index = index if index is not None else LogIndex(os.stat(input_file).st_ino)
+        self.hostnames = HostnameDictionary()
+        self.hours: Dict[int, HourAggregate] = {}
+        self.lines = 0
+        self.max_timestamp = max(self.index.max_timestamp, 0)
+        self.retained_from = 0
+        self.scan_from = 0
+        self._evict()
+
+    def _evict(self) -> None:
+        """Drops the hours out of the retention, once the margin of the lines after them is over."""
+        last_timestamp = self.max_timestamp - TIMESTAMP_MARGIN
+        retained_from = last_timestamp - last_timestamp % HOUR_TIMESTAMP - (self.retention - 1) * HOUR_TIMESTAMP
+        if retained_from <= self.retained_from:
+            return
+        self.retained_from = retained_from
+        for hour in [hour for hour in self.hours if hour < retained_from]:
+            del self.hours[hour]
+
+    def add_lines(self, lines: List[str]) -> None:
+        """Adds the connections of lines, the lines of the hours already evicted are ignored."""
+        hostnames, hours = self.hostnames, self.hours
+        max_timestamp = self.max_timestamp
+        retained_from = self.retained_from
+        for line in lines:
+            timestamp_str, origin, end = line.split()
+            timestamp = int(timestamp_str)
+            if timestamp > max_timestamp:
+                max_timestamp = timestamp
+            if timestamp < retained_from:
+                continue
+            hour = timestamp - timestamp % HOUR_TIMESTAMP
+            aggregate = hours.get(hour)
+            if aggregate is None:
+                aggregate = hours[hour] = HourAggregate(hour)
+            aggregate.add(timestamp, hostnames.add(origin), hostnames.add(end))
+        self.lines += len(lines)
+        self.max_timestamp = max_timestamp
+        self._evict()
+
+    def restart(self, inode: int) -> None:
+        """Starts a new index when the log has been rotated or truncated.
+
+        The lines read before aren't in the log any more, so the hours evicted from now on can only be
+        scanned again from the first line after them.
+        """
+        self.index = LogIndex(inode)
+        self.scan_from = self.max_timestamp + 1
+
+    def _hours(self, int_timestamp: int, end_timestamp: int) -> List[HourAggregate]:
+        """Returns the aggregates of the hours that overlap [int_timestamp, end_timestamp)."""
+        return [
+            aggregate for hour, aggregate in self.hours.items()
+            if hour < end_timestamp and int_timestamp < hour + HOUR_TIMESTAMP
+        ]
+
+    async def _scan(self, hostname: str, int_timestamp: int, end_timestamp: int) -> set:
+        """Returns the hostnames connected to hostname during a period out of the retention reading the log.
+
+        The log is read in the default executor, from the offset of the index taken here.
+        """
+        if int_timestamp < self.scan_from:
+            raise ValueError(f"The lines before {self.scan_from} aren't in {self.input_file} any more")
+        return await asyncio.get_running_loop().run_in_executor(
+            None, _scan_log, self.input_file, self.index.offset_for(int_timestamp), int_timestamp, end_timestamp,
+            hostname)
+
+    async def connected(self, hostname: str, int_timestamp: int, end_timestamp: int) -> set:
+        """Returns the hostnames connected to hostname during [int_timestamp, end_timestamp).
+
+        The minutes covered partially are read from the log, unless it has been rotated since their lines
+        were read, then they are answered whole.
+        """
+        hostnames: set = set()
+        end_id = self.hostnames.get(hostname)
+        if end_id is not None:
+            origin_ids: Set[int] = set()
+            for aggregate in self._hours(int_timestamp, end_timestamp):
+                origin_ids |= aggregate.connected(end_id, int_timestamp, end_timestamp)
+            for minute_init, minute_end in _partial_minutes(max(int_timestamp, self.retained_from), end_timestamp):
+                hour = self.hours.get(minute_init - minute_init % HOUR_TIMESTAMP)
+                if hour is None or not hour.minute_connected(end_id, minute_init) - origin_ids:
+                    continue
+                if minute_init < self.scan_from:
+                    origin_ids |= hour.minute_connected(end_id, minute_init)
+                else:
+                    hostnames |= await self._scan(hostname, minute_init, minute_end)
+            hostnames |= self.hostnames.hostnames_of(origin_ids)
+        if int_timestamp < self.retained_from:
+            hostnames |= await self._scan(hostname, int_timestamp, min(end_timestamp, self.retained_from))
+        return hostnames
+
+    def top(self, int_timestamp: int, end_timestamp: int, k: int = 1) -> List[Tuple[str, int]]:
+        """Returns the k hostnames with more connections, counting the whole minutes that overlap the period."""
+        if int_timestamp < self.retained_from:
+            raise ValueError(f"The connections before {self.retained_from} aren't retained")
+        connections: Counter = Counter()
+        for aggregate in self._hours(int_timestamp, end_timestamp):
+            connections.update(aggregate.top(int_timestamp, end_timestamp))
+        return [(self.hostnames.hostname(hostname_id), count) for hostname_id, count in connections.most_common(k)]
+
+    def status(self) -> Dict[str, Any]:
+        """Returns what's kept in memory."""
+        return {
+            'input_file': self.input_file,
+            'lines': self.lines,
+            'hostnames': len(self.hostnames),
+            'hours': sorted(self.hours),
+            'retained_from': self.retained_from,
+            'max_timestamp': self.max_timestamp,
+        }
+
+    async def answer(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the response to a query.
+
+        The queries are dictionaries with the kind of query in 'query':
+           - connected, with hostname, init_timestamp and end_timestamp, is answered with the hostnames
+             connected to hostname like the connected command.
+           - top, with init_timestamp, end_timestamp and optionally k (1 by default), is answered with the
+             k hostnames with more connections and their counts, by whole minutes.
+           - status is answered with what's kept in memory.
+        """
+        kind = query.get('query')
+        if kind == 'connected':
+            hostnames = await self.connected(
+                query['hostname'], int(query['init_timestamp']), int(query['end_timestamp']))
+            return {'hostname': query['hostname'], 'hostnames': sorted(hostnames)}
+        if kind == 'top':
+            top = self.top(int(query['init_timestamp']), int(query['end_timestamp']), int(query.get('k', 1)))
+            return {'top': [list(connections) for connections in top]}
+        if kind == 'status':
+            return self.status()
+        raise ValueError(f"Unknown query {kind}")
+
+    async def respond(self, line: bytes) -> Dict[str, Any]:
+        """Returns the response to a JSON line, with the error if the query isn't valid or the log can't be read."""
+        try:
+            return await self.answer(json.loads(line))
+        except (ValueError, KeyError, TypeError, AttributeError, OSError) as error:
+            return {'error': f"{type(error).__name__}: {error}"}
+
+
+def _scan_log(input_file: str, offset: int, int_timestamp: int, end_timestamp: int, hostname: str) -> set:
+    """Returns the hostnames connected to hostname during a period reading input_file from offset."""
+    with open_log(input_file) as f:
+        f.seek(offset)
+        return process_batch(f, int_timestamp, end_timestamp, hostname, len(hostname))
+
+
+async def _read(resident_log: ResidentLog, follower: Follower, follow: bool) -> None:
+    """Adds the lines read by follower to resident_log, letting the queries in between batches."""
+    restarts = follower.restarts
+    async for lines in follower.batches(follow=follow):
+        if follower.restarts != restarts:
+            resident_log.restart(follower.inode)
+            restarts = follower.restarts
+        resident_log.add_lines(lines)
+        resident_log.index.add(follower.position, resident_log.max_timestamp)
+        stats.count(lines=len(lines))
+        await asyncio.sleep(0)
+
+
+async def _serve(resident_log: ResidentLog, follower: Follower, follow: bool = True, path: Optional[str] = None,
+                 host: str = 'localhost', port: Optional[int] = None) -> None:
+    """Serves the queries of resident_log while follower reads the log, until it's cancelled."""
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(json.dumps(await resident_log.respond(line)).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            # The client has gone or the server is closing
+            pass
+        finally:
+            writer.close()
+
+    if port is None:
+        server = await asyncio.start_unix_server(_handle, path)
+    else:
+        server = await asyncio.start_server(_handle, host, port)
+    reading = asyncio.ensure_future(_read(resident_log, follower, follow))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        reading.cancel()
+
+
+def serve(input_file: str, path: Optional[str] = None, host: str = 'localhost', port: Optional[int] = None,
+          retention: int = SERVER_RETENTION, follow: bool = True) -> None:
+    """Serves the queries of input_file, keeping its last hours in memory, until it's interrupted.
+
+    The index of input_file is refreshed to start reading at the first retained hour, and then it's kept up
+    to date in memory.
+
+    Args:
+        input_file: The log to serve, it must be a single uncompressed text file.
+        path: The Unix socket to listen on, used if port isn't given. { default: socket_path(input_file)}
+        host: The host to listen on, used with port. { default: 'localhost'}
+        port: The TCP port to listen on. { default: None, the Unix socket is used}
+        retention: The number of hours kept in memory. { default: SERVER_RETENTION}
+        follow: If it's False the log isn't read any more after its end. { default: True}
+    """
+    if is_multiple(input_file) or is_columnar(input_file) or compression_of(input_file) is not None:
+        raise ValueError(f"{input_file} can't be served, only a single uncompressed text log can")
+    resident_log = ResidentLog(input_file, retention, refresh_index(input_file))
+    follower = Follower(input_file, offset=resident_log.index.offset_for(resident_log.retained_from))
+    if port is None:
+        path = path or socket_path(input_file)
+        if os.path.exists(path):
+            os.remove(path)
+    logger.info(f"Serving {input_file} on {path if port is None else f'{host}:{port}'}")
+    try:
+        asyncio.run(_serve(resident_log, follower, follow, path, host, port))
+    finally:
+        if port is None and path and os.path.exists(path):
+            os.remove(path)
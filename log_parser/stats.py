@@ -0,0 +1,187 @@
+"""Statistics.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Counters and timings of a run, to tell where its time goes: lines and bytes read, lines skipped before the
+period, matches, the seconds of each stage and, for the tasks run in a pool of workers, the throughput and
+the queue wait of each worker. The gauges keep the last value of something, like the last timestamp read.
+The counters are added once per batch or byte range, never per line, and nothing is measured unless the
+statistics are started.
+
+The tasks of a pool are run through starmap and imap, which, when the statistics are started, measure each
+task in its worker and merge its counters (and its profile, if the run is profiled) in this process.
+"""
+from collections import Counter
+from contextlib import contextmanager
+import os
+from time import perf_counter, time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+
+class TaskResult(NamedTuple):
+    """The result of a task run in a worker with its measures."""
+    value: Any
+    pid: int
+    queue_wait: float
+    seconds: float
+    counters: Dict[str, int]
+    profile: Optional[Dict]
+
+
+class Stats():
+    """Counters and timings of a run."""
+    def __init__(self) -> None:
+        """Creates the statistics, stopped."""
+        self.reset()
+
+    def reset(self) -> None:
+        """Stops measuring and clears the measures."""
+        self.enabled = False
+        self.profiler: Any = None
+        self.started = 0.0
+        self.counters: Counter = Counter()
+        self.gauges: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self.workers: Dict[int, Counter] = {}
+        self.worker_seconds: Dict[int, float] = {}
+        self.worker_queue_wait: Dict[int, float] = {}
+        self.profiles: List[Dict] = []
+
+    def start(self, profile: bool = False) -> None:
+        """Starts measuring from zero.
+
+        Args:
+            profile: If it's True the run is also profiled with cProfile, in this process and in the workers.
+                { default: False}
+        """
+        self.reset()
+        self.enabled = True
+        self.started = perf_counter()
+        if profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def count(self, **counters: int) -> None:
+        """Adds the counters."""
+        if self.enabled:
+            self.counters.update(counters)
+
+    def set(self, **gauges: Any) -> None:
+        """Sets the gauges, the last values of something measured."""
+        if self.enabled:
+            self.gauges.update(gauges)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Adds the seconds spent in the block to the timing of stage."""
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = self.timings.get(stage, 0) + perf_counter() - start
+
+    def merge_task(self, result: TaskResult) -> Any:
+        """Adds the measures of a task run by a worker, returns its value."""
+        self.counters.update(result.counters)
+        self.workers.setdefault(result.pid, Counter()).update(tasks=1, **result.counters)
+        self.worker_seconds[result.pid] = self.worker_seconds.get(result.pid, 0) + result.seconds
+        self.worker_queue_wait[result.pid] = self.worker_queue_wait.get(result.pid, 0) + result.queue_wait
+        if result.profile is not None:
+            self.profiles.append(result.profile)
+        return result.value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the statistics as a dictionary that can be dumped to JSON."""
+        seconds = perf_counter() - self.started
+        workers = []
+        for pid, counters in sorted(self.workers.items()):
+            busy = self.worker_seconds[pid]
+            workers.append({
+                'pid': pid, **counters, 'seconds': busy, 'queue_wait': self.worker_queue_wait[pid],
+                'lines_per_second': counters['lines'] / busy if busy else 0,
+            })
+        return {
+            'seconds': seconds,
+            'counters': dict(self.counters),
+            'gauges': self.gauges,
+            'lines_per_second': self.counters['lines'] / seconds if seconds else 0,
+            'timings': self.timings,
+            'workers': workers,
+        }
+
+    def stop(self, profile_file: Optional[str] = None) -> Dict[str, Any]:
+        """Stops measuring, returns the statistics and writes the profile merged with the ones of the workers.
+
+        Args:
+            profile_file: The file where the profile is written, in the pstats format. { default: None}
+        """
+        result = self.to_dict()
+        self.enabled = False
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            merged = pstats.Stats(self.profiler)
+            for profile in self.profiles:
+                merged.add(_LoadedProfile(profile))  # type: ignore
+            if profile_file:
+                merged.dump_stats(profile_file)
+            self.profiler = None
+        return result
+
+
+class _LoadedProfile():
+    """The profile of a worker in the form pstats.Stats.add loads."""
+    def __init__(self, profile: Dict) -> None:
+        """Wraps the stats dictionary of a profile."""
+        self.stats = profile
+
+    def create_stats(self) -> None:
+        """The stats are already created."""
+
+
+stats = Stats()
+
+
+def _run_task(task: tuple) -> TaskResult:
+    """Runs a task in a worker measuring it, task is (function, submission time, arguments, profile)."""
+    function, submitted, args, profile = task
+    started = time()
+    stats.start()
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    value = function(*args)
+    if profiler is not None:
+        profiler.disable()
+        profiler.create_stats()
+    seconds = time() - started
+    stats.enabled = False
+    return TaskResult(value, os.getpid(), started - submitted, seconds, dict(stats.counters),
+                      profiler.stats if profiler is not None else None)  # type: ignore
+
+
+def _call(task: tuple) -> Any:
+    """Calls a function with its arguments, task is (function, arguments)."""
+    function, args = task
+    return function(*args)
+
+
+def starmap(pool: Any, function: Callable, iterable: Iterable[tuple]) -> List:
+    """Like pool.starmap, measuring each task if the statistics are started."""
+    if not stats.enabled:
+        return pool.starmap(function, iterable)
+    return [stats.merge_task(result) for result in pool.map(
+        _run_task, [(function, time(), args, stats.profiler is not None) for args in iterable])]
+
+
+def imap(pool: Any, function: Callable, iterable: Iterable[tuple]) -> Iterator:
+    """Like pool.imap but calling function with each tuple of arguments, measuring each task if it's started."""
+    if not stats.enabled:
+        return pool.imap(_call, ((function, args) for args in iterable))
+    return map(stats.merge_task, pool.imap(
+        _run_task, ((function, time(), args, stats.profiler is not None) for args in iterable)))
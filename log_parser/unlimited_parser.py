@@ -1,16 +1,168 @@
 """Unlimited parser.
 ~~~~~~~~~~~~~~~~~~~~~~~~~
 """
-from collections import Counter
-from copy import deepcopy
+import asyncio
 from datetime import datetime
-from time import sleep
+import json
+import os
+from time import monotonic
+from typing import Any, Dict, List, Optional, Tuple
 
+from log_parser.checkpoint import Checkpoint, load_checkpoint, save_checkpoint
+from log_parser.columnar import is_columnar
+from log_parser.compression import compression_of
+from log_parser.config import CHECKPOINT_INTERVAL, STATS_INTERVAL
 from log_parser.constants import HOUR_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.files import input_files, is_multiple, select_files
+from log_parser.follow import Follower
+from log_parser.index import refresh_index
 from log_parser.logger import logger
+from log_parser.stats import stats
+from log_parser.watermark import Watermark
+from log_parser.window import SlidingWindow
 
 
-def unlimited(log_file: str, origin_host: str, end_host: str, init_timestamp: int = 0) -> None:
+def _now() -> int:
+    """Returns the current timestamp in milliseconds."""
+    return int(datetime.now().timestamp() * 1000)
+
+
+def _report(sliding_window: SlidingWindow, timestamp: int, margin: Optional[int] = None) -> None:
+    """Logs the resume of every period finished at timestamp, waiting margin for late lines."""
+    for window_start, state in sliding_window.advance(timestamp, margin):
+        logger.log_resume_last_hour(
+            window_start, sliding_window.origin_host, sliding_window.end_host, state, window=sliding_window.window)
+
+
+async def _report_periodically(sliding_window: SlidingWindow, watermark: Watermark) -> None:
+    """Logs the resume of each period as soon as its margin is over, even if no line is read."""
+    while True:
+        await asyncio.sleep(max(sliding_window.window_end + watermark.margin - _now(), 0) / 1000)
+        _report(sliding_window, _now(), watermark.margin)
+
+
+def follow_stats(follower: Follower, lines: int, seconds: float) -> Dict[str, Any]:
+    """Returns the progress of the parser: the lines read, their rate and how far it is behind the file.
+
+    Args:
+        follower: The follower of the parser.
+        lines: The lines read seconds ago, to compute the rate.
+        seconds: The seconds since lines were read.
+    """
+    lag_bytes = None
+    if follower.compression is None:
+        try:
+            lag_bytes = max(os.path.getsize(follower.path) - follower.position, 0)
+        except FileNotFoundError:
+            pass
+    last_timestamp = stats.gauges.get('last_timestamp')
+    return {
+        'path': follower.path,
+        'position': follower.position,
+        'lines': stats.counters['lines'],
+        'lines_per_second': (stats.counters['lines'] - lines) / seconds if seconds else 0,
+        'lag_bytes': lag_bytes,
+        'lag_seconds': (_now() - last_timestamp) / 1000 if last_timestamp is not None else None,
+    }
+
+
+async def _log_stats_periodically(follower: Follower, stats_interval: float) -> None:
+    """Logs the progress of the parser as a JSON line every stats_interval seconds."""
+    lines = stats.counters['lines']
+    while True:
+        await asyncio.sleep(stats_interval)
+        logger.info(json.dumps({'stats': follow_stats(follower, lines, stats_interval)}))
+        lines = stats.counters['lines']
+
+
+async def _unlimited(follower: Follower, sliding_window: SlidingWindow, follow: bool,
+                     checkpoint_file: Optional[str] = None, checkpoint_interval: float = CHECKPOINT_INTERVAL,
+                     stats_interval: float = STATS_INTERVAL, watermark: Optional[Watermark] = None) -> None:
+    """Aggregates the lines read by follower in sliding_window, reporting on a timer.
+
+    The periods are reported when watermark passes their end (by default with the margin of sliding_window).
+    The late lines are counted, and the ones whose period has already been reported are logged as dropped.
+    The lines before the beginning of the first period are skipped silently.
+    At the end of the file, when it isn't followed, the margin is over after the greatest timestamp read
+    (not after the current time), so the periods finished before the last line are reported.
+    If checkpoint_file is given, the state is saved in it every checkpoint_interval seconds and when the
+    parser stops. If the statistics are started, the progress is logged every stats_interval seconds.
+    """
+    if watermark is None:
+        watermark = Watermark(sliding_window.margin)
+
+    def _save_checkpoint() -> None:
+        if checkpoint_file:
+            save_checkpoint(checkpoint_file, follower.position, follower.inode, sliding_window)
+
+    timer = asyncio.ensure_future(_report_periodically(sliding_window, watermark))
+    stats_timer = asyncio.ensure_future(_log_stats_periodically(follower, stats_interval)) if stats.enabled else None
+    last_checkpoint = monotonic()
+    position = follower.position
+    try:
+        async for lines in follower.batches(follow=follow):
+            late_lines = watermark.late_lines
+            dropped_lines = 0
+            init_timestamp = sliding_window.init_timestamp
+            for line in lines:
+                timestamp_str, origin, end = line.split()
+                timestamp = int(timestamp_str)
+                if timestamp < init_timestamp:
+                    continue
+                watermark.observe(timestamp)
+                _report(sliding_window, watermark.max_timestamp, watermark.margin)
+                if not sliding_window.add(timestamp, origin, end):
+                    dropped_lines += 1
+            if dropped_lines:
+                logger.warning(f"{dropped_lines} lines of {follower.path} arrived after their period was reported, "
+                               f"up to {watermark.lateness} ms out of order")
+            if lines:
+                stats.count(lines=len(lines), bytes_read=max(follower.position - position, 0),
+                            late_lines=watermark.late_lines - late_lines, dropped_lines=dropped_lines)
+                stats.set(last_timestamp=watermark.max_timestamp, margin=watermark.margin)
+            position = follower.position
+            if monotonic() - last_checkpoint >= checkpoint_interval:
+                _save_checkpoint()
+                last_checkpoint = monotonic()
+        _report(sliding_window, watermark.max_timestamp + watermark.margin, watermark.margin)
+        _save_checkpoint()
+    except asyncio.CancelledError:
+        _save_checkpoint()
+        raise
+    finally:
+        timer.cancel()
+        if stats_timer is not None:
+            stats_timer.cancel()
+
+
+def _resume(checkpoint_file: str, log_files: List[str],
+            sliding_window: SlidingWindow) -> Optional[Tuple[str, Checkpoint]]:
+    """Returns the checkpoint, with the file of log_files it was reading, if it can be resumed.
+
+    The checkpoint can be resumed if that file is still in log_files and the parameters of sliding_window
+    are the same.
+    """
+    checkpoint = load_checkpoint(checkpoint_file)
+    if checkpoint is None:
+        return None
+    log_file = next((log_file for log_file in log_files if os.stat(log_file).st_ino == checkpoint.inode), None)
+    if log_file is None:
+        return None
+    saved_window = checkpoint.sliding_window
+    if compression_of(log_file) is None and os.path.getsize(log_file) < checkpoint.position:
+        return None
+    if (saved_window.origin_host, saved_window.end_host, saved_window.window, saved_window.slide,
+            saved_window.margin) != (sliding_window.origin_host, sliding_window.end_host, sliding_window.window,
+                                     sliding_window.slide, sliding_window.margin):
+        return None
+    return log_file, checkpoint
+
+
+def unlimited(log_file: str, origin_host: str, end_host: str, init_timestamp: int = 0, use_index: bool = False,
+              window: int = HOUR_TIMESTAMP, slide: int = HOUR_TIMESTAMP, margin: int = TIMESTAMP_MARGIN,
+              follow: bool = True, checkpoint_file: Optional[str] = None,
+              checkpoint_interval: float = CHECKPOINT_INTERVAL, top_k: int = 0, capacity: int = 0,
+              adaptive_margin: bool = False) -> None:
     """Parse log_file and once per hour resume logs.
 
     The resume contains:
@@ -19,46 +171,49 @@ def unlimited(log_file: str, origin_host: str, end_host: str, init_timestamp: in
        - the hostname that generated most connections
 
     Args:
-        log_file: The file to parse
+        log_file: The file to parse, or a directory or a glob of rotated logs, which are read in the order of
+            their first lines beginning with the first one that can have lines after init_timestamp, and then
+            followed as new files are created
         origin_host: The hostname to report the list of hostnames connected to
         end_host: The hostname to report the list of hostnames connected from
         init_timestamp: The timestamp to start report
+        use_index: If it's True the index sidecar is used (and refreshed) to start reading at init_timestamp,
+            unless the first file is compressed
+        window: The length of the period of each resume (in milliseconds, multiple of a minute)
+        slide: The time between two resumes (in milliseconds, multiple of a minute)
+        margin: The time to wait for late lines after the end of a period (in milliseconds)
+        follow: If it's False the parser stops at the end of log_file, instead of waiting for new lines
+        checkpoint_file: The file where the state is saved, if it's given and it has the state of a previous run
+            over log_file with the same hosts and periods, the parsing is resumed from it
+        checkpoint_interval: The seconds between two checkpoints
+        top_k: If it's given, the top_k hostnames with more connections are reported, counted approximately in
+            fixed memory (it can't be used with checkpoint_file)
+        capacity: The number of counters of each minute in approximate mode
+        adaptive_margin: If it's True the periods are reported once the greatest lateness observed plus
+            WATERMARK_SLACK has passed their end, never waiting more than margin, see Watermark
     """
-    init_timestamp = init_timestamp or int(datetime.now().timestamp() * 1000)
-    default: dict = {'connected_to': set(), 'connected_from': set(), 'counter_connections': Counter()}
-    actual = deepcopy(default)
-    next_hour = deepcopy(default)
-    with open(log_file, 'r') as f:
-        while True:
-            line = f.readline()
-            if line:
-                timestamp_str, origin, end = line.split()
-                timestamp = int(timestamp_str)
-                if timestamp < init_timestamp:
-                    continue
-                if timestamp >= init_timestamp + HOUR_TIMESTAMP + TIMESTAMP_MARGIN:
-                    logger.log_resume_last_hour(init_timestamp, origin_host, end_host, actual)
-                    actual = deepcopy(next_hour)
-                    next_hour = deepcopy(default)
-                    init_timestamp += HOUR_TIMESTAMP
-                if timestamp >= init_timestamp + HOUR_TIMESTAMP:
-                    if origin == origin_host:
-                        next_hour['connected_from'].add(end)
-                    if end == end_host:
-                        next_hour['connected_to'].add(origin)
-                    next_hour['counter_connections'][origin] += 1
-                    next_hour['counter_connections'][end] += 1
-                    continue
-                if origin == origin_host:
-                    actual['connected_from'].add(end)
-                if end == end_host:
-                    actual['connected_to'].add(origin)
-                actual['counter_connections'][origin] += 1
-                actual['counter_connections'][end] += 1
-            else:
-                if datetime.now().timestamp() >= (init_timestamp + HOUR_TIMESTAMP + TIMESTAMP_MARGIN) / 1000:
-                    logger.log_resume_last_hour(init_timestamp, origin_host, end_host, actual)
-                    init_timestamp += HOUR_TIMESTAMP
-                    actual = deepcopy(next_hour)
-                    next_hour = deepcopy(default)
-                sleep(10.1)
+    if top_k and checkpoint_file:
+        raise ValueError("The approximate mode can't be checkpointed")
+    if not is_multiple(log_file) and is_columnar(log_file):
+        raise ValueError("The columnar logs can't be followed, use report instead")
+    init_timestamp = init_timestamp or _now()
+    sliding_window = SlidingWindow(origin_host, end_host, init_timestamp, window=window, slide=slide, margin=margin,
+                                   top_k=top_k, capacity=capacity)
+    chain = log_file if is_multiple(log_file) else None
+    if chain is not None:
+        spans = select_files(chain, init_timestamp) or select_files(chain)[-1:]
+        if not spans:
+            raise ValueError(f"There are no log files in {chain}")
+        log_file = spans[0].path
+    resumed = _resume(checkpoint_file, input_files(chain or log_file), sliding_window) if checkpoint_file else None
+    if resumed:
+        log_file, checkpoint = resumed
+        offset = checkpoint.position
+        sliding_window = checkpoint.sliding_window
+    else:
+        use_index = use_index and compression_of(log_file) is None
+        offset = refresh_index(log_file).offset_for(init_timestamp) if use_index else 0
+    asyncio.run(_unlimited(
+        Follower(log_file, offset=offset, chain=chain), sliding_window, follow, checkpoint_file=checkpoint_file,
+        checkpoint_interval=checkpoint_interval, watermark=Watermark(sliding_window.margin, adaptive=adaptive_margin)
+    ))
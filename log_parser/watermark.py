@@ -0,0 +1,66 @@
+"""Watermark.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+The watermark is the point of a log behind which no more lines are expected: the greatest timestamp read
+minus the margin. A period is finished, and a scan of it can stop, once the watermark has passed its end.
+
+With a fixed margin, the margin is the maximum disorder allowed (TIMESTAMP_MARGIN by default). With an
+adaptive margin, it's the greatest lateness observed so far (how far behind the greatest timestamp read a
+line arrived) plus a slack, never more than the maximum. On well ordered logs the periods are then closed
+and the scans stopped a few seconds after their end instead of five minutes, and the margin grows as soon
+as a later line is seen. The lines that arrive behind the watermark are late: they are counted, and they
+are still aggregated wherever their period hasn't been reported yet.
+"""
+from log_parser.config import WATERMARK_SLACK
+from log_parser.constants import TIMESTAMP_MARGIN
+
+
+class Watermark():
+    """Tracks how late the lines of a log arrive."""
+    __slots__ = ('max_margin', 'adaptive', 'slack', 'max_timestamp', 'lateness', 'late_lines')
+
+    def __init__(self, max_margin: int = TIMESTAMP_MARGIN, adaptive: bool = False,
+                 slack: int = WATERMARK_SLACK) -> None:
+        """Creates a watermark before any line.
+
+        Args:
+            max_margin: The maximum disorder of the lines, the margin when it isn't adaptive.
+                { default: TIMESTAMP_MARGIN}
+            adaptive: If it's True the margin is the greatest lateness observed plus slack. { default: False}
+            slack: The margin added to the greatest lateness observed when it's adaptive. { default: WATERMARK_SLACK}
+        """
+        self.max_margin = max_margin
+        self.adaptive = adaptive
+        self.slack = slack
+        self.max_timestamp = 0
+        self.lateness = 0
+        self.late_lines = 0
+
+    @property
+    def margin(self) -> int:
+        """The time to wait for late lines after the end of a period."""
+        if not self.adaptive:
+            return self.max_margin
+        return min(self.lateness + self.slack, self.max_margin)
+
+    @property
+    def watermark(self) -> int:
+        """The timestamp behind which no more lines are expected."""
+        return self.max_timestamp - self.margin
+
+    def observe(self, timestamp: int) -> bool:
+        """Updates the watermark with the timestamp of a line, returns False if the line is late."""
+        if timestamp >= self.max_timestamp:
+            self.max_timestamp = timestamp
+            return True
+        lateness = self.max_timestamp - timestamp
+        late = lateness > self.margin
+        if late:
+            self.late_lines += 1
+        if lateness > self.lateness:
+            self.lateness = lateness
+        return not late
+
+    def passed(self, timestamp: int) -> bool:
+        """Checks if the watermark is after timestamp, so no more lines at or before it are expected."""
+        return self.watermark > timestamp
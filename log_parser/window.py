@@ -0,0 +1,265 @@
+"""Sliding window.
+~~~~~~~~~~~~~~~~~~~~~~~~~
+"""
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from log_parser.constants import HOUR_TIMESTAMP, MINUTE_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.heavy_hitters import SpaceSaving
+from log_parser.hostnames import HostnameDictionary
+
+
+class Bucket():
+    """The connections of a slice of time of the window, the hostnames are kept as ids.
+
+    The summaries of the approximate mode are keyed by hostname instead, so only the hostnames connected to
+    or from the given hosts get an id and the memory of a bucket stays bounded by its capacity.
+    """
+    __slots__ = ('index', 'connected_to', 'connected_from', 'counter_connections', 'top_connections')
+
+    def __init__(self, index: int, capacity: int = 0) -> None:
+        """Creates an empty bucket, if capacity is given the connections are counted approximately."""
+        self.index = index
+        self.connected_to: Set[int] = set()
+        self.connected_from: Set[int] = set()
+        self.counter_connections: Counter = Counter()
+        self.top_connections = SpaceSaving(capacity) if capacity else None
+
+
+def _add_all(total: Counter, items: Dict[int, int]) -> None:
+    """Adds items to total."""
+    for item, count in items.items():
+        total[item] += count
+
+
+def _renumber(items: Dict[int, int], new_ids: Dict[int, int]) -> Counter:
+    """Returns the items with the ids replaced by their new ids."""
+    return Counter(dict(zip(map(new_ids.__getitem__, items), items.values())))
+
+
+def _remove_all(total: Counter, items: Dict[int, int]) -> None:
+    """Removes items from total, dropping the items that reach zero."""
+    for item, count in items.items():
+        remaining = total[item] - count
+        if remaining:
+            total[item] = remaining
+        else:
+            del total[item]
+
+
+class SlidingWindow():
+    """Aggregates the connections of a sliding window of time in a ring of buckets.
+
+    The totals of the window are updated when a line is added and when the window slides, so reporting
+    never rescans the buckets, and the memory is bounded by the hosts seen during window + margin: when the
+    buckets that expire leave more than half of the hostname dictionary unreferenced, it's compacted.
+    """
+    def __init__(self, origin_host: str, end_host: str, init_timestamp: int, window: int = HOUR_TIMESTAMP,
+                 slide: int = HOUR_TIMESTAMP, margin: int = TIMESTAMP_MARGIN, bucket: int = MINUTE_TIMESTAMP,
+                 hostnames: Optional[HostnameDictionary] = None, top_k: int = 0, capacity: int = 0) -> None:
+        """Creates a sliding window whose first period is [init_timestamp, init_timestamp + window).
+
+        Args:
+            origin_host: The hostname to report the list of hostnames connected from.
+            end_host: The hostname to report the list of hostnames connected to.
+            init_timestamp: The beginning of the first period.
+            window: The length of the period. { default: HOUR_TIMESTAMP}
+            slide: The time between two reports. { default: HOUR_TIMESTAMP}
+            margin: The time to wait for late lines after the end of a period. { default: TIMESTAMP_MARGIN}
+            bucket: The length of each bucket, window and slide must be multiples of it. { default: MINUTE_TIMESTAMP}
+            hostnames: The dictionary of the hostname ids, owned by the window, which compacts it.
+                { default: a new dictionary}
+            top_k: If it's given the connections are counted approximately in fixed memory and the top_k
+                hostnames with more connections are reported with their error bounds. { default: 0}
+            capacity: The number of counters of each bucket in approximate mode. { default: max(100, 10 * top_k)}
+        """
+        if window % bucket or slide % bucket:
+            raise ValueError(f"window and slide must be multiples of the bucket length {bucket}")
+        self.origin_host = origin_host
+        self.end_host = end_host
+        self.hostnames = hostnames if hostnames is not None else HostnameDictionary()
+        self.top_k = top_k
+        self.capacity = (capacity or max(100, 10 * top_k)) if top_k else 0
+        self.origin_host_id = self.hostnames.add(origin_host)
+        self.end_host_id = self.hostnames.add(end_host)
+        self.live_hostnames = len(self.hostnames)
+        self.init_timestamp = init_timestamp
+        self.window = window
+        self.slide = slide
+        self.margin = margin
+        self.bucket = bucket
+        self.window_end = init_timestamp + window
+        self.ring: List[Optional[Bucket]] = [None] * (-(-(window + margin) // bucket) + 1)
+        self.buckets = 0
+        self.connected_to: Counter = Counter()
+        self.connected_from: Counter = Counter()
+        self.counter_connections: Counter = Counter()
+
+    @property
+    def window_start(self) -> int:
+        """The beginning of the current period."""
+        return self.window_end - self.window
+
+    def _index(self, timestamp: int) -> int:
+        """Returns the index of the bucket of timestamp."""
+        return (timestamp - self.init_timestamp) // self.bucket
+
+    def _include(self, bucket: Bucket) -> None:
+        """Adds a bucket to the totals of the window."""
+        _add_all(self.connected_to, dict.fromkeys(bucket.connected_to, 1))
+        _add_all(self.connected_from, dict.fromkeys(bucket.connected_from, 1))
+        _add_all(self.counter_connections, bucket.counter_connections)
+
+    def _exclude(self, bucket: Bucket) -> None:
+        """Removes a bucket from the totals of the window."""
+        _remove_all(self.connected_to, dict.fromkeys(bucket.connected_to, 1))
+        _remove_all(self.connected_from, dict.fromkeys(bucket.connected_from, 1))
+        _remove_all(self.counter_connections, bucket.counter_connections)
+
+    def add(self, timestamp: int, origin: str, end: str) -> bool:
+        """Adds a connection to the window.
+
+        The connections after window_end + margin must be preceded by a call to advance.
+        Returns False if the connection is too late to be aggregated and it has been dropped.
+        """
+        if timestamp < self.window_start:
+            return False
+        index = self._index(timestamp)
+        slot = index % len(self.ring)
+        bucket = self.ring[slot]
+        if bucket is None:
+            self.buckets += 1
+        if bucket is None or bucket.index != index:
+            bucket = self.ring[slot] = Bucket(index, self.capacity)
+        in_window = timestamp < self.window_end
+        if bucket.top_connections is not None:
+            bucket.top_connections.update(origin)
+            bucket.top_connections.update(end)
+            if origin == self.origin_host:
+                self._connect_from(bucket, self.hostnames.add(end), in_window)
+            if end == self.end_host:
+                self._connect_to(bucket, self.hostnames.add(origin), in_window)
+            return True
+        origin_id = self.hostnames.add(origin)
+        end_id = self.hostnames.add(end)
+        if origin_id == self.origin_host_id:
+            self._connect_from(bucket, end_id, in_window)
+        if end_id == self.end_host_id:
+            self._connect_to(bucket, origin_id, in_window)
+        bucket.counter_connections[origin_id] += 1
+        bucket.counter_connections[end_id] += 1
+        if in_window:
+            self.counter_connections[origin_id] += 1
+            self.counter_connections[end_id] += 1
+        return True
+
+    def _connect_from(self, bucket: Bucket, end_id: int, in_window: bool) -> None:
+        """Adds end_id to the hostnames connected from origin_host."""
+        if end_id not in bucket.connected_from:
+            bucket.connected_from.add(end_id)
+            if in_window:
+                self.connected_from[end_id] += 1
+
+    def _connect_to(self, bucket: Bucket, origin_id: int, in_window: bool) -> None:
+        """Adds origin_id to the hostnames connected to end_host."""
+        if origin_id not in bucket.connected_to:
+            bucket.connected_to.add(origin_id)
+            if in_window:
+                self.connected_to[origin_id] += 1
+
+    def compact(self) -> None:
+        """Drops the hostnames that aren't in any bucket from the dictionary, renumbering the ids of the window."""
+        buckets = [bucket for bucket in self.ring if bucket is not None]
+        live_ids = {self.origin_host_id, self.end_host_id}
+        for bucket in buckets:
+            live_ids.update(bucket.counter_connections)
+            live_ids |= bucket.connected_to
+            live_ids |= bucket.connected_from
+        new_ids = self.hostnames.compact(live_ids)
+        new_id = new_ids.__getitem__
+        self.origin_host_id = new_id(self.origin_host_id)
+        self.end_host_id = new_id(self.end_host_id)
+        for bucket in buckets:
+            bucket.connected_to = set(map(new_id, bucket.connected_to))
+            bucket.connected_from = set(map(new_id, bucket.connected_from))
+            bucket.counter_connections = _renumber(bucket.counter_connections, new_ids)
+        self.connected_to = _renumber(self.connected_to, new_ids)
+        self.connected_from = _renumber(self.connected_from, new_ids)
+        self.counter_connections = _renumber(self.counter_connections, new_ids)
+        self.live_hostnames = len(self.hostnames)
+
+    def live_buckets(self) -> List[Bucket]:
+        """Returns the buckets in the ring, sorted by time."""
+        return sorted((bucket for bucket in self.ring if bucket is not None), key=lambda bucket: bucket.index)
+
+    def restore(self, window_end: int, buckets: List[Bucket]) -> None:
+        """Replaces the content of the window by buckets, being window_end the end of the current period."""
+        self.window_end = window_end
+        self.ring = [None] * len(self.ring)
+        self.buckets = len(buckets)
+        self.connected_to = Counter()
+        self.connected_from = Counter()
+        self.counter_connections = Counter()
+        first_index, last_index = self._index(self.window_start), self._index(self.window_end)
+        for bucket in buckets:
+            self.ring[bucket.index % len(self.ring)] = bucket
+            if first_index <= bucket.index < last_index:
+                self._include(bucket)
+
+    def state(self) -> Dict:
+        """Returns the aggregates of the current period, with the hostnames instead of their ids.
+
+        In approximate mode, instead of counter_connections the state has top_connections, a list of
+        (hostname, count, error) tuples.
+        """
+        hostname = self.hostnames.hostname
+        state: Dict[str, Any] = {
+            'connected_to': self.hostnames.hostnames_of(self.connected_to),
+            'connected_from': self.hostnames.hostnames_of(self.connected_from),
+        }
+        if not self.top_k:
+            state['counter_connections'] = Counter({
+                hostname(hostname_id): count for hostname_id, count in self.counter_connections.items()})
+            return state
+        first_index, last_index = self._index(self.window_start), self._index(self.window_end)
+        top_connections = SpaceSaving.merge((
+            bucket.top_connections for bucket in self.ring
+            if bucket is not None and bucket.top_connections is not None and first_index <= bucket.index < last_index
+        ), self.capacity)
+        state['top_connections'] = top_connections.top(self.top_k)
+        return state
+
+    def advance(self, timestamp: int, margin: Optional[int] = None) -> Iterator[Tuple[int, Dict]]:
+        """Slides the window while timestamp is after the end of the current period plus the margin.
+
+        Yields the beginning and the aggregates of each finished period. When the window is empty, the
+        idle periods are skipped and only the last finished one is reported.
+
+        Args:
+            timestamp: The greatest timestamp read.
+            margin: The time to wait for late lines, an adaptive margin can't be greater than the margin of
+                the window, which bounds its buckets. { default: the margin of the window}
+        """
+        margin = self.margin if margin is None else min(margin, self.margin)
+        while timestamp >= self.window_end + margin:
+            if not self.buckets:
+                self.window_end += (timestamp - self.window_end - margin) // self.slide * self.slide
+            yield self.window_start, self.state()
+            first_index = self._index(self.window_start)
+            last_index = self._index(self.window_end)
+            self.window_end += self.slide
+            if not self.buckets:
+                continue
+            for index in range(first_index, self._index(self.window_start)):
+                bucket = self.ring[index % len(self.ring)]
+                if bucket is not None and bucket.index == index:
+                    if index < last_index:
+                        self._exclude(bucket)
+                    self.ring[index % len(self.ring)] = None
+                    self.buckets -= 1
+            for index in range(max(last_index, self._index(self.window_start)), self._index(self.window_end)):
+                bucket = self.ring[index % len(self.ring)]
+                if bucket is not None and bucket.index == index:
+                    self._include(bucket)
+            if len(self.hostnames) > 2 * self.live_hostnames:
+                self.compact()
@@ -1,12 +1,89 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
+import json
 
-from log_parser.connected_hostnames import get_connected_hostnames
-from log_parser.unlimited_parser import unlimited
+from log_parser.config import (
+    CACHE_SIZE, CHECKPOINT_INTERVAL, RESULTS_FILE, RESULTS_FORMAT, SERVER_RETENTION
+)
+from log_parser.constants import ENGINES, HOUR_TIMESTAMP, RESULTS_FORMATS, TIMESTAMP_MARGIN
+from log_parser.logger import logger
+
+
+def run(args: Namespace) -> None:
+    """Runs the function of the command line arguments."""
+    # The implementation of each function is imported only when it's run, to start faster
+    if args.function == "connected":
+        from log_parser.connected_hostnames import get_connected_hostnames
+        get_connected_hostnames(
+            args.input_file, args.init_timestamp, args.end_timestamp, args.hostname,
+            use_multithread=args.multithreading, workers=args.workers, batch_size=args.batch_size, use_seek=args.seek,
+            use_index=args.index, engine=args.engine, cache_file=args.cache, cache_size=args.cache_size,
+            adaptive_margin=args.adaptive_margin
+        )
+    if args.function == "batch":
+        from log_parser.batch_query import get_batch_connected_hostnames
+        get_batch_connected_hostnames(args.input_file, args.queries_file, use_seek=args.seek)
+    if args.function == "unlimited":
+        from log_parser.unlimited_parser import unlimited
+        unlimited(args.input_file, args.origin_host, args.end_host, init_timestamp=args.init_timestamp,
+                  use_index=args.index, window=args.window, slide=args.slide, margin=args.margin,
+                  follow=not args.no_follow, checkpoint_file=args.checkpoint,
+                  checkpoint_interval=args.checkpoint_interval, top_k=args.top_k, capacity=args.capacity,
+                  adaptive_margin=args.adaptive_margin)
+    if args.function == "convert":
+        from log_parser.columnar import convert
+        lines = convert(args.input_file, args.output_file)
+        logger.info(f"Converted {lines} lines of {args.input_file} to {args.output_file}")
+    if args.function == "rollup":
+        from log_parser.rollup import build_rollups
+        lines = build_rollups(args.input_file, args.rollup_file, use_multithread=args.multithreading,
+                              workers=args.workers or 8, batch_size=args.batch_size or 200000)
+        logger.info(f"Rolled up {lines} lines of {args.input_file} to {args.rollup_file}")
+    if args.function == "report":
+        from log_parser.rollup import is_rollup, report_rollups
+        if is_rollup(args.input_file):
+            report_rollups(args.input_file, args.origin_host, args.end_host, args.init_timestamp,
+                           args.end_timestamp, window=args.window, slide=args.slide)
+        else:
+            from log_parser.columnar import report
+            report(args.input_file, args.origin_host, args.end_host, args.init_timestamp, args.end_timestamp,
+                   window=args.window, slide=args.slide)
+    if args.function == "index":
+        from log_parser.files import input_files
+        from log_parser.index import refresh_index
+        for input_file in input_files(args.input_file):
+            index = refresh_index(input_file, stride=args.stride)
+            logger.info(f"Indexed {index.size} bytes of {input_file} with {len(index.offsets)} entries")
+    if args.function == "serve":
+        from log_parser.server import serve
+        serve(args.input_file, path=args.socket, host=args.host, port=args.port, retention=args.retention,
+              follow=not args.no_follow)
+    if args.function == "query":
+        from log_parser.client import query_server
+        query = {'query': args.query}
+        if args.query == "connected":
+            query['hostname'] = args.hostname
+        if args.query in ("connected", "top"):
+            query.update(init_timestamp=args.init_timestamp, end_timestamp=args.end_timestamp)
+        if args.query == "top":
+            query['k'] = args.k
+        response = query_server(query, args.input_file, path=args.socket, host=args.host, port=args.port)
+        if args.query == "connected":
+            logger.log_connected_hostnames(args.hostname, set(response['hostnames']))
+        elif args.query == "top":
+            logger.log_top_connections(
+                args.init_timestamp, args.end_timestamp, [(hostname, count) for hostname, count in response['top']])
+        else:
+            logger.info(json.dumps(response))
 
 
 if __name__ == '__main__':
     parser = ArgumentParser()
-    parser.add_argument("input_file", type=str, help="Input file to read")
+    parser.add_argument("input_file", type=str, help="Input file, directory or glob of files to read")
+    parser.add_argument("--results", type=str, default=RESULTS_FILE, help="File to write the results to")
+    parser.add_argument("--results-format", choices=RESULTS_FORMATS, default=RESULTS_FORMAT,
+                        help="Format of the results file")
+    parser.add_argument("--stats", help="Log the counters and timings of the run as JSON", action="store_true")
+    parser.add_argument("--profile", type=str, help="File to write the cProfile profile of the run (and its workers)")
     subparsers = parser.add_subparsers(help="Function to execute", dest="function")
     connected_parser = subparsers.add_parser("connected")
     connected_parser.add_argument("init_timestamp", type=int, help="The beginning of the period")
@@ -15,15 +92,81 @@ if __name__ == '__main__':
     connected_parser.add_argument("-m", "--multithreading", help="Enable multithreading", action="store_true")
     connected_parser.add_argument("-w", "--workers", type=int, help="Number of workers to use")
     connected_parser.add_argument("-b", "--batch-size", type=int, help="The batch size")
+    connected_parser.add_argument("-s", "--seek", help="Bisect the file to reach the period", action="store_true")
+    connected_parser.add_argument("-x", "--index", help="Use the index to reach the period", action="store_true")
+    connected_parser.add_argument("-e", "--engine", choices=ENGINES, help="The scanning engine")
+    connected_parser.add_argument("--cache", type=str, help="File to cache the results of each hour")
+    connected_parser.add_argument("--cache-size", type=int, default=CACHE_SIZE, help="Hours kept in the cache")
+    connected_parser.add_argument("--adaptive-margin", action="store_true",
+                                  help="Stop once the observed lateness has passed the end of the period")
+    batch_parser = subparsers.add_parser("batch")
+    batch_parser.add_argument("queries_file", type=str, help="File with a 'hostname init end' query per line")
+    batch_parser.add_argument("-s", "--seek", help="Bisect the file to reach the first period", action="store_true")
     unlimited_parser = subparsers.add_parser("unlimited")
     unlimited_parser.add_argument("origin_host", type=str, help="Origin host to check")
     unlimited_parser.add_argument("end_host", type=str, help="Destination host to check")
     unlimited_parser.add_argument("-i", "--init_timestamp", type=int, help="The beginning to start check")
+    unlimited_parser.add_argument("-x", "--index", help="Use the index to reach the beginning", action="store_true")
+    unlimited_parser.add_argument("--window", type=int, default=HOUR_TIMESTAMP, help="Length of each period (ms)")
+    unlimited_parser.add_argument("--slide", type=int, default=HOUR_TIMESTAMP, help="Time between two reports (ms)")
+    unlimited_parser.add_argument("--margin", type=int, default=TIMESTAMP_MARGIN, help="Wait for late lines (ms)")
+    unlimited_parser.add_argument("--adaptive-margin", action="store_true",
+                                  help="Report once the observed lateness has passed the end of the period")
+    unlimited_parser.add_argument("--no-follow", help="Stop at the end of the file", action="store_true")
+    unlimited_parser.add_argument("-c", "--checkpoint", type=str, help="File to save the state and resume from")
+    unlimited_parser.add_argument("--checkpoint-interval", type=float, default=CHECKPOINT_INTERVAL,
+                                  help="Seconds between two checkpoints")
+    unlimited_parser.add_argument("-k", "--top-k", type=int, default=0,
+                                  help="Report the approximate top k hostnames with more connections")
+    unlimited_parser.add_argument("--capacity", type=int, default=0, help="Counters per minute in approximate mode")
+    convert_parser = subparsers.add_parser("convert")
+    convert_parser.add_argument("output_file", type=str, help="Columnar log to write")
+    rollup_parser = subparsers.add_parser("rollup")
+    rollup_parser.add_argument("rollup_file", type=str, help="Rollup file to create or update")
+    rollup_parser.add_argument("-m", "--multithreading", help="Roll up hour-aligned ranges in parallel",
+                               action="store_true")
+    rollup_parser.add_argument("-w", "--workers", type=int, help="Number of workers to use")
+    rollup_parser.add_argument("-b", "--batch-size", type=int, help="Maximum lines of each range")
+    report_parser = subparsers.add_parser("report")
+    report_parser.add_argument("origin_host", type=str, help="Origin host to check")
+    report_parser.add_argument("end_host", type=str, help="Destination host to check")
+    report_parser.add_argument("init_timestamp", type=int, help="The beginning of the first period")
+    report_parser.add_argument("end_timestamp", type=int, help="The end of the last period")
+    report_parser.add_argument("--window", type=int, default=HOUR_TIMESTAMP, help="Length of each period (ms)")
+    report_parser.add_argument("--slide", type=int, default=HOUR_TIMESTAMP, help="Time between two reports (ms)")
+    index_parser = subparsers.add_parser("index")
+    index_parser.add_argument("-n", "--stride", type=int, help="Number of lines between index entries")
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.add_argument("--socket", type=str, help="Unix socket to listen on (input_file.sock by default)")
+    serve_parser.add_argument("--host", type=str, default="localhost", help="Host to listen on with --port")
+    serve_parser.add_argument("--port", type=int, help="TCP port to listen on instead of the Unix socket")
+    serve_parser.add_argument("--retention", type=int, default=SERVER_RETENTION, help="Hours kept in memory")
+    serve_parser.add_argument("--no-follow", help="Stop reading at the end of the file", action="store_true")
+    query_parser = subparsers.add_parser("query")
+    query_parser.add_argument("--socket", type=str, help="Unix socket of the server (input_file.sock by default)")
+    query_parser.add_argument("--host", type=str, default="localhost", help="Host of the server with --port")
+    query_parser.add_argument("--port", type=int, help="TCP port of the server instead of the Unix socket")
+    query_subparsers = query_parser.add_subparsers(help="Query to send", dest="query")
+    query_subparsers.required = True
+    connected_query_parser = query_subparsers.add_parser("connected")
+    connected_query_parser.add_argument("init_timestamp", type=int, help="The beginning of the period")
+    connected_query_parser.add_argument("end_timestamp", type=int, help="The end of the period")
+    connected_query_parser.add_argument("hostname", type=str, help="The host to check connections")
+    top_query_parser = query_subparsers.add_parser("top")
+    top_query_parser.add_argument("init_timestamp", type=int, help="The beginning of the period")
+    top_query_parser.add_argument("end_timestamp", type=int, help="The end of the period")
+    top_query_parser.add_argument("-k", type=int, default=1, help="Number of hostnames with more connections")
+    query_subparsers.add_parser("status")
     args = parser.parse_args()
-    if args.function == "connected":
-        get_connected_hostnames(
-            args.input_file, args.init_timestamp, args.end_timestamp, args.hostname,
-            use_multithread=args.multithreading, workers=args.workers, batch_size=args.batch_size
-        )
-    if args.function == "unlimited":
-        unlimited(args.input_file, args.origin_host, args.end_host, init_timestamp=args.init_timestamp)
+    logger.set_results_file(args.results, args.results_format)
+    if not (args.stats or args.profile):
+        run(args)
+    else:
+        from log_parser.stats import stats
+        stats.start(profile=bool(args.profile))
+        try:
+            run(args)
+        finally:
+            run_stats = stats.stop(args.profile)
+            if args.stats:
+                logger.info(json.dumps({'stats': run_stats}))
@@ -6,7 +6,8 @@ from nox.sessions import Session
 
 
 package = "log_parser"
-locations = "log_parser", "tests", "noxfile.py", "docs/conf.py"
+locations = "log_parser", "benchmarks", "tests", "noxfile.py", "docs/conf.py"
+benchmark_args = "--size", "20M", "--workers", "2", "4", "--batch-sizes", "200000"
 
 
 @nox.session(python="3.8")
@@ -41,6 +42,20 @@ def tests(session: Session) -> None:
     session.run("pytest", f"--typeguard-packages={package}", *args, external=True)
 
 
+@nox.session(python="3.8")
+def benchmarks(session: Session) -> None:
+    """Check the throughput and memory against the stored baseline."""
+    args = session.posargs or [*benchmark_args, "--baseline", "benchmarks/baseline.json"]
+    session.run("python", "-m", "benchmarks.harness", *args, external=True)
+
+
+@nox.session(python="3.8")
+def startup(session: Session) -> None:
+    """Check the import time and the imported modules of each command against the stored baseline."""
+    args = session.posargs or ["--baseline", "benchmarks/startup_baseline.json"]
+    session.run("python", "-m", "benchmarks.startup", *args, external=True)
+
+
 @nox.session(python="3.8")
 def pytype(session: Session) -> None:
     """Type-check using pytype."""
@@ -0,0 +1,71 @@
+"""Test suite for batch query."""
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from unittest.mock import Mock, patch
+
+from pytest import mark
+
+from log_parser.batch_query import get_batch_connected_hostnames, process_queries, Query, read_queries
+from log_parser.connected_hostnames import process_batch
+from tests.test_files import write_rotated_logs
+
+
+def test_read_queries() -> None:
+    """Check read queries."""
+    with NamedTemporaryFile('w') as f:
+        f.write("# hostname init end\nYurith 1565721488843 1565721500212\n\nKeden 0 1565800000000\n")
+        f.flush()
+        assert read_queries(f.name) == [
+            Query('Yurith', 1565721488843, 1565721500212),
+            Query('Keden', 0, 1565800000000)
+        ]
+
+
+def test_process_queries() -> None:
+    """Check that each query gets the same hostnames as process_batch."""
+    queries = [
+        Query('Yurith', 1565721488843, 1565721500212),
+        Query('Yurith', 0, 1565800000000),
+        Query('Keden', 0, 1565800000000),
+        Query('Unknown', 0, 1565800000000),
+        Query('Yurith', 1565725077229, 1565725377270),
+    ]
+    with open('tests/data/example.txt') as f:
+        results = process_queries(f, queries)
+    for query, result in zip(queries, results):
+        with open('tests/data/example.txt') as f:
+            assert result == process_batch(f, query.init_timestamp, query.end_timestamp, query.hostname,
+                                           len(query.hostname))
+    assert results[0] == {'Nyson', 'Denija'}
+
+
+def test_process_queries_empty() -> None:
+    """Check that no query gets no result."""
+    assert process_queries(iter(['1565721477210 A B\n']), []) == []
+
+
+@mark.parametrize("seek", [False, True])
+@patch("log_parser.batch_query.logger")
+def test_get_batch_connected_hostnames(mock_logger: Mock, seek: bool) -> None:
+    """Check get batch connected hostnames."""
+    with NamedTemporaryFile('w') as f:
+        f.write("Yurith 1565721488843 1565721500212\nKeden 0 1565800000000\n")
+        f.flush()
+        get_batch_connected_hostnames('tests/data/example.txt', f.name, use_seek=seek)
+    mock_logger.log_query_results.assert_called_once_with(
+        [Query('Yurith', 1565721488843, 1565721500212), Query('Keden', 0, 1565800000000)],
+        [{'Nyson', 'Denija'}, {'Albany'}]
+    )
+
+
+@mark.parametrize("seek", [False, True])
+@patch("log_parser.batch_query.logger")
+def test_get_batch_connected_hostnames_directory(mock_logger: Mock, seek: bool) -> None:
+    """Check that the results of the rotated logs of a directory are merged, reading the compressed one whole."""
+    queries = [Query('Yurith', 1565721488843, 1565721500212), Query('Yurith', 0, 1565800000000)]
+    with TemporaryDirectory() as tmpdir:
+        write_rotated_logs(tmpdir)
+        with open(f"{tmpdir}/queries", 'w') as f:
+            f.write("Yurith 1565721488843 1565721500212\nYurith 0 1565800000000\n")
+        get_batch_connected_hostnames(f"{tmpdir}/log.txt*", f"{tmpdir}/queries", use_seek=seek)
+    mock_logger.log_query_results.assert_called_once_with(
+        queries, [{'Nyson', 'Denija'}, {'Nyson', 'Denija', 'Teniyah', 'Marybell'}])
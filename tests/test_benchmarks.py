@@ -0,0 +1,138 @@
+"""Test suite for the benchmarks."""
+from io import StringIO
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.generate import parse_size, write_log
+from benchmarks.harness import cases, find_regressions, RssSampler, run
+from benchmarks.heavy_hitters import aggregate, zipf_stream
+from benchmarks.startup import find_regressions as find_startup_regressions, parse_importtime
+from log_parser.constants import TIMESTAMP_MARGIN
+
+
+def test_parse_size() -> None:
+    """Check the sizes with and without suffix."""
+    assert parse_size("1000") == 1000
+    assert parse_size("2K") == 2048
+    assert parse_size("1.5G") == 3 * 1024 ** 3 // 2
+
+
+def test_write_log() -> None:
+    """Check that the log has the requested size, the hosts and a jitter bounded by the margin."""
+    f = StringIO()
+    info = write_log(f, 300000, hosts=50, jitter=1000, interval=2)
+    lines = f.getvalue().splitlines()
+    assert info.size == len(f.getvalue()) >= 300000
+    assert info.lines == len(lines)
+    timestamps = [int(line.split(" ")[0]) for line in lines]
+    assert (info.first_timestamp, info.last_timestamp) == (timestamps[0], timestamps[-1])
+    running_max = timestamps[0]
+    for timestamp in timestamps:
+        assert timestamp >= running_max - 1000
+        running_max = max(running_max, timestamp)
+    assert len({host for line in lines for host in line.split(" ")[1:]}) <= 50
+
+
+def test_write_log_is_reproducible() -> None:
+    """Check that the same seed writes the same log."""
+    first, second = StringIO(), StringIO()
+    write_log(first, 10000, seed=1)
+    write_log(second, 10000, seed=1)
+    assert first.getvalue() == second.getvalue()
+
+
+def test_write_log_jitter_out_of_margin() -> None:
+    """Check that a jitter greater than the margin is rejected."""
+    with pytest.raises(ValueError):
+        write_log(StringIO(), 1000, jitter=TIMESTAMP_MARGIN + 1)
+
+
+def test_cases() -> None:
+    """Check that every engine runs in single thread and with each workers and batch size."""
+    result = list(cases(['lines', 'mmap'], [2, 4], [1000]))
+    assert len(result) == 2 * (1 + 2) + 1
+    assert result[1] == {'command': 'connected', 'engine': 'lines', 'workers': 2, 'batch_size': 1000}
+    assert result[-1]['command'] == 'unlimited'
+
+
+def test_rss_sampler() -> None:
+    """Check that the peak RSS of this process is sampled, not the one inherited from its parent."""
+    sampler = RssSampler(0.001)
+    sampler.start()
+    data = bytearray(50 * 1024 * 1024)
+    data[::4096] = b"x" * len(data[::4096])
+    peak = sampler.stop()
+    assert peak >= len(data)
+    assert not sampler.thread.is_alive()
+
+
+def test_run_skips_workers() -> None:
+    """Check that the worker counts greater than the CPUs aren't measured."""
+    with TemporaryDirectory() as tmpdir:
+        log_file = os.path.join(tmpdir, "log.txt")
+        with open(log_file, 'w') as f:
+            write_log(f, 10000)
+        with patch("benchmarks.harness._cpus", return_value=1):
+            report = run(log_file, engines=['lines'], workers=[1, 2], batch_sizes=[1000])
+    assert report['cpus'] == 1
+    assert [result['workers'] for result in report['results']] == [0, 1, 0]
+    assert all(result['peak_rss'] > 0 for result in report['results'])
+
+
+def test_find_regressions() -> None:
+    """Check that only the speedups and sizes out of the tolerance and the missing cases are reported."""
+    case = {'command': 'connected', 'engine': 'lines', 'workers': 0, 'batch_size': 0}
+    other_case = {**case, 'workers': 2, 'batch_size': 200000}
+    baseline = {'results': [{**case, 'lines_per_second': 1000, 'peak_rss': 100},
+                            {**other_case, 'lines_per_second': 1800, 'peak_rss': 300}]}
+    report = {'results': [{**case, 'lines_per_second': 500, 'peak_rss': 110},
+                          {**other_case, 'lines_per_second': 800, 'peak_rss': 300}]}
+    assert find_regressions(report, baseline) == []
+    report = {'results': [{**case, 'lines_per_second': 1000, 'peak_rss': 200},
+                          {**other_case, 'lines_per_second': 1000, 'peak_rss': 300}]}
+    regressions = find_regressions(report, baseline)
+    assert len(regressions) == 2 and "1.00x its reference, baseline 1.80x" in regressions[1]
+    regressions = find_regressions({'results': [{**other_case, 'lines_per_second': 1, 'peak_rss': 1}]}, baseline)
+    assert regressions == ["command=connected, engine=lines, workers=0, batch_size=0: not measured"]
+    regressions = find_regressions({'results': [{**case, 'engine': 'mmap', 'lines_per_second': 1, 'peak_rss': 1}]},
+                                   {'results': []})
+    assert regressions == ["command=connected, engine=mmap, workers=0, batch_size=0: not in the baseline"]
+
+
+def test_aggregate() -> None:
+    """Check that the approximate window only gives ids to the hostnames connected to or from the given hosts."""
+    stream = zipf_stream(2000, 500, 1.1)
+    exact_state, exact_hostnames = aggregate(stream)
+    approximate_state, approximate_hostnames = aggregate(stream, 3, 50)
+    assert sum(exact_state['counter_connections'].values()) == 2000
+    assert approximate_state['connected_to'] == exact_state['connected_to']
+    assert len(approximate_state['top_connections']) == 3
+    assert approximate_hostnames < exact_hostnames
+
+
+def test_parse_importtime() -> None:
+    """Check that only the top level imports are added and the log_parser modules are listed."""
+    output = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 | site",
+        "import time:        50 |         50 |   log_parser.constants",
+        "import time:        20 |         70 | log_parser",
+        "import time:        30 |        300 | log_parser.logger",
+        "Some output",
+    ])
+    assert parse_importtime(output) == {
+        'import_us': 470, 'modules': ['log_parser', 'log_parser.constants', 'log_parser.logger']}
+
+
+def test_find_startup_regressions() -> None:
+    """Check that slower imports and new modules are reported."""
+    baseline = {'results': [{'command': 'help', 'import_us': 1000, 'modules': ['log_parser.logger']}]}
+    result = {'command': 'help', 'import_us': 1400, 'modules': ['log_parser.logger']}
+    assert find_startup_regressions({'results': [result]}, baseline) == []
+    result = {'command': 'help', 'import_us': 1600, 'modules': ['log_parser.logger', 'log_parser.follow']}
+    assert find_startup_regressions({'results': [result]}, baseline) == [
+        "help: imports in 1600 us, baseline 1000", "help: imports log_parser.follow"]
+    assert find_startup_regressions({'results': [{**result, 'command': 'index'}]}, baseline) == []
@@ -0,0 +1,143 @@
+"""Test suite for the result cache."""
+import gzip
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+
+from pytest import mark
+
+from log_parser import connected_hostnames
+from log_parser.cache import hours_of, load_cache, ResultCache
+from log_parser.connected_hostnames import get_connected_hostnames
+from log_parser.constants import HOUR_TIMESTAMP, MINUTE_TIMESTAMP
+
+INIT_TIMESTAMP = 1565647200000
+
+
+def _write_hours(file_path: str, hours: range, mode: str = 'w') -> None:
+    """Writes a line every 10 minutes of each hour, from the host of the hour to host-B."""
+    with open(file_path, mode) as f:
+        for hour in hours:
+            for minute in range(0, 60, 10):
+                f.write(f"{INIT_TIMESTAMP + hour * HOUR_TIMESTAMP + minute * MINUTE_TIMESTAMP} host-{hour} host-B\n")
+
+
+def test_hours_of() -> None:
+    """Check that the periods are split at the hour boundaries."""
+    assert hours_of(INIT_TIMESTAMP, INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP) == [
+        (INIT_TIMESTAMP, INIT_TIMESTAMP + HOUR_TIMESTAMP, True),
+        (INIT_TIMESTAMP + HOUR_TIMESTAMP, INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP, True)]
+    assert hours_of(INIT_TIMESTAMP + 10, INIT_TIMESTAMP + HOUR_TIMESTAMP + 20) == [
+        (INIT_TIMESTAMP + 10, INIT_TIMESTAMP + HOUR_TIMESTAMP, False),
+        (INIT_TIMESTAMP + HOUR_TIMESTAMP, INIT_TIMESTAMP + HOUR_TIMESTAMP + 20, False)]
+    assert hours_of(INIT_TIMESTAMP + 10, INIT_TIMESTAMP + 20) == [(INIT_TIMESTAMP + 10, INIT_TIMESTAMP + 20, False)]
+    assert hours_of(INIT_TIMESTAMP, INIT_TIMESTAMP) == []
+
+
+def test_lru() -> None:
+    """Check that the least recently used entries are evicted."""
+    cache = ResultCache(size=2)
+    cache.put((1, 2), 'host-B', 0, {'host-0'})
+    cache.put((1, 2), 'host-B', HOUR_TIMESTAMP, {'host-1'})
+    assert cache.get((1, 2), 'host-B', 0) == {'host-0'}
+    cache.put((1, 2), 'host-B', 2 * HOUR_TIMESTAMP, set())
+    assert len(cache) == 2
+    assert cache.get((1, 2), 'host-B', HOUR_TIMESTAMP) is None
+    assert cache.get((1, 2), 'host-B', 0) == {'host-0'}
+    assert cache.get((1, 2), 'host-B', 2 * HOUR_TIMESTAMP) == set()
+
+
+def test_validate() -> None:
+    """Check that appending invalidates only the trailing hour and rewriting invalidates everything."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_hours(input_file, range(3))
+        cache = ResultCache()
+        file_key = cache.validate(input_file)
+        assert file_key[1] == os.stat(input_file).st_ino
+        for hour in range(3):
+            cache.put(file_key, 'host-B', INIT_TIMESTAMP + hour * HOUR_TIMESTAMP, {f"host-{hour}"})
+        assert cache.validate(input_file) == file_key
+        assert len(cache) == 3
+        _write_hours(input_file, range(3, 4), mode='a')
+        assert cache.validate(input_file) == file_key
+        assert [key[3] for key in cache.entries] == [INIT_TIMESTAMP, INIT_TIMESTAMP + HOUR_TIMESTAMP]
+        with open(input_file, 'r+') as f:
+            f.write("1565647200001")
+        cache.validate(input_file)
+        assert len(cache) == 0
+
+
+def test_save_load() -> None:
+    """Check that the cache is saved and loaded in LRU order."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_hours(input_file, range(2))
+        cache = ResultCache()
+        file_key = cache.validate(input_file)
+        cache.put(file_key, 'host-B', INIT_TIMESTAMP + HOUR_TIMESTAMP, {'host-1'})
+        cache.put(file_key, 'host-B', INIT_TIMESTAMP, {'host-0', 'host-B'})
+        cache.put(file_key, 'host-0', INIT_TIMESTAMP, set())
+        cache.save(f"{tmpdir}/cache")
+        loaded = load_cache(f"{tmpdir}/cache")
+        assert loaded.entries == cache.entries
+        assert list(loaded.entries) == list(cache.entries)
+        assert loaded.fingerprints == cache.fingerprints
+        assert loaded.validate(input_file) == file_key
+        assert len(loaded) == 3
+        assert len(load_cache(f"{tmpdir}/cache", size=1)) == 1
+        assert len(load_cache(f"{tmpdir}/missing")) == 0
+        assert len(load_cache(input_file)) == 0
+
+
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_cached(mock_logger: Mock) -> None:
+    """Check that the hours in cache aren't read again, the missing ones are read in runs, with the same results."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        cache_file = f"{tmpdir}/cache"
+        _write_hours(input_file, range(6))
+        with patch("log_parser.connected_hostnames._get_connected_hostnames_of_file",
+                   wraps=connected_hostnames._get_connected_hostnames_of_file) as mock_of_file:
+            get_connected_hostnames(input_file, INIT_TIMESTAMP + HOUR_TIMESTAMP, INIT_TIMESTAMP + 3 * HOUR_TIMESTAMP,
+                                    'host-B', cache_file=cache_file)
+            assert mock_of_file.call_count == 1
+            get_connected_hostnames(input_file, INIT_TIMESTAMP + 10, INIT_TIMESTAMP + 5 * HOUR_TIMESTAMP + 10,
+                                    'host-B', cache_file=cache_file)
+            assert mock_of_file.call_count == 1 + 2
+            _write_hours(input_file, range(6, 7), mode='a')
+            get_connected_hostnames(input_file, INIT_TIMESTAMP, INIT_TIMESTAMP + 7 * HOUR_TIMESTAMP,
+                                    'host-B', cache_file=cache_file)
+            assert mock_of_file.call_count == 1 + 2 + 2
+    results = [call[1][1] for call in mock_logger.log_connected_hostnames.mock_calls]
+    assert results == [{'host-1', 'host-2'}, {f"host-{hour}" for hour in range(6)},
+                       {f"host-{hour}" for hour in range(7)}]
+
+
+@mark.parametrize("compress", [False, True])
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_cached_multithread(mock_logger: Mock, compress: bool) -> None:
+    """Check that with multithreading the runs of missing hours share a pool and are split by hour."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        cache_file = f"{tmpdir}/cache"
+        _write_hours(input_file, range(6))
+        if compress:
+            with open(input_file, 'rb') as f, gzip.open(f"{input_file}.gz", 'wb') as compressed:
+                compressed.write(f.read())
+            input_file = f"{input_file}.gz"
+        get_connected_hostnames(input_file, INIT_TIMESTAMP + HOUR_TIMESTAMP, INIT_TIMESTAMP + 3 * HOUR_TIMESTAMP,
+                                'host-B', cache_file=cache_file)
+        with patch("log_parser.connected_hostnames._pool", wraps=connected_hostnames._pool) as mock_pool:
+            get_connected_hostnames(input_file, INIT_TIMESTAMP, INIT_TIMESTAMP + 6 * HOUR_TIMESTAMP, 'host-B',
+                                    use_multithread=True, workers=2, batch_size=10, cache_file=cache_file)
+            get_connected_hostnames(input_file, INIT_TIMESTAMP, INIT_TIMESTAMP + 6 * HOUR_TIMESTAMP, 'host-B',
+                                    use_multithread=True, workers=2, cache_file=cache_file)
+        assert mock_pool.call_count == 1
+        cache = load_cache(cache_file)
+        file_key = cache.validate(input_file)
+        assert [cache.get(file_key, 'host-B', INIT_TIMESTAMP + hour * HOUR_TIMESTAMP) for hour in range(6)] == [
+            {f"host-{hour}"} for hour in range(6)]
+    results = [call[1][1] for call in mock_logger.log_connected_hostnames.mock_calls]
+    assert results == [{'host-1', 'host-2'}, {f"host-{hour}" for hour in range(6)},
+                       {f"host-{hour}" for hour in range(6)}]
@@ -0,0 +1,65 @@
+"""Test suite for checkpoint."""
+from tempfile import TemporaryDirectory
+
+from pytest import raises
+
+from log_parser.checkpoint import Checkpoint, load_checkpoint, save_checkpoint
+from log_parser.constants import MINUTE_TIMESTAMP
+from log_parser.window import SlidingWindow
+
+
+def test_checkpoint_round_trip() -> None:
+    """Check that a saved checkpoint is loaded with the same state."""
+    sliding_window = SlidingWindow('host-O', 'host-E', 1000, window=10 * MINUTE_TIMESTAMP, slide=5 * MINUTE_TIMESTAMP)
+    for i in range(100):
+        timestamp = 1000 + i * 10000
+        list(sliding_window.advance(timestamp))
+        sliding_window.add(timestamp, ['host-O', 'host-A', 'host-B'][i % 3], ['host-E', 'host-A', 'host-C'][i % 5 % 3])
+    with TemporaryDirectory() as tmpdir:
+        save_checkpoint(f"{tmpdir}/checkpoint", 1234, 56, sliding_window)
+        checkpoint = load_checkpoint(f"{tmpdir}/checkpoint")
+    assert isinstance(checkpoint, Checkpoint)
+    assert checkpoint.position == 1234
+    assert checkpoint.inode == 56
+    restored = checkpoint.sliding_window
+    assert (restored.origin_host, restored.end_host, restored.init_timestamp, restored.window, restored.slide,
+            restored.margin, restored.bucket, restored.window_end) == (
+        'host-O', 'host-E', 1000, 10 * MINUTE_TIMESTAMP, 5 * MINUTE_TIMESTAMP, sliding_window.margin,
+        MINUTE_TIMESTAMP, sliding_window.window_end)
+    assert restored.state() == sliding_window.state()
+    assert [(bucket.index, bucket.connected_to, bucket.connected_from, bucket.counter_connections)
+            for bucket in restored.live_buckets()] == [
+        (bucket.index, bucket.connected_to, bucket.connected_from, bucket.counter_connections)
+        for bucket in sliding_window.live_buckets()]
+    assert [start for start, _ in restored.advance(10 ** 7)] == [start for start, _ in sliding_window.advance(10 ** 7)]
+
+
+def test_load_checkpoint_invalid() -> None:
+    """Check that a missing or corrupted checkpoint is ignored."""
+    with TemporaryDirectory() as tmpdir:
+        assert load_checkpoint(f"{tmpdir}/checkpoint") is None
+        with open(f"{tmpdir}/checkpoint", 'wb') as f:
+            f.write(b"LPCK")
+        assert load_checkpoint(f"{tmpdir}/checkpoint") is None
+        save_checkpoint(f"{tmpdir}/checkpoint", 0, 0, SlidingWindow('host-O', 'host-E', 0))
+        with open(f"{tmpdir}/checkpoint", 'r+b') as f:
+            f.write(b"XXXX")
+        assert load_checkpoint(f"{tmpdir}/checkpoint") is None
+
+
+def test_checkpoint_same_hosts() -> None:
+    """Check a checkpoint whose origin and end hosts are the same."""
+    sliding_window = SlidingWindow('host-O', 'host-O', 0)
+    sliding_window.add(10, 'host-O', 'host-O')
+    with TemporaryDirectory() as tmpdir:
+        save_checkpoint(f"{tmpdir}/checkpoint", 0, 0, sliding_window)
+        checkpoint = load_checkpoint(f"{tmpdir}/checkpoint")
+    assert checkpoint is not None
+    assert checkpoint.sliding_window.end_host == 'host-O'
+    assert checkpoint.sliding_window.state() == sliding_window.state()
+
+
+def test_checkpoint_approximate() -> None:
+    """Check that the approximate mode can't be checkpointed."""
+    with TemporaryDirectory() as tmpdir, raises(ValueError):
+        save_checkpoint(f"{tmpdir}/checkpoint", 0, 0, SlidingWindow('host-O', 'host-E', 0, top_k=1))
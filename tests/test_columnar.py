@@ -0,0 +1,103 @@
+"""Test suite for columnar logs."""
+from collections import Counter
+import gzip
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+
+from pytest import importorskip, mark, raises
+
+from log_parser.columnar import columnar_span, ColumnarLog, convert, is_columnar, report
+from log_parser.connected_hostnames import get_connected_hostnames, process_batch
+from log_parser.constants import MINUTE_TIMESTAMP
+from log_parser.unlimited_parser import unlimited
+from log_parser.window import SlidingWindow
+
+importorskip("numpy")
+
+
+def test_convert() -> None:
+    """Check that the columnar log has the lines sorted by timestamp and the hostname dictionary."""
+    with TemporaryDirectory() as tmpdir:
+        with open('tests/data/example.txt', 'rb') as f, gzip.open(f"{tmpdir}/log.gz", 'wb') as compressed:
+            compressed.write(f.read())
+        assert convert(f"{tmpdir}/log.gz", f"{tmpdir}/log.lpc") == 15
+        assert is_columnar(f"{tmpdir}/log.lpc")
+        assert not is_columnar('tests/data/example.txt')
+        assert columnar_span(f"{tmpdir}/log.lpc") == (1565721477210, 1565725377279)
+        columnar_log = ColumnarLog(f"{tmpdir}/log.lpc")
+        assert list(columnar_log.timestamps) == sorted(columnar_log.timestamps)
+        assert columnar_log.hostnames.hostname(int(columnar_log.origins[4])) == 'Denija'
+        assert columnar_log.hostnames.hostname(int(columnar_log.ends[4])) == 'Yurith'
+
+
+def test_convert_empty() -> None:
+    """Check the columnar log of an empty file."""
+    with TemporaryDirectory() as tmpdir:
+        with open(f"{tmpdir}/log.txt", 'w'):
+            pass
+        assert convert(f"{tmpdir}/log.txt", f"{tmpdir}/log.lpc") == 0
+        assert columnar_span(f"{tmpdir}/log.lpc") is None
+        assert ColumnarLog(f"{tmpdir}/log.lpc").connected_hostnames(0, 1565800000000, 'Yurith') == set()
+
+
+@mark.parametrize("int_timestamp,end_timestamp,hostname", [
+    [1565721488843, 1565721500212, 'Yurith'],
+    [0, 1565800000000, 'Yurith'],
+    [1565725077229, 1565725377270, 'Yurith'],
+    [0, 1565800000000, 'Keden'],
+    [0, 1565800000000, 'Unknown'],
+])
+def test_connected_hostnames(int_timestamp: int, end_timestamp: int, hostname: str) -> None:
+    """Check that the columnar query returns the same hostnames as process_batch."""
+    with open('tests/data/example.txt') as f:
+        expected = process_batch(f, int_timestamp, end_timestamp, hostname, len(hostname))
+    with TemporaryDirectory() as tmpdir:
+        convert('tests/data/example.txt', f"{tmpdir}/log.lpc")
+        assert ColumnarLog(f"{tmpdir}/log.lpc").connected_hostnames(int_timestamp, end_timestamp, hostname) == expected
+
+
+def test_state() -> None:
+    """Check that the aggregates of a period are the same as the ones of the sliding window."""
+    sliding_window = SlidingWindow('Denija', 'Yurith', 1565721477210, window=65 * MINUTE_TIMESTAMP)
+    with open('tests/data/example.txt') as f:
+        for line in f:
+            timestamp, origin, end = line.split()
+            sliding_window.add(int(timestamp), origin, end)
+    with TemporaryDirectory() as tmpdir:
+        convert('tests/data/example.txt', f"{tmpdir}/log.lpc")
+        state = ColumnarLog(f"{tmpdir}/log.lpc").state(
+            'Denija', 'Yurith', 1565721477210, 1565721477210 + 65 * MINUTE_TIMESTAMP)
+    assert state == sliding_window.state()
+    assert state['counter_connections'] == Counter({
+        'Yurith': 6, 'Denija': 3, 'Marybell': 2, 'Albany': 2, 'Keden': 2, 'Nyson': 1, 'Hasya': 1, 'Laquarius': 1,
+        'Vidhu': 1, 'Teniyah': 1, 'A': 1, 'B': 1})
+
+
+@patch("log_parser.columnar.logger")
+def test_report(mock_logger: Mock) -> None:
+    """Check that a resume is logged for each period."""
+    with TemporaryDirectory() as tmpdir:
+        convert('tests/data/example.txt', f"{tmpdir}/log.lpc")
+        report(f"{tmpdir}/log.lpc", 'Denija', 'Yurith', 1565721477210, 1565725377280, window=30 * MINUTE_TIMESTAMP,
+               slide=30 * MINUTE_TIMESTAMP)
+    calls = mock_logger.log_resume_last_hour.mock_calls
+    assert [call[1][0] for call in calls] == [1565721477210, 1565723277210]
+    assert calls[0][1][3]['connected_to'] == {'Marybell', 'Nyson', 'Denija', 'Teniyah'}
+    assert calls[1][1][3]['counter_connections'] == Counter()
+
+
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_columnar(mock_logger: Mock) -> None:
+    """Check that get_connected_hostnames queries the columnar logs of a directory."""
+    with TemporaryDirectory() as tmpdir:
+        convert('tests/data/example.txt', f"{tmpdir}/log.lpc")
+        get_connected_hostnames(tmpdir, 1565721477210, 1565725077259, 'Yurith')
+    mock_logger.log_connected_hostnames.assert_called_once_with('Yurith', {'Marybell', 'Nyson', 'Denija', 'Teniyah'})
+
+
+def test_unlimited_columnar() -> None:
+    """Check that unlimited doesn't read a columnar log."""
+    with TemporaryDirectory() as tmpdir:
+        convert('tests/data/example.txt', f"{tmpdir}/log.lpc")
+        with raises(ValueError):
+            unlimited(f"{tmpdir}/log.lpc", 'Denija', 'Yurith', follow=False)
@@ -0,0 +1,126 @@
+"""Test suite for compressed logs."""
+import bz2
+import gzip
+import struct
+from tempfile import TemporaryDirectory
+from types import ModuleType
+from unittest.mock import patch
+
+from pytest import importorskip, mark, raises
+
+from log_parser.compression import compression_of, MemberReader, open_binary, open_log, split_members
+
+
+def _write_members(path: str, content: bytes, member_size: int, compress: ModuleType = gzip) -> None:
+    """Writes content compressed in members of member_size bytes, split without caring about the lines."""
+    with open(path, 'wb') as f:
+        for start in range(0, len(content), member_size):
+            f.write(compress.compress(content[start:start + member_size]))
+
+
+def test_compression_of() -> None:
+    """Check that the compression is detected by the magic bytes and then by the extension."""
+    with TemporaryDirectory() as tmpdir:
+        _write_members(f"{tmpdir}/log", b"1 A B\n", 10)
+        _write_members(f"{tmpdir}/log.txt", b"1 A B\n", 10, bz2)
+        with open(f"{tmpdir}/empty.gz", 'wb'):
+            pass
+        with open(f"{tmpdir}/fake.zst", 'wb') as f:
+            f.write(b"1 A B\n")
+        assert compression_of(f"{tmpdir}/log") == 'gzip'
+        assert compression_of(f"{tmpdir}/log.txt") == 'bz2'
+        assert compression_of(f"{tmpdir}/empty.gz") is None
+        assert compression_of(f"{tmpdir}/fake.zst") == 'zstd'
+        assert compression_of('tests/data/example.txt') is None
+
+
+@mark.parametrize("compress", [gzip, bz2])
+def test_open_log(compress: ModuleType) -> None:
+    """Check that a file of several members is read like the uncompressed one."""
+    with open('tests/data/example.txt', 'rb') as f:
+        content = f.read()
+    with TemporaryDirectory() as tmpdir:
+        _write_members(f"{tmpdir}/log", content, 100, compress)
+        with open_log(f"{tmpdir}/log") as f, open('tests/data/example.txt') as expected:
+            assert f.readlines() == expected.readlines()
+
+
+@mark.parametrize("compress", [gzip, bz2])
+def test_member_reader(compress: ModuleType) -> None:
+    """Check that the members beginning in the range are decompressed and the position is the end of the last."""
+    with open('tests/data/example.txt', 'rb') as f:
+        content = f.read()
+    with TemporaryDirectory() as tmpdir:
+        log_file = f"{tmpdir}/log"
+        _write_members(log_file, content, 100, compress)
+        compression = compress.__name__
+        ranges = split_members(log_file, compression, 3)
+        assert len(ranges) == 3
+        assert ranges[0][0] == 0
+        data = b""
+        for start, end in ranges:
+            reader = MemberReader(log_file, compression, start, end)
+            data += b"".join(reader)
+            assert reader.position >= end
+        assert data == content
+
+
+def test_member_reader_false_member() -> None:
+    """Check that nothing is read when the range doesn't begin at a member."""
+    with TemporaryDirectory() as tmpdir:
+        _write_members(f"{tmpdir}/log.gz", b"1 A B\n" * 100, 1000)
+        reader = MemberReader(f"{tmpdir}/log.gz", 'gzip', 5, 10)
+        assert b"".join(reader) == b""
+        assert reader.position == 5
+
+
+def test_zstd_frames() -> None:
+    """Check that the zstd frames are read in parallel ranges."""
+    zstandard = importorskip("zstandard")
+    with open('tests/data/example.txt', 'rb') as f:
+        content = f.read()
+    compressor = zstandard.ZstdCompressor()
+    with TemporaryDirectory() as tmpdir:
+        log_file = f"{tmpdir}/log.zst"
+        with open(log_file, 'wb') as f:
+            for start in range(0, len(content), 100):
+                f.write(compressor.compress(content[start:start + 100]))
+        ranges = split_members(log_file, 'zstd', 5)
+        assert len(ranges) == 5
+        assert b"".join(b"".join(MemberReader(log_file, 'zstd', start, end)) for start, end in ranges) == content
+        with open_log(log_file) as f:
+            assert f.read() == content.decode()
+
+
+@patch("log_parser.compression.zstandard", None)
+def test_open_binary_errors() -> None:
+    """Check that reading a zstd file without the zstandard package or an unknown compression raises an error."""
+    with TemporaryDirectory() as tmpdir:
+        with open(f"{tmpdir}/log.zst", 'wb') as f:
+            f.write(b"\x28\xb5\x2f\xfd")
+        with raises(ValueError, match="pip install zstandard"):
+            open_log(f"{tmpdir}/log.zst")
+        with raises(ValueError, match="Unknown compression"):
+            open_binary(f"{tmpdir}/log.zst", 'lz4')
+
+
+def test_zstd_frames_skippable() -> None:
+    """Check that the skippable frames are skipped, a truncated frame ends the file and garbage is rejected."""
+    zstandard = importorskip("zstandard")
+    compressor = zstandard.ZstdCompressor()
+    first, second = compressor.compress(b"1 A B\n" * 100), compressor.compress(b"2 A B\n" * 100)
+    with TemporaryDirectory() as tmpdir:
+        log_file = f"{tmpdir}/log.zst"
+        with open(log_file, 'wb') as f:
+            f.write(first + struct.pack("<II", 0x184D2A50, 3) + b"abc" + second + second[:8])
+        second_start = len(first) + 11
+        assert split_members(log_file, 'zstd', 100) == [
+            (0, second_start), (second_start, second_start + len(second)),
+            (second_start + len(second), second_start + len(second) + 8)]
+        with open(log_file, 'wb') as f:
+            f.write(first + struct.pack("<I", 0x184D2A50) + b"ab")
+        assert split_members(log_file, 'zstd', 100) == [(0, len(first) + 6)]
+        with open(log_file, 'wb') as f:
+            f.write(first + b"garbage")
+        with raises(ValueError, match="Invalid zstd frame"):
+            split_members(log_file, 'zstd', 100)
@@ -1,21 +1,46 @@
 """Test suite for connected hostnames."""
-from typing import Iterable, List
+import bz2
+import gzip
+import os
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from typing import Callable
 from unittest.mock import Mock, patch
 
-from pytest import mark, raises
+from pytest import importorskip, mark, raises
 
-from log_parser.connected_hostnames import get_connected_hostnames, grouper, process_batch
+from log_parser.connected_hostnames import (
+    get_connected_hostnames, process_batch, process_mmap_range, process_range, split_ranges
+)
+from log_parser.watermark import Watermark
+from tests.test_files import write_rotated_logs
 
 
-@mark.parametrize("iterable,n,expected", [
-    [range(5), 2, [(0, 1), (2, 3), (4, None)]],
-    [range(5), 6, [(0, 1, 2, 3, 4, None)]],
-    [list(range(5)), 2, [(0, 1), (2, 3), (4, None)]],
-    [list(range(5)), 6, [(0, 1, 2, 3, 4, None)]]
-])
-def test_grouper(iterable: Iterable, n: int, expected: List) -> None:
-    """Test grouper."""
-    assert list(grouper(iterable, n)) == expected
+@mark.parametrize("start,batch_size", [[0, 1], [0, 3], [0, 100], [48, 2]])
+def test_split_ranges(start: int, batch_size: int) -> None:
+    """Check that the ranges are contiguous and aligned to newlines."""
+    with open('tests/data/example.txt', 'rb') as f:
+        content = f.read()
+    ranges = split_ranges('tests/data/example.txt', start, batch_size)
+    assert ranges[0][0] == start
+    assert ranges[-1][1] == len(content)
+    for (_, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start
+        assert content[end - 1:end] == b"\n"
+    assert (len(ranges) > 1) == (batch_size < 10)
+
+
+def test_split_ranges_empty_file() -> None:
+    """Check the ranges of an empty file."""
+    with NamedTemporaryFile() as f:
+        assert split_ranges(f.name, 0, 10) == [(0, 0)]
+
+
+def test_process_range() -> None:
+    """Check that only the lines beginning in the range are processed."""
+    assert process_range('tests/data/example.txt', 0, 1000, 1565721488843, 1565721500212, 'Yurith') == {
+        'Nyson', 'Denija'}
+    assert process_range('tests/data/example.txt', 0, 132, 1565721488843, 1565721500212, 'Yurith') == {'Nyson'}
+    assert process_range('tests/data/example.txt', 132, 1000, 1565721488843, 1565721500212, 'Yurith') == {'Denija'}
 
 
 def test_process_batch_end_time() -> None:
@@ -51,13 +76,207 @@ def test_process_batch_end_batch() -> None:
         next(batch_lines)
 
 
+def test_process_batch_adaptive_margin() -> None:
+    """Check that the batch stops once the observed lateness plus the slack has passed the end."""
+    batch_lines = [
+        '1000000000000 host-A host-H\n',
+        '1000000000005 host-B host-H\n',
+        '1000000000002 host-C host-H\n',
+        '1000000000015 host-D host-H\n',
+        '1000000000008 host-E host-H\n',
+        '1000000000024 host-F host-H\n',
+        '1000000000009 host-G host-H\n',
+    ]
+    watermark = Watermark(adaptive=True, slack=2)
+    lines = iter(batch_lines)
+    assert process_batch(lines, 1000000000000, 1000000000010, 'host-H', 6, watermark) == {
+        'host-A', 'host-B', 'host-C', 'host-E'}
+    assert next(lines) == batch_lines[6]
+    assert (watermark.max_timestamp, watermark.lateness, watermark.margin) == (1000000000015, 7, 9)
+    assert watermark.late_lines == 2
+    watermark = Watermark()
+    lines = iter(batch_lines)
+    assert 'host-G' in process_batch(lines, 1000000000000, 1000000000010, 'host-H', 6, watermark)
+    assert list(lines) == []
+    assert watermark.late_lines == 0
+
+
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_late_lines(mock_logger: Mock) -> None:
+    """Check that the lines more than the margin out of order are still processed and warned about."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        with open(input_file, 'w') as f:
+            f.write("1565721477210 A B\n1565721877210 C B\n1565721477211 D B\n1565725077210 E B\n")
+        get_connected_hostnames(input_file, 1565721477210, 1565721877210, 'B')
+        mock_logger.log_connected_hostnames.assert_called_once_with('B', {'A', 'D'})
+        mock_logger.warning.assert_called_once_with(
+            f"1 lines of {input_file} arrived behind the watermark, up to 399999 ms out of order")
+        mock_logger.reset_mock()
+        get_connected_hostnames(input_file, 1565721477210, 1565721477212, 'B', adaptive_margin=True)
+        mock_logger.log_connected_hostnames.assert_called_once_with('B', {'A'})
+        mock_logger.warning.assert_not_called()
+
+
 @mark.parametrize("multithread", [False, True])
+@mark.parametrize("seek", [False, True])
 @patch("log_parser.connected_hostnames.logger")
-def test_get_connected(mock_logger: Mock, multithread: bool) -> None:
+def test_get_connected(mock_logger: Mock, seek: bool, multithread: bool) -> None:
     """Check get connected."""
     mock_log_connected = Mock()
     mock_logger.log_connected_hostnames = mock_log_connected
     expected = set(['Nyson', 'Denija'])
     get_connected_hostnames(
-        'tests/data/example.txt', 1565721488843, 1565721500212, 'Yurith', use_multithread=multithread)
+        'tests/data/example.txt', 1565721488843, 1565721500212, 'Yurith', use_multithread=multithread, use_seek=seek)
     mock_log_connected.assert_called_once_with('Yurith', expected)
+
+
+@patch("log_parser.connected_hostnames.refresh_index")
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_index(mock_logger: Mock, mock_refresh_index: Mock) -> None:
+    """Check get connected using the index."""
+    mock_refresh_index.return_value.offset_for.return_value = 48
+    get_connected_hostnames('tests/data/example.txt', 1565721488843, 1565721500212, 'Yurith', use_index=True)
+    mock_refresh_index.return_value.offset_for.assert_called_once_with(1565721488843)
+    mock_logger.log_connected_hostnames.assert_called_once_with('Yurith', {'Nyson', 'Denija'})
+
+
+def test_process_range_crlf() -> None:
+    """Check that lines ending with CRLF are processed like in text mode."""
+    with NamedTemporaryFile() as f:
+        f.write(b"1000000000001 host-A host-H\r\n1000000000002 host-B host-H\r\n")
+        f.flush()
+        assert process_range(f.name, 0, 100, 1000000000000, 1000000000003, 'host-H') == {'host-A', 'host-B'}
+
+
+@mark.parametrize("input_file,int_timestamp,end_timestamp,hostname", [
+    ['tests/data/example.txt', 1565721488843, 1565721500212, 'Yurith'],
+    ['tests/data/example.txt', 0, 1565800000000, 'Yurith'],
+    ['tests/data/example.txt', 1565725077229, 1565725377270, 'Yurith'],
+    ['tests/data/example.txt', 1565721477210, 1565800000000, 'B'],
+    ['tests/data/example.txt', 1565721477210, 1565800000000, 'Unknown'],
+    ['data/sample.txt', 1565647309932, 1565733461781, 'Jovaun'],
+    ['data/sample.txt', 1565650000000, 1565660000000, 'Dmetri'],
+])
+def test_process_mmap_range(input_file: str, int_timestamp: int, end_timestamp: int, hostname: str) -> None:
+    """Check that the mmap engine returns the same hostnames as process_batch, also split by hour."""
+    hours: dict = {}
+    mmap_hours: dict = {}
+    with open(input_file) as f:
+        expected = process_batch(f, int_timestamp, end_timestamp, hostname, len(hostname), hours=hours)
+    ranges = split_ranges(input_file, 0, 3)
+    assert process_mmap_range(
+        input_file, 0, ranges[-1][1], int_timestamp, end_timestamp, hostname, mmap_hours) == expected
+    assert mmap_hours == hours and set().union(*hours.values()) == expected
+    assert set().union(*(
+        process_mmap_range(input_file, start, end, int_timestamp, end_timestamp, hostname) for start, end in ranges
+    )) == expected
+
+
+def test_process_mmap_range_empty_file() -> None:
+    """Check the mmap engine with an empty range."""
+    with NamedTemporaryFile() as f:
+        assert process_mmap_range(f.name, 0, 0, 0, 1, 'host-H') == set()
+
+
+@mark.parametrize("multithread", [False, True])
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_mmap(mock_logger: Mock, multithread: bool) -> None:
+    """Check get connected using the mmap engine."""
+    get_connected_hostnames(
+        'tests/data/example.txt', 1565721488843, 1565721500212, 'Yurith', use_multithread=multithread, engine='mmap')
+    mock_logger.log_connected_hostnames.assert_called_once_with('Yurith', {'Nyson', 'Denija'})
+
+
+def test_get_connected_unknown_engine() -> None:
+    """Check that an unknown engine raises an error."""
+    with raises(ValueError):
+        get_connected_hostnames('tests/data/example.txt', 1565721488843, 1565721500212, 'Yurith', engine='re')
+
+
+def _write_gzip_members(path: str, member_size: int, compress: Callable[[bytes], bytes] = gzip.compress) -> None:
+    """Writes tests/data/example.txt compressed in members (or frames) of member_size bytes, splitting lines."""
+    with open('tests/data/example.txt', 'rb') as f:
+        content = f.read()
+    with open(path, 'wb') as f:
+        for start in range(0, len(content), member_size):
+            f.write(compress(content[start:start + member_size]))
+
+
+@mark.parametrize("multithread", [False, True])
+@mark.parametrize("end_timestamp", [1565721500212, 1565800000000])
+@mark.parametrize("compression", ['gzip', 'bz2', 'zstd'])
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_compressed(mock_logger: Mock, compression: str, end_timestamp: int, multithread: bool) -> None:
+    """Check get connected over a file of several gzip members, bz2 streams or zstd frames."""
+    if compression == 'zstd':
+        compress = importorskip("zstandard").ZstdCompressor().compress
+    else:
+        compress = {'gzip': gzip.compress, 'bz2': bz2.compress}[compression]
+    with open('tests/data/example.txt') as f:
+        expected = process_batch(f, 1565721488843, end_timestamp, 'Yurith', 6)
+    with TemporaryDirectory() as tmpdir:
+        _write_gzip_members(f"{tmpdir}/log", 50, compress)
+        get_connected_hostnames(
+            f"{tmpdir}/log", 1565721488843, end_timestamp, 'Yurith', use_multithread=multithread, workers=2)
+    mock_logger.log_connected_hostnames.assert_called_once_with('Yurith', expected)
+
+
+@patch("log_parser.connected_hostnames.split_members")
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_compressed_false_member(mock_logger: Mock, mock_split_members: Mock) -> None:
+    """Check that a range beginning inside a member is read again from the end of the previous member."""
+    with TemporaryDirectory() as tmpdir:
+        _write_gzip_members(f"{tmpdir}/log.gz", 100)
+        with open(f"{tmpdir}/log.gz", 'rb') as f:
+            size = len(f.read())
+        mock_split_members.return_value = [(0, 10), (10, 20), (20, size)]
+        get_connected_hostnames(f"{tmpdir}/log.gz", 0, 1565800000000, 'Yurith', use_multithread=True, workers=2)
+    mock_logger.log_connected_hostnames.assert_called_once_with('Yurith', {'Marybell', 'Nyson', 'Denija', 'Teniyah'})
+
+
+def test_get_connected_compressed_errors() -> None:
+    """Check that the engine that needs the raw file is rejected with compressed files."""
+    with TemporaryDirectory() as tmpdir:
+        _write_gzip_members(f"{tmpdir}/log.gz", 100)
+        with raises(ValueError):
+            get_connected_hostnames(f"{tmpdir}/log.gz", 1565721488843, 1565721500212, 'Yurith', engine='mmap')
+
+
+@mark.parametrize("kwargs", [{'use_seek': True}, {'use_index': True}])
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_compressed_from_beginning(mock_logger: Mock, kwargs: dict) -> None:
+    """Check that a compressed file is read from its beginning instead of bisected or indexed."""
+    with TemporaryDirectory() as tmpdir:
+        _write_gzip_members(f"{tmpdir}/log.gz", 100)
+        get_connected_hostnames(f"{tmpdir}/log.gz", 1565721488843, 1565721500212, 'Yurith', **kwargs)
+        assert not os.path.exists(f"{tmpdir}/log.gz.idx")
+    mock_logger.log_connected_hostnames.assert_called_once_with('Yurith', {'Nyson', 'Denija'})
+
+
+@mark.parametrize("kwargs", [{}, {'use_seek': True}, {'use_index': True}])
+@mark.parametrize("multithread", [False, True])
+@mark.parametrize("end_timestamp,expected", [
+    [1565721500212, {'Nyson', 'Denija'}],
+    [1565800000000, {'Nyson', 'Denija', 'Teniyah', 'Marybell'}],
+])
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_directory(mock_logger: Mock, expected: set, end_timestamp: int, multithread: bool,
+                                 kwargs: dict) -> None:
+    """Check get connected over the rotated logs of a directory, the compressed one isn't bisected nor indexed."""
+    with TemporaryDirectory() as tmpdir:
+        write_rotated_logs(tmpdir)
+        get_connected_hostnames(tmpdir, 1565721488843, end_timestamp, 'Yurith', use_multithread=multithread, workers=2,
+                                **kwargs)
+    mock_logger.log_connected_hostnames.assert_called_once_with('Yurith', expected)
+
+
+@patch("log_parser.connected_hostnames._get_connected_hostnames_of_file")
+@patch("log_parser.connected_hostnames.logger")
+def test_get_connected_glob_pruned(mock_logger: Mock, mock_of_file: Mock) -> None:
+    """Check that only the files that can have lines in the period are read, the compressed one included."""
+    mock_of_file.return_value = set()
+    with TemporaryDirectory() as tmpdir:
+        write_rotated_logs(tmpdir)
+        get_connected_hostnames(f"{tmpdir}/log.txt*", 1565724000000, 1565724700000, 'Yurith')
+    assert [mock_call[1][0] for mock_call in mock_of_file.mock_calls] == [f"{tmpdir}/log.txt.1"]
@@ -0,0 +1,78 @@
+"""Test suite for log files."""
+import gzip
+import os
+from tempfile import TemporaryDirectory
+
+from pytest import raises
+
+from log_parser.constants import TIMESTAMP_MARGIN
+from log_parser.files import file_span, FileSpan, input_files, is_multiple, select_files
+
+
+def write_rotated_logs(tmpdir: str) -> None:
+    """Writes the lines of tests/data/example.txt in three rotated logs, the oldest one gzipped."""
+    with open('tests/data/example.txt', 'rb') as f:
+        lines = f.readlines()
+    with gzip.open(f"{tmpdir}/log.txt.2.gz", 'wb') as f:
+        f.writelines(lines[:5])
+    with open(f"{tmpdir}/log.txt.1", 'wb') as f:
+        f.writelines(lines[5:10])
+    with open(f"{tmpdir}/log.txt", 'wb') as f:
+        f.writelines(lines[10:])
+
+
+def test_input_files() -> None:
+    """Check the files of a file, a directory and a glob."""
+    with TemporaryDirectory() as tmpdir:
+        write_rotated_logs(tmpdir)
+        for name in ('log.txt.idx', '.checkpoint'):
+            with open(f"{tmpdir}/{name}", 'w'):
+                pass
+        os.mkdir(f"{tmpdir}/old")
+        assert not is_multiple(f"{tmpdir}/log.txt")
+        assert is_multiple(tmpdir)
+        assert is_multiple(f"{tmpdir}/log.txt.*")
+        assert input_files(f"{tmpdir}/log.txt") == [f"{tmpdir}/log.txt"]
+        assert input_files(tmpdir) == [f"{tmpdir}/log.txt", f"{tmpdir}/log.txt.1", f"{tmpdir}/log.txt.2.gz"]
+        assert input_files(f"{tmpdir}/log.txt.?") == [f"{tmpdir}/log.txt.1"]
+
+
+def test_file_span() -> None:
+    """Check the span of plain, compressed, empty and invalid files."""
+    with TemporaryDirectory() as tmpdir:
+        write_rotated_logs(tmpdir)
+        with open(f"{tmpdir}/log.txt", 'a') as f:
+            f.write("1565725377289 Incomplete")
+        with open(f"{tmpdir}/empty", 'w'):
+            pass
+        with open(f"{tmpdir}/invalid", 'wb') as f:
+            f.write(b"\xff\xfe\n")
+        inode = os.stat(f"{tmpdir}/log.txt").st_ino
+        assert file_span(f"{tmpdir}/log.txt") == FileSpan(f"{tmpdir}/log.txt", inode, 1565725077259, 1565725377279)
+        assert file_span(f"{tmpdir}/log.txt.2.gz")[2:] == (1565721477210, None)  # type: ignore
+        assert file_span(f"{tmpdir}/empty") is None
+        assert file_span(f"{tmpdir}/invalid") is None
+        with raises(FileNotFoundError):
+            file_span(f"{tmpdir}/missing")
+    assert file_span('data/sample.txt')[2:] == (1565647204351, 1565733598341)  # type: ignore
+
+
+def test_select_files() -> None:
+    """Check that the files are ordered by their first line and the ones out of the period are skipped.
+
+    The compressed one is bounded by the first line of the next one.
+    """
+    with TemporaryDirectory() as tmpdir:
+        write_rotated_logs(tmpdir)
+        paths = [f"{tmpdir}/log.txt.2.gz", f"{tmpdir}/log.txt.1", f"{tmpdir}/log.txt"]
+
+        def _select(init_timestamp: int, end_timestamp: int) -> list:
+            return [span.path for span in select_files(tmpdir, init_timestamp, end_timestamp)]
+        assert [span.path for span in select_files(tmpdir)] == paths
+        assert _select(0, 1565800000000) == paths
+        assert _select(1565721477210, 1565721477211) == paths[:2]
+        assert _select(1565721493152 + TIMESTAMP_MARGIN, 1565800000000) == paths
+        assert _select(1565721493153 + TIMESTAMP_MARGIN, 1565800000000) == paths[1:]
+        assert _select(1565725077259 - TIMESTAMP_MARGIN, 1565800000000) == paths[1:]
+        assert _select(1565725377279 + TIMESTAMP_MARGIN, 1565800000000) == paths[2:]
+        assert _select(1565800000000, 1565900000000) == []
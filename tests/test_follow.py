@@ -0,0 +1,144 @@
+"""Test suite for file follower."""
+import asyncio
+import gzip
+from os import replace
+from tempfile import TemporaryDirectory
+from typing import AsyncIterator, List
+from unittest.mock import Mock, patch
+
+from log_parser.files import file_span
+from log_parser.follow import Follower, Inotify
+
+
+async def _next(batches: AsyncIterator[List[str]]) -> List[str]:
+    """Returns the next batch, failing if it takes too long."""
+    return await asyncio.wait_for(batches.__anext__(), 5)
+
+
+def test_follower_not_follow() -> None:
+    """Check that the whole file is read in big chunks when it isn't followed."""
+    async def _run() -> List[List[str]]:
+        follower = Follower('tests/data/example.txt', offset=18, chunk_size=100)
+        batches = [batch async for batch in follower.batches(follow=False)]
+        assert follower.position == 414
+        return batches
+    batches = asyncio.run(_run())
+    assert len(batches) == 4
+    assert batches[0] == [
+        '1565721477219 Marybell Yurith', '1565721488843 Albany Keden', '1565721489138 Hasya Laquarius']
+    assert sum(batches, [])[-1] == '1565725377279 Teniyah Yurith'
+
+
+def test_follower_incomplete_last_line() -> None:
+    """Check that an incomplete last line is returned only when the file isn't followed."""
+    with TemporaryDirectory() as tmpdir:
+        log_file = f"{tmpdir}/log.txt"
+        with open(log_file, 'w') as f:
+            f.write("1 A B\n2 A")
+
+        async def _run() -> None:
+            follower = Follower(log_file)
+            assert [batch async for batch in follower.batches(follow=False)] == [['1 A B'], ['2 A']]
+            batches = Follower(log_file).batches()
+            assert await _next(batches) == ['1 A B']
+            with open(log_file, 'a') as f:
+                f.write(" C\n")
+            assert await _next(batches) == ['2 A C']
+            await batches.aclose()  # type: ignore
+        asyncio.run(_run())
+
+
+def _follow_changes() -> None:
+    """Check that appends, truncations and rotations are followed, yielding the incomplete line of a rotated file."""
+    with TemporaryDirectory() as tmpdir:
+        log_file = f"{tmpdir}/log.txt"
+        with open(log_file, 'w') as f:
+            f.write("1 A B\n")
+
+        async def _run() -> None:
+            follower = Follower(log_file)
+            batches = follower.batches()
+            assert await _next(batches) == ['1 A B']
+            with open(log_file, 'a') as f:
+                f.write("2 A B\n3 A B\n")
+            assert await _next(batches) == ['2 A B', '3 A B']
+            with open(log_file, 'w') as f:
+                f.write("4 A B\n")
+            assert await _next(batches) == ['4 A B']
+            with open(f"{tmpdir}/new.txt", 'w') as f:
+                f.write("5 A B\n")
+            replace(f"{tmpdir}/new.txt", log_file)
+            assert await _next(batches) == ['5 A B']
+            assert follower.position == 6
+            with open(log_file, 'a') as f:
+                f.write("6 A")
+            with open(f"{tmpdir}/new.txt", 'w') as f:
+                f.write("7 A B\n")
+            replace(f"{tmpdir}/new.txt", log_file)
+            assert await _next(batches) == ['6 A']
+            assert await _next(batches) == ['7 A B']
+            await batches.aclose()  # type: ignore
+        asyncio.run(_run())
+
+
+def test_follower_inotify() -> None:
+    """Check that the changes are followed using inotify."""
+    _follow_changes()
+
+
+@patch('log_parser.follow.ctypes.CDLL', side_effect=OSError)
+def test_follower_polling(mock_cdll: Mock) -> None:
+    """Check that the changes are followed polling the file when inotify isn't available."""
+    async def _check_unavailable() -> None:
+        assert not Inotify().available
+    asyncio.run(_check_unavailable())
+    _follow_changes()
+
+
+def test_follower_compressed() -> None:
+    """Check that a compressed file is decompressed and it isn't followed."""
+    with TemporaryDirectory() as tmpdir:
+        log_file = f"{tmpdir}/log.txt.gz"
+        with gzip.open(log_file, 'wb') as f:
+            f.write(b"1 A B\n2 A C\n")
+
+        async def _run() -> List[List[str]]:
+            follower = Follower(log_file)
+            batches = [batch async for batch in follower.batches()]
+            assert follower.position == 12
+            return batches
+        assert asyncio.run(_run()) == [['1 A B', '2 A C']]
+
+
+def _follow_chain() -> None:
+    """Check that the follower moves on to the next file of the chain when it's created."""
+    with TemporaryDirectory() as tmpdir, patch('log_parser.follow.file_span', wraps=file_span) as mock_span:
+        with open(f"{tmpdir}/log.1", 'w') as f:
+            f.write("1565721477210 A B\n1565721477211 A C")
+
+        async def _run() -> None:
+            follower = Follower(f"{tmpdir}/log.1", chain=tmpdir)
+            batches = follower.batches()
+            assert await _next(batches) == ['1565721477210 A B']
+            with open(f"{tmpdir}/log.0", 'w') as f:
+                f.write("1565721477100 A D\n")
+            with open(f"{tmpdir}/log.2", 'w') as f:
+                f.write("1565721477212 A E\n")
+            assert await _next(batches) == ['1565721477211 A C']
+            assert await _next(batches) == ['1565721477212 A E']
+            assert (follower.path, follower.position) == (f"{tmpdir}/log.2", 18)
+            await batches.aclose()  # type: ignore
+        asyncio.run(_run())
+    assert [call[1][0] for call in mock_span.mock_calls].count(f"{tmpdir}/log.0") == 1
+
+
+def test_follower_chain() -> None:
+    """Check that the next file of the chain is found when it's created and its first line is read once."""
+    _follow_chain()
+
+
+@patch('log_parser.follow.SUCCESSOR_INTERVAL', 0)
+@patch('log_parser.follow.ctypes.CDLL', side_effect=OSError)
+def test_follower_chain_polling(mock_cdll: Mock) -> None:
+    """Check that the next file of the chain is looked for periodically when inotify isn't available."""
+    _follow_chain()
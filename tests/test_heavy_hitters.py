@@ -0,0 +1,57 @@
+"""Test suite for heavy hitters."""
+from collections import Counter
+from random import Random
+
+from log_parser.heavy_hitters import SpaceSaving
+
+
+def _zipf_stream(length: int, items: int, seed: int = 0) -> list:
+    """Returns a skewed stream of items."""
+    return Random(seed).choices(range(items), weights=[1 / (i + 1) for i in range(items)], k=length)
+
+
+def test_space_saving_exact_under_capacity() -> None:
+    """Check that the counts are exact while there are less items than counters."""
+    summary = SpaceSaving(10)
+    for item in 'aabbbc':
+        summary.update(item)
+    assert summary.top(2) == [('b', 3, 0), ('a', 2, 0)]
+    assert summary.min_count() == 0
+    assert summary.total == 6
+
+
+def test_space_saving_bounds() -> None:
+    """Check the error bounds and that the heavy hitters are kept."""
+    stream = _zipf_stream(20000, 2000)
+    exact = Counter(stream)
+    summary = SpaceSaving(50)
+    for item in stream:
+        summary.update(item)
+    assert len(summary) == 50
+    assert len(summary.heap) == 50
+    for item, count, error in summary.top(50):
+        assert count - error <= exact[item] <= count
+    for item, count in exact.items():
+        if count > len(stream) / 50:
+            assert item in summary.counts
+    assert [item for item, _, _ in summary.top(3)] == [item for item, _ in exact.most_common(3)]
+
+
+def test_space_saving_merge() -> None:
+    """Check that merged summaries keep the error bounds."""
+    streams = [_zipf_stream(5000, 1000, seed) for seed in range(4)]
+    exact = Counter(item for stream in streams for item in stream)
+    summaries = []
+    for stream in streams:
+        summary = SpaceSaving(40)
+        for item in stream:
+            summary.update(item)
+        summaries.append(summary)
+    merged = SpaceSaving.merge(summaries, 40)
+    assert merged.total == 20000
+    assert len(merged) == 40
+    for item, count, error in merged.top(40):
+        assert count - error <= exact[item] <= count
+    assert merged.top(1)[0][0] == exact.most_common(1)[0][0]
+    merged.update('new')
+    assert 'new' in merged.counts
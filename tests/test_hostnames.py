@@ -0,0 +1,34 @@
+"""Test suite for hostname dictionary."""
+from log_parser.hostnames import HostnameDictionary, pack_hostnames, unpack_hostnames
+
+
+def test_hostname_dictionary() -> None:
+    """Check that the ids are dense and stable."""
+    hostnames = HostnameDictionary(['host-A', 'host-B'])
+    assert hostnames.add('host-B') == 1
+    assert hostnames.add('host-C') == 2
+    assert hostnames.get('host-A') == 0
+    assert hostnames.get('host-D') is None
+    assert hostnames.hostname(2) == 'host-C'
+    assert hostnames.hostnames_of([0, 2, 0]) == {'host-A', 'host-C'}
+    assert len(hostnames) == 3
+    restored = HostnameDictionary.from_bytes(hostnames.to_bytes())
+    assert restored.hostnames == ['host-A', 'host-B', 'host-C']
+    assert restored.ids == hostnames.ids
+
+
+def test_hostname_dictionary_compact() -> None:
+    """Check that only the given ids are kept, renumbered in the same order."""
+    hostnames = HostnameDictionary(['host-A', 'host-B', 'host-C', 'host-D'])
+    assert hostnames.compact([3, 1, 3]) == {1: 0, 3: 1}
+    assert hostnames.hostnames == ['host-B', 'host-D']
+    assert hostnames.get('host-D') == 1
+    assert hostnames.get('host-A') is None
+    assert hostnames.add('host-E') == 2
+
+
+def test_pack_hostnames() -> None:
+    """Check pack and unpack hostnames."""
+    assert unpack_hostnames(pack_hostnames({'host-A'})) == ['host-A']
+    assert sorted(unpack_hostnames(pack_hostnames({'host-A', 'host-B'}))) == ['host-A', 'host-B']
+    assert unpack_hostnames(pack_hostnames(set())) == []
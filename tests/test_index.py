@@ -0,0 +1,106 @@
+"""Test suite for the log index."""
+from os import path, replace
+from shutil import copyfile
+from tempfile import TemporaryDirectory
+
+from pytest import mark
+
+from log_parser.index import index_path, load_index, LogIndex, refresh_index
+
+
+def _write_lines(file_path: str, timestamps: range, mode: str = 'w') -> None:
+    """Writes a line per timestamp in file_path."""
+    with open(file_path, mode) as f:
+        for timestamp in timestamps:
+            f.write(f"{timestamp} host-A host-B\n")
+
+
+@mark.parametrize("timestamp", [0, 1565721477210, 1565721493153, 1565725077229, 1565725377279, 1565800000000])
+def test_offset_for(timestamp: int) -> None:
+    """Check that no line with a timestamp in the period is before the offset."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/example.txt"
+        copyfile('tests/data/example.txt', input_file)
+        index = refresh_index(input_file, stride=2)
+        offset = index.offset_for(timestamp)
+        with open(input_file, 'rb') as f:
+            content = f.read()
+    assert offset == 0 or content[offset - 1:offset] == b"\n"
+    for line in content[:offset].splitlines():
+        assert int(line[:13]) < timestamp
+
+
+def test_refresh_index_persists() -> None:
+    """Check that the index is saved and loaded."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_lines(input_file, range(1000000000000, 1000000001000))
+        index = refresh_index(input_file, stride=100)
+        assert path.isfile(index_path(input_file))
+        loaded = load_index(input_file)
+        assert isinstance(loaded, LogIndex)
+        assert loaded.size == index.size == path.getsize(input_file)
+        assert list(loaded.timestamps) == list(index.timestamps)
+        assert list(loaded.offsets) == list(index.offsets)
+        assert len(index.offsets) == 11
+        assert index.offset_for(1000000000500) == 500 * len("1000000000000 host-A host-B\n")
+
+
+def test_refresh_index_appended() -> None:
+    """Check that the index is extended when the file grows."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_lines(input_file, range(1000000000000, 1000000000150))
+        with open(input_file, 'a') as f:
+            f.write("1000000000150 host-A")
+        index = refresh_index(input_file, stride=100)
+        assert len(index.offsets) == 2
+        assert index.pending_lines == 50
+        with open(input_file, 'a') as f:
+            f.write(" host-B\n")
+        _write_lines(input_file, range(1000000000151, 1000000000300), mode='a')
+        index = refresh_index(input_file, stride=100)
+        assert index.size == path.getsize(input_file)
+        assert list(index.timestamps) == [-1, 1000000000099, 1000000000199, 1000000000299]
+
+
+def test_refresh_index_keeps_stride() -> None:
+    """Check that the stride of the sidecar is kept unless another one is requested."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_lines(input_file, range(1000000000000, 1000000000300))
+        refresh_index(input_file, stride=100)
+        index = refresh_index(input_file)
+        assert index.stride == 100 and len(index.offsets) == 4
+        loaded = load_index(input_file)
+        assert isinstance(loaded, LogIndex) and loaded.stride == 100
+        index = refresh_index(input_file, stride=50)
+        assert index.stride == 50 and len(index.offsets) == 7
+        assert refresh_index(input_file).stride == 50
+
+
+@mark.parametrize("rotate", [False, True])
+def test_refresh_index_rebuilt(rotate: bool) -> None:
+    """Check that the index is rebuilt when the file is truncated or rotated."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_lines(input_file, range(1000000000000, 1000000000300))
+        refresh_index(input_file, stride=100)
+        if rotate:
+            _write_lines(f"{tmpdir}/new.txt", range(2000000000000, 2000000000400))
+            replace(f"{tmpdir}/new.txt", input_file)
+        else:
+            _write_lines(input_file, range(2000000000000, 2000000000100))
+        index = refresh_index(input_file, stride=100)
+        assert index.size == path.getsize(input_file)
+        assert index.timestamps[1] == 2000000000099
+
+
+def test_load_index_invalid() -> None:
+    """Check that a missing or corrupted sidecar is ignored."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        assert load_index(input_file) is None
+        with open(index_path(input_file), 'wb') as f:
+            f.write(b"LPIX")
+        assert load_index(input_file) is None
@@ -1,11 +1,17 @@
 """Test suite for logger."""
 from collections import Counter
+import json
+import os
 from os import path
 from shutil import rmtree
+import subprocess
+import sys
 from tempfile import TemporaryDirectory
 from unittest.mock import patch
 from uuid import uuid4
 
+from pytest import raises
+
 from log_parser.logger import Logger
 
 
@@ -21,6 +27,7 @@ def test_logger_connected_hostnames() -> None:
             "- host-2\n",
             "#" * 100 + '\n'
         ]
+        logger.flush()
         with open(f"{tmpdir}/info_logs.log") as f:
             assert expected_lines == f.readlines()
 
@@ -47,6 +54,7 @@ def test_logger_resume_last_hour() -> None:
             "The hostname with more connections is host-2\n",
             "#" * 100 + '\n'
         ]
+        logger.flush()
         with open(f"{tmpdir}/info_logs.log") as f:
             assert expected_lines == f.readlines()
         state = {
@@ -75,15 +83,130 @@ def test_logger_resume_last_hour() -> None:
             "There is no connections in the last hour\n",
             "#" * 100 + '\n'
         ]
+        logger.flush()
         with open(f"{tmpdir}/info_logs.log") as f:
             assert expected_lines == f.readlines()
 
 
 def test_create_dir_if_not_exists() -> None:
-    """Check that logger creates dir if not exists."""
+    """Check that logger creates dir if not exists on the first output."""
     mock_logs_dir = str(uuid4())
     assert not path.isdir(mock_logs_dir)
     with patch("log_parser.logger.LOGS_DIR", mock_logs_dir):
-        Logger()
+        logger = Logger()
+    assert not path.isdir(mock_logs_dir)
+    logger.info("First output")
+    logger.flush()
     assert path.isdir(mock_logs_dir)
+    logger.stop()
     rmtree(mock_logs_dir)
+
+
+def test_logger_query_results() -> None:
+    """Test log query results."""
+    with TemporaryDirectory() as tmpdir:
+        with patch("log_parser.logger.LOGS_DIR", tmpdir):
+            logger = Logger()
+        logger.log_query_results([('host', 1, 2), ('host-3', 3, 4)], [{'host-2', 'host-1'}, set()])
+        expected_lines = [
+            '{"hostname": "host", "init_timestamp": 1, "end_timestamp": 2, "hostnames": ["host-1", "host-2"]}\n',
+            '{"hostname": "host-3", "init_timestamp": 3, "end_timestamp": 4, "hostnames": []}\n'
+        ]
+        logger.flush()
+        with open(f"{tmpdir}/info_logs.log") as f:
+            assert expected_lines == f.readlines()
+
+
+def test_logger_resume_top_connections() -> None:
+    """Test log resume last hour in approximate mode."""
+    with TemporaryDirectory() as tmpdir:
+        with patch("log_parser.logger.LOGS_DIR", tmpdir):
+            logger = Logger()
+        state = {'connected_to': set(), 'connected_from': set(), 'top_connections': [('host-2', 5, 1)]}
+        logger.log_resume_last_hour(1565721477219, 'origin-host', 'end-host', state)
+        state = {'connected_to': set(), 'connected_from': set(), 'top_connections': []}
+        logger.log_resume_last_hour(1565721477219, 'origin-host', 'end-host', state)
+        logger.flush()
+        with open(f"{tmpdir}/info_logs.log") as f:
+            lines = f.readlines()
+        assert lines[6:9] == [
+            "The hostnames with more connections are:\n",
+            "- host-2: between 4 and 5 connections\n",
+            "#" * 100 + '\n'
+        ]
+        assert lines[-2:] == ["There is no connections in the last hour\n", "#" * 100 + '\n']
+
+
+def test_logger_top_connections() -> None:
+    """Test log the hostnames with more connections of a period, and of a period without connections."""
+    with TemporaryDirectory() as tmpdir:
+        with patch("log_parser.logger.LOGS_DIR", tmpdir):
+            logger = Logger()
+        logger.set_results_file(f"{tmpdir}/results.jsonl")
+        logger.log_top_connections(1565721477219, 1565725077219, [('host-2', 5), ('host-1', 3)])
+        logger.log_top_connections(1565721477219, 1565725077219, [])
+        logger.flush()
+        with open(f"{tmpdir}/info_logs.log") as f:
+            lines = f.readlines()
+        with open(f"{tmpdir}/results.jsonl") as f:
+            results = [json.loads(line) for line in f]
+    assert lines[2:5] == [
+        "The hostnames with more connections are:\n", "- host-2: 5 connections\n", "- host-1: 3 connections\n"]
+    assert lines[-2:] == ["There is no connections in the period\n", "#" * 100 + '\n']
+    assert results == [
+        {'init_timestamp': 1565721477219, 'end_timestamp': 1565725077219,
+         'top_connections': [['host-2', 5], ['host-1', 3]]},
+        {'init_timestamp': 1565721477219, 'end_timestamp': 1565725077219, 'top_connections': []},
+    ]
+
+
+def test_logger_results_file() -> None:
+    """Check that each result is a single record written as a JSON line to the results file."""
+    with TemporaryDirectory() as tmpdir:
+        with patch("log_parser.logger.LOGS_DIR", tmpdir):
+            logger = Logger()
+        logger.set_results_file(f"{tmpdir}/results.jsonl")
+        logger.info("Not a result")
+        logger.log_connected_hostnames('host', {'host-2', 'host-1'})
+        state = {'connected_to': {'host-2'}, 'connected_from': set(), 'counter_connections': Counter({'host-2': 2})}
+        logger.log_resume_last_hour(1565721477219, 'origin-host', 'end-host', state)
+        top_state = {'connected_to': set(), 'connected_from': set(), 'top_connections': [('host-2', 5, 1)]}
+        logger.log_resume_last_hour(1565721477219, 'origin-host', 'end-host', top_state)
+        logger.flush()
+        with open(f"{tmpdir}/results.jsonl") as f:
+            results = [json.loads(line) for line in f]
+        with open(f"{tmpdir}/info_logs.log") as f:
+            assert len(f.readlines()) == 1 + 5 + 9 + 9
+    assert results == [
+        {'hostname': 'host', 'hostnames': ['host-1', 'host-2']},
+        {'init_timestamp': 1565721477219, 'end_timestamp': 1565725077219, 'origin_host': 'origin-host',
+         'end_host': 'end-host', 'connected_to': ['host-2'], 'connected_from': [], 'max_connections': 'host-2'},
+        {'init_timestamp': 1565721477219, 'end_timestamp': 1565725077219, 'origin_host': 'origin-host',
+         'end_host': 'end-host', 'connected_to': [], 'connected_from': [], 'top_connections': [['host-2', 5, 1]]},
+    ]
+
+
+def test_logger_results_file_text() -> None:
+    """Check that the results are written as they are logged to a text results file."""
+    with TemporaryDirectory() as tmpdir:
+        with patch("log_parser.logger.LOGS_DIR", tmpdir):
+            logger = Logger()
+        with raises(ValueError):
+            logger.set_results_file(f"{tmpdir}/results.txt", 'xml')
+        logger.set_results_file(f"{tmpdir}/results.txt", 'text')
+        logger.info("Not a result")
+        logger.log_connected_hostnames('host', {'host-2'})
+        logger.set_results_file(None)
+        logger.log_connected_hostnames('host', {'host-3'})
+        logger.flush()
+        with open(f"{tmpdir}/results.txt") as f:
+            assert f.readlines() == ["#" * 100 + '\n', "The hostnames connected to host are:\n", "- host-2\n",
+                                     "#" * 100 + '\n']
+
+
+def test_import_without_side_effects() -> None:
+    """Check that importing the package doesn't create the logs directory."""
+    with TemporaryDirectory() as tmpdir:
+        subprocess.run([sys.executable, "-c", "import log_parser.connected_hostnames, log_parser.unlimited_parser"],
+                       env={**os.environ, 'LOGS_DIR': f"{tmpdir}/logs", 'PYTHONPATH': os.getcwd()}, check=True)
+        assert not path.isdir(f"{tmpdir}/logs")
@@ -0,0 +1,182 @@
+"""Test suite for the hourly rollups."""
+from collections import Counter
+import gzip
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
+
+from pytest import importorskip, mark, raises
+
+from log_parser.columnar import convert
+from log_parser.constants import HOUR_TIMESTAMP
+from log_parser.rollup import (
+    build_rollups, HourRollup, ID_BITS, is_rollup, load_rollups, report_rollups, roll_range, Rollups, split_hours
+)
+from log_parser.window import SlidingWindow
+from tests.test_cache import _write_hours, INIT_TIMESTAMP
+
+EXAMPLE_HOUR = 1565719200000
+
+
+def _states(rollups: Rollups, origin_host: str, end_host: str, hours: range) -> list:
+    """Returns the state of each hour of the rollups."""
+    return [rollups.state(origin_host, end_host, INIT_TIMESTAMP + hour * HOUR_TIMESTAMP,
+                          INIT_TIMESTAMP + (hour + 1) * HOUR_TIMESTAMP) for hour in hours]
+
+
+@mark.parametrize("origin_host,end_host", [
+    ['Denija', 'Yurith'], ['Yurith', 'Keden'], ['Unknown', 'Yurith'],
+])
+def test_state(origin_host: str, end_host: str) -> None:
+    """Check that the aggregates of each hour are the same as the ones of the sliding window."""
+    with TemporaryDirectory() as tmpdir:
+        build_rollups('tests/data/example.txt', f"{tmpdir}/log.rollup")
+        rollups = load_rollups(f"{tmpdir}/log.rollup")
+    assert sorted(rollups.hours) == [EXAMPLE_HOUR, EXAMPLE_HOUR + HOUR_TIMESTAMP]
+    for window in (HOUR_TIMESTAMP, 2 * HOUR_TIMESTAMP):
+        sliding_window = SlidingWindow(origin_host, end_host, EXAMPLE_HOUR, window=window)
+        with open('tests/data/example.txt') as f:
+            for line in f:
+                timestamp, origin, end = line.split()
+                sliding_window.add(int(timestamp), origin, end)
+        assert rollups.state(origin_host, end_host, EXAMPLE_HOUR, EXAMPLE_HOUR + window) == sliding_window.state()
+
+
+def test_hour_merge() -> None:
+    """Check that merging the counts into an hour gives the same hour as building it with all of them."""
+    first = {1 << ID_BITS | 2: 3, 2 << ID_BITS | 1: 1}
+    second = {1 << ID_BITS | 2: 2, 5 << ID_BITS | 2: 4, 2 << ID_BITS | 7: 1}
+    hour = HourRollup.from_counts(EXAMPLE_HOUR, first)
+    hour.merge(second)
+    hour.merge({2 << ID_BITS | 1: 6})
+    expected = HourRollup.from_counts(EXAMPLE_HOUR, {1 << ID_BITS | 2: 5, 2 << ID_BITS | 1: 7, 5 << ID_BITS | 2: 4,
+                                                     2 << ID_BITS | 7: 1})
+    columns = ('pairs', 'counts', 'end_pairs', 'host_ids', 'host_counts')
+    assert [getattr(hour, column) for column in columns] == [getattr(expected, column) for column in columns]
+    assert list(expected.host_counts) == [5 + 7, 5 + 7 + 4 + 1, 4, 1]
+    assert hour.connected_to(2) == [1, 5] and hour.connected_from(2) == [1, 7]
+
+
+def test_roll_range() -> None:
+    """Check that the lines are counted by pair of hostnames and hour, also the lines out of order."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        with open(input_file, 'w') as f:
+            f.write(f"{INIT_TIMESTAMP + HOUR_TIMESTAMP} A B\n{INIT_TIMESTAMP + 10} A B\n"
+                    f"{INIT_TIMESTAMP + HOUR_TIMESTAMP + 1} A B\r\n{INIT_TIMESTAMP + 20} B A\n{INIT_TIMESTAMP + 30} B")
+        result = roll_range(input_file, 0)
+        assert result.lines == 4
+        assert result.position == os.path.getsize(input_file) - len(f"{INIT_TIMESTAMP + 30} B")
+        assert result.hostnames.split(b"\n") == [b"A", b"B"]
+        assert set(result.hours) == {INIT_TIMESTAMP, INIT_TIMESTAMP + HOUR_TIMESTAMP}
+        assert roll_range(input_file, result.position - len(f"{INIT_TIMESTAMP + 20} B A\n")).lines == 1
+        with open(input_file, 'rb') as f, gzip.open(f"{input_file}.gz", 'wb') as compressed:
+            compressed.write(f.read())
+        assert roll_range(f"{input_file}.gz", 0).hours.keys() == result.hours.keys()
+        assert roll_range(f"{input_file}.gz", result.position + 100).lines == 0
+        with open(input_file, 'a') as f:
+            f.write(" C D\n")
+        with raises(ValueError):
+            roll_range(input_file, 0)
+
+
+def test_split_hours() -> None:
+    """Check that the ranges begin near the hours and cover the whole range."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_hours(input_file, range(4))
+        size = os.path.getsize(input_file)
+        ranges = split_hours(input_file, 0, size, 200000)
+        assert len(ranges) == 4
+        assert ranges[0][0] == 0 and ranges[-1][1] == size
+        assert all(end == start for (_, end), (start, _) in zip(ranges[:-1], ranges[1:]))
+        assert len(split_hours(input_file, 0, size, 2)) > 4
+        assert split_hours(input_file, size, size, 2) == []
+
+
+def test_build_parallel() -> None:
+    """Check that the hour-aligned ranges rolled up in parallel give the same rollups."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_hours(input_file, range(4))
+        assert build_rollups(input_file, f"{tmpdir}/single.rollup") == 24
+        assert build_rollups(input_file, f"{tmpdir}/parallel.rollup", use_multithread=True, workers=2,
+                             batch_size=2) == 24
+        single, parallel = load_rollups(f"{tmpdir}/single.rollup"), load_rollups(f"{tmpdir}/parallel.rollup")
+    assert _states(parallel, 'host-1', 'host-B', range(4)) == _states(single, 'host-1', 'host-B', range(4))
+    assert _states(single, 'host-1', 'host-B', range(1, 2)) == [{
+        'connected_to': {'host-1'}, 'connected_from': {'host-B'},
+        'counter_connections': Counter({'host-1': 6, 'host-B': 6})}]
+    assert parallel.sources == single.sources
+
+
+def test_incremental() -> None:
+    """Check that only the lines appended are rolled up, also once the log has been rotated and compressed."""
+    with TemporaryDirectory() as tmpdir:
+        input_file, rollup_file = f"{tmpdir}/logs/log.txt", f"{tmpdir}/log.rollup"
+        os.mkdir(f"{tmpdir}/logs")
+        _write_hours(input_file, range(2))
+        with open(input_file, 'a') as f:
+            f.write(f"{INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP} host-2")
+        assert build_rollups(input_file, rollup_file) == 12
+        assert build_rollups(input_file, rollup_file) == 0
+        with open(input_file, 'a') as f:
+            f.write(" host-B\n")
+        _write_hours(input_file, range(2, 3), mode='a')
+        with open(input_file, 'a') as f:
+            f.write(f"{INIT_TIMESTAMP + HOUR_TIMESTAMP + 1} host-late host-B\n")
+        assert build_rollups(input_file, rollup_file) == 8
+        with open(input_file, 'rb') as f, gzip.open(f"{input_file}.1.gz", 'wb') as compressed:
+            compressed.write(f.read())
+        _write_hours(input_file, range(3, 4))
+        assert build_rollups(f"{tmpdir}/logs", rollup_file) == 6
+        _write_hours(f"{tmpdir}/all.txt", range(4))
+        with open(f"{tmpdir}/all.txt", 'a') as f:
+            f.write(f"{INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP} host-2 host-B\n"
+                    f"{INIT_TIMESTAMP + HOUR_TIMESTAMP + 1} host-late host-B\n")
+        build_rollups(f"{tmpdir}/all.txt", f"{tmpdir}/all.rollup")
+        rollups, expected = load_rollups(rollup_file), load_rollups(f"{tmpdir}/all.rollup")
+    assert len(rollups.sources) == 2
+    assert _states(rollups, 'host-B', 'host-B', range(4)) == _states(expected, 'host-B', 'host-B', range(4))
+    assert rollups.state('host-B', 'host-B', INIT_TIMESTAMP + HOUR_TIMESTAMP, INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP)[
+        'connected_to'] == {'host-1', 'host-late'}
+
+
+def test_build_columnar() -> None:
+    """Check that the columnar logs of a directory aren't rolled up."""
+    importorskip("numpy")
+    with TemporaryDirectory() as tmpdir:
+        convert('tests/data/example.txt', f"{tmpdir}/log.lpc")
+        assert build_rollups(tmpdir, f"{tmpdir}/log.rollup") == 0
+
+
+def test_load_rollups() -> None:
+    """Check that a missing file gives empty rollups and that a file that isn't valid isn't replaced."""
+    with TemporaryDirectory() as tmpdir:
+        assert not load_rollups(f"{tmpdir}/log.rollup").hours
+        build_rollups('tests/data/example.txt', f"{tmpdir}/log.rollup")
+        assert is_rollup(f"{tmpdir}/log.rollup")
+        assert not is_rollup('tests/data/example.txt')
+        with open(f"{tmpdir}/log.rollup", 'rb') as f:
+            data = f.read()
+        for invalid_data in (data[:-4], data[:-8], data[:4] + b"\xff" + data[5:]):
+            with open(f"{tmpdir}/log.rollup", 'wb') as f:
+                f.write(invalid_data)
+            with raises(ValueError, match="isn't a valid rollup file"):
+                load_rollups(f"{tmpdir}/log.rollup")
+        with raises(ValueError):
+            build_rollups('tests/data/example.txt', 'tests/data/example.txt')
+
+
+@patch("log_parser.rollup.logger")
+def test_report(mock_logger: Mock) -> None:
+    """Check that a resume is logged for each period and that the periods must be whole hours."""
+    with TemporaryDirectory() as tmpdir:
+        build_rollups('tests/data/example.txt', f"{tmpdir}/log.rollup")
+        report_rollups(f"{tmpdir}/log.rollup", 'Denija', 'Yurith', EXAMPLE_HOUR, EXAMPLE_HOUR + 3 * HOUR_TIMESTAMP)
+        with raises(ValueError):
+            report_rollups(f"{tmpdir}/log.rollup", 'Denija', 'Yurith', EXAMPLE_HOUR + 1, EXAMPLE_HOUR + HOUR_TIMESTAMP)
+    calls = mock_logger.log_resume_last_hour.mock_calls
+    assert [call[1][0] for call in calls] == [EXAMPLE_HOUR + hour * HOUR_TIMESTAMP for hour in range(3)]
+    assert calls[1][1][3]['connected_to'] == {'Marybell', 'Nyson', 'Denija', 'Teniyah'}
+    assert calls[2][1][3]['counter_connections'] == Counter()
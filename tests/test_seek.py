@@ -0,0 +1,50 @@
+"""Test suite for seek helpers."""
+from tempfile import NamedTemporaryFile
+
+from pytest import mark
+
+from log_parser.constants import TIMESTAMP_MARGIN
+from log_parser.seek import bisect_end_offset, bisect_offset, find_offset
+
+
+@mark.parametrize("timestamp", [0, 1565721477210, 1565721493153, 1565725077229, 1565725377279, 1565800000000])
+def test_find_offset(timestamp: int) -> None:
+    """Check that no line with a timestamp in the period is before the offset."""
+    with open('tests/data/example.txt', 'rb') as f:
+        content = f.read()
+    offset = find_offset('tests/data/example.txt', timestamp)
+    assert offset == 0 or content[offset - 1:offset] == b"\n"
+    for line in content[:offset].splitlines():
+        assert int(line[:13]) < timestamp
+
+
+def test_bisect_offset_skips_old_lines() -> None:
+    """Check that the bisection skips the lines far before the period."""
+    lines = [f"{1000000000000 + i * 1000} host-{i} host-H\n".encode() for i in range(10000)]
+    timestamp = 1000000000000 + 9000 * 1000
+    with NamedTemporaryFile() as f:
+        f.write(b"".join(lines))
+        f.flush()
+        f.seek(0)
+        offset = bisect_offset(f, timestamp)
+    skipped = b"".join(lines).count(b"\n", 0, offset)
+    assert 9000 - TIMESTAMP_MARGIN // 1000 - 1 <= skipped < 9000 - TIMESTAMP_MARGIN // 1000
+
+
+def test_bisect_offset_incomplete_line() -> None:
+    """Check that an incomplete last line is ignored."""
+    with NamedTemporaryFile() as f:
+        f.write(b"1000000000000 host-A host-H\n1000000900000 host-B")
+        f.flush()
+        assert bisect_offset(f, 1000000900000) == 0
+
+
+@mark.parametrize("timestamp", [0, 1565721477210, 1565721493153, 1565725077229, 1565725377279, 1565800000000])
+def test_bisect_end_offset(timestamp: int) -> None:
+    """Check that no line with a timestamp lower or equal than timestamp is after the offset."""
+    with open('tests/data/example.txt', 'rb') as f:
+        content = f.read()
+        offset = bisect_end_offset(f, timestamp)
+    assert offset == 0 or content[offset - 1:offset] == b"\n"
+    for line in content[offset:].splitlines():
+        assert int(line[:13]) > timestamp
@@ -0,0 +1,259 @@
+"""Test suite for the query server."""
+import asyncio
+from collections import Counter
+import json
+import os
+import socket
+from tempfile import TemporaryDirectory
+from threading import Thread
+from time import sleep
+from typing import Any, Dict, List
+from unittest.mock import Mock, patch
+
+from pytest import mark, raises
+
+from log_parser import server
+from log_parser.client import query_server, request, socket_path
+from log_parser.connected_hostnames import process_batch
+from log_parser.constants import HOUR_TIMESTAMP, MINUTE_TIMESTAMP
+from log_parser.follow import Follower
+from log_parser.index import refresh_index
+from log_parser.server import _serve, ResidentLog
+from tests.test_cache import _write_hours, INIT_TIMESTAMP
+
+
+def _resident_log(input_file: str, retention: int = 24) -> ResidentLog:
+    """Returns the resident log of input_file with all its lines."""
+    resident_log = ResidentLog(input_file, retention)
+    with open(input_file) as f:
+        resident_log.add_lines(f.read().splitlines())
+    return resident_log
+
+
+@mark.parametrize("int_timestamp,end_timestamp,hostname", [
+    [1565721477210, 1565725377280, 'Yurith'],
+    [1565721488843, 1565721500212, 'Yurith'],
+    [1565722800000, 1565726400000, 'Yurith'],
+    [1565725077229, 1565725377270, 'Keden'],
+    [1565721477210, 1565725377280, 'Unknown'],
+])
+def test_connected(int_timestamp: int, end_timestamp: int, hostname: str) -> None:
+    """Check that the connected hostnames are the ones read by the connected command."""
+    resident_log = _resident_log('tests/data/example.txt')
+    with open('tests/data/example.txt') as f:
+        expected = process_batch(f, int_timestamp, end_timestamp, hostname, len(hostname))
+    assert asyncio.run(resident_log.connected(hostname, int_timestamp, end_timestamp)) == expected
+
+
+def test_connected_minutes() -> None:
+    """Check the partial hours of a host, the minutes covered partially are read from the log."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        with open(input_file, 'w') as f:
+            f.writelines(f"{INIT_TIMESTAMP + line * 1000} host-{line} host-B\n" for line in range(2000))
+        resident_log = _resident_log(input_file)
+        with patch.object(server, '_scan_log', wraps=server._scan_log) as mock_scan_log:
+            partial = resident_log.connected('host-B', INIT_TIMESTAMP + 1000 * 1000, INIT_TIMESTAMP + 1003 * 1000)
+            assert asyncio.run(partial) == {'host-1000', 'host-1001', 'host-1002'}
+            partial = resident_log.connected('host-B', INIT_TIMESTAMP + 1, INIT_TIMESTAMP + 10 ** 6)
+            assert len(asyncio.run(partial)) == 999
+            assert mock_scan_log.call_count == 3
+            whole = resident_log.connected('host-B', INIT_TIMESTAMP + MINUTE_TIMESTAMP, INIT_TIMESTAMP + 180 * 1000)
+            assert asyncio.run(whole) == {f"host-{line}" for line in range(60, 180)}
+            assert mock_scan_log.call_count == 3
+        resident_log.restart(os.stat(input_file).st_ino)
+        partial = resident_log.connected('host-B', INIT_TIMESTAMP + 1000 * 1000, INIT_TIMESTAMP + 1003 * 1000)
+        assert asyncio.run(partial) == {f"host-{line}" for line in range(960, 1020)}
+
+
+def test_hour_aggregate_bounded() -> None:
+    """Check that the aggregate of an hour grows with the distinct hostnames of each minute, not with the lines."""
+    resident_log = ResidentLog('tests/data/example.txt')
+    for _ in range(10):
+        resident_log.add_lines([f"{INIT_TIMESTAMP + second * 1000} host-{second % 3} host-B" for second in range(600)])
+    aggregate = resident_log.hours[INIT_TIMESTAMP]
+    assert sum(len(origins) for minutes in aggregate.minute_origins.values() for origins in minutes.values()) == 30
+    assert aggregate.connections[resident_log.hostnames.get('host-B')] == 6000
+
+
+def test_top() -> None:
+    """Check that the connections are counted by the whole minutes that overlap the period."""
+    resident_log = ResidentLog('tests/data/example.txt')
+    resident_log.add_lines([
+        f"{INIT_TIMESTAMP + 10} A B", f"{INIT_TIMESTAMP + MINUTE_TIMESTAMP} A C",
+        f"{INIT_TIMESTAMP + 2 * MINUTE_TIMESTAMP} A B", f"{INIT_TIMESTAMP + HOUR_TIMESTAMP} D B",
+        f"{INIT_TIMESTAMP + HOUR_TIMESTAMP + 1} E B",
+    ])
+    assert resident_log.top(INIT_TIMESTAMP, INIT_TIMESTAMP + HOUR_TIMESTAMP, k=2) == [('A', 3), ('B', 2)]
+    assert resident_log.top(INIT_TIMESTAMP + 20, INIT_TIMESTAMP + MINUTE_TIMESTAMP + 1, k=3) == [
+        ('A', 2), ('B', 1), ('C', 1)]
+    assert resident_log.top(INIT_TIMESTAMP, INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP) == [('B', 4)]
+    assert resident_log.top(INIT_TIMESTAMP + 3 * HOUR_TIMESTAMP, INIT_TIMESTAMP + 4 * HOUR_TIMESTAMP) == []
+
+
+def test_eviction() -> None:
+    """Check that the hours out of the retention are evicted and scanned again from the index."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_hours(input_file, range(4))
+        resident_log = ResidentLog(input_file, 2, refresh_index(input_file))
+        assert resident_log.retained_from == INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP
+        with open(input_file) as f:
+            resident_log.add_lines(f.read().splitlines())
+        assert sorted(resident_log.hours) == [INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP, INIT_TIMESTAMP + 3 * HOUR_TIMESTAMP]
+        assert asyncio.run(resident_log.connected('host-B', INIT_TIMESTAMP, INIT_TIMESTAMP + 4 * HOUR_TIMESTAMP)) == {
+            f"host-{hour}" for hour in range(4)}
+        with raises(ValueError):
+            resident_log.top(INIT_TIMESTAMP, INIT_TIMESTAMP + 4 * HOUR_TIMESTAMP)
+        resident_log.restart(os.stat(input_file).st_ino)
+        with raises(ValueError):
+            asyncio.run(resident_log.connected('host-B', INIT_TIMESTAMP, INIT_TIMESTAMP + 4 * HOUR_TIMESTAMP))
+    with raises(ValueError):
+        ResidentLog('tests/data/example.txt', 0)
+
+
+def _respond(resident_log: ResidentLog, line: bytes) -> Dict[str, Any]:
+    """Returns the response of resident_log to a JSON line."""
+    return asyncio.run(resident_log.respond(line))
+
+
+def test_answer() -> None:
+    """Check the responses to the queries and to the invalid ones."""
+    resident_log = _resident_log('tests/data/example.txt')
+    assert _respond(resident_log, (
+        b'{"query": "connected", "hostname": "Yurith", "init_timestamp": 1565721488843, '
+        b'"end_timestamp": 1565721500212}')) == {'hostname': 'Yurith', 'hostnames': ['Denija', 'Nyson']}
+    assert _respond(
+        resident_log, b'{"query": "top", "init_timestamp": 1565721477210, "end_timestamp": 1565725377280}') == {
+        'top': [['Yurith', 8]]}
+    assert _respond(resident_log, b'{"query": "status"}')['lines'] == 15
+    assert _respond(resident_log, b'{"query": "other"}') == {'error': "ValueError: Unknown query other"}
+    assert _respond(resident_log, b'{"query": "top"}') == {'error': "KeyError: 'init_timestamp'"}
+    assert 'error' in _respond(resident_log, b'not json')
+    with raises(ValueError):
+        server.serve('tests/data')
+
+
+def test_answer_unreadable_log() -> None:
+    """Check that a query that can't read the log is answered with the error."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_hours(input_file, range(4))
+        resident_log = ResidentLog(input_file, 2, refresh_index(input_file))
+        with open(input_file) as f:
+            resident_log.add_lines(f.read().splitlines())
+        os.remove(input_file)
+        query = json.dumps({'query': 'connected', 'hostname': 'host-B', 'init_timestamp': INIT_TIMESTAMP,
+                            'end_timestamp': INIT_TIMESTAMP + 4 * HOUR_TIMESTAMP}).encode()
+        assert _respond(resident_log, query)['error'].startswith("FileNotFoundError: ")
+
+
+def test_serve() -> None:
+    """Check that concurrent clients are answered while the followed log grows."""
+    async def _wait_lines(path: str, lines: int) -> None:
+        for _ in range(100):
+            if (await request([{'query': 'status'}], path))[0]['lines'] == lines:
+                return
+            await asyncio.sleep(0.05)
+        raise AssertionError(f"The server hasn't read {lines} lines")
+
+    async def _run(input_file: str, path: str) -> List[List[Dict[str, Any]]]:
+        resident_log = ResidentLog(input_file)
+        task = asyncio.ensure_future(_serve(resident_log, Follower(input_file), path=path))
+        try:
+            for _ in range(100):
+                if os.path.exists(path):
+                    break
+                await asyncio.sleep(0.01)
+            await _wait_lines(path, 15)
+            query = {'query': 'connected', 'hostname': 'Yurith', 'init_timestamp': 1565721477210,
+                     'end_timestamp': 1565725377280}
+            top = {'query': 'top', 'init_timestamp': 1565721477210, 'end_timestamp': 1565725377280}
+            responses = await asyncio.gather(*(request([query, top], path) for _ in range(5)))
+            with open(input_file, 'a') as f:
+                f.write("1565725377279 Zoe Yurith\n")
+            await _wait_lines(path, 16)
+            responses.append(await request([query], path))
+        finally:
+            task.cancel()
+        return responses
+
+    with TemporaryDirectory() as tmpdir:
+        input_file, path = f"{tmpdir}/log.txt", f"{tmpdir}/log.sock"
+        with open('tests/data/example.txt') as f, open(input_file, 'w') as log:
+            log.write(f.read())
+        responses = asyncio.run(_run(input_file, path))
+    expected_hostnames = ['Denija', 'Marybell', 'Nyson', 'Teniyah']
+    assert all(response == [{'hostname': 'Yurith', 'hostnames': expected_hostnames}, {'top': [['Yurith', 8]]}]
+               for response in responses[:5])
+    assert responses[5][0]['hostnames'] == expected_hostnames + ['Zoe']
+    assert Counter(line.split()[2] for line in open('tests/data/example.txt'))['Yurith'] == 8
+
+
+def _free_port() -> int:
+    """Returns a TCP port that nobody is listening on."""
+    with socket.socket() as free_socket:
+        free_socket.bind(('localhost', 0))
+        return free_socket.getsockname()[1]
+
+
+def test_serve_tcp() -> None:
+    """Check that the queries are answered on a TCP port, reading the whole log scanned off the executor."""
+    async def _run(port: int) -> List[Dict[str, Any]]:
+        resident_log = ResidentLog('tests/data/example.txt')
+        task = asyncio.ensure_future(_serve(resident_log, Follower('tests/data/example.txt'), False, port=port))
+        try:
+            for _ in range(100):
+                try:
+                    return await request([{'query': 'status'}, {'query': 'other'}], port=port)
+                except ConnectionError:
+                    await asyncio.sleep(0.01)
+            raise AssertionError("The server isn't listening")
+        finally:
+            task.cancel()
+
+    status, error = asyncio.run(_run(_free_port()))
+    assert status['input_file'] == 'tests/data/example.txt'
+    assert error == {'error': "ValueError: Unknown query other"}
+
+
+@patch("log_parser.server.logger")
+def test_serve_function(mock_logger: Mock) -> None:
+    """Check that serve listens on the socket of the log, removing a stale one, until it's cancelled."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        _write_hours(input_file, range(4))
+        path = socket_path(input_file)
+        open(path, 'w').close()
+        serving: Dict[str, Any] = {}
+        real_serve = server._serve
+
+        async def _serve_here(*args: Any) -> None:
+            serving.update(loop=asyncio.get_running_loop(), task=asyncio.current_task(), args=args)
+            await real_serve(*args)
+
+        def _run() -> None:
+            with raises(asyncio.CancelledError):
+                server.serve(input_file, retention=2, follow=False)
+
+        with patch("log_parser.server._serve", _serve_here):
+            thread = Thread(target=_run)
+            thread.start()
+            try:
+                for _ in range(100):
+                    try:
+                        status = query_server({'query': 'status'}, input_file)
+                        break
+                    except (ConnectionError, FileNotFoundError):
+                        sleep(0.01)
+                with raises(ValueError, match="Unknown query other"):
+                    query_server({'query': 'other'}, input_file)
+            finally:
+                while 'task' not in serving:
+                    sleep(0.01)
+                serving['loop'].call_soon_threadsafe(serving['task'].cancel)
+                thread.join(5)
+        assert not os.path.exists(path)
+    assert serving['args'][0].retained_from == INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP
+    assert status['hours'] == [INIT_TIMESTAMP + 2 * HOUR_TIMESTAMP, INIT_TIMESTAMP + 3 * HOUR_TIMESTAMP]
+    mock_logger.info.assert_called_once_with(f"Serving {input_file} on {path}")
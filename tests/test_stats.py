@@ -0,0 +1,183 @@
+"""Test suite for the statistics."""
+import asyncio
+import json
+from multiprocessing import Pool
+import os
+import pstats
+from tempfile import TemporaryDirectory
+from time import time
+from unittest.mock import Mock, patch
+
+from pytest import approx
+
+from log_parser.connected_hostnames import get_connected_hostnames
+from log_parser.follow import Follower
+from log_parser.stats import _run_task, imap, starmap, Stats, stats
+from log_parser.unlimited_parser import _log_stats_periodically, _unlimited, follow_stats
+from log_parser.window import SlidingWindow
+
+
+def _count_lines(lines: int, matches: int) -> int:
+    """Counts lines and matches, like the scans do in the workers."""
+    stats.count(lines=lines, matches=matches)
+    return lines
+
+
+def test_stats_stopped() -> None:
+    """Check that nothing is measured until the statistics are started."""
+    run_stats = Stats()
+    run_stats.count(lines=10)
+    run_stats.set(last_timestamp=1)
+    with run_stats.timer('scan'):
+        pass
+    assert not run_stats.counters and not run_stats.gauges and not run_stats.timings
+    run_stats.start()
+    run_stats.count(lines=10)
+    run_stats.count(lines=5, matches=1)
+    run_stats.set(last_timestamp=1)
+    with run_stats.timer('scan'):
+        pass
+    result = run_stats.stop()
+    assert result['counters'] == {'lines': 15, 'matches': 1}
+    assert result['gauges'] == {'last_timestamp': 1}
+    assert list(result['timings']) == ['scan']
+    assert result['workers'] == []
+
+
+def test_pool_tasks() -> None:
+    """Check that the tasks of a pool are measured in their workers and merged."""
+    with Pool(2) as p:
+        assert starmap(p, _count_lines, [(10, 1), (20, 2)]) == [10, 20]
+        assert stats.counters == {}
+        stats.start()
+        try:
+            assert starmap(p, _count_lines, [(10, 1), (20, 2)]) == [10, 20]
+            assert list(imap(p, _count_lines, [(30, 3)])) == [30]
+        finally:
+            result = stats.stop()
+    assert result['counters'] == {'lines': 60, 'matches': 6}
+    assert sum(worker['tasks'] for worker in result['workers']) == 3
+    assert sum(worker['lines'] for worker in result['workers']) == 60
+    assert all(worker['pid'] != os.getpid() and worker['queue_wait'] >= 0 for worker in result['workers'])
+
+
+def test_run_task() -> None:
+    """Check that a task is measured in its process and that the measures of its worker are merged."""
+    try:
+        result = _run_task((_count_lines, time() - 1, (10, 1), False))
+        assert not stats.enabled
+        assert (result.value, result.pid, result.counters, result.profile) == (
+            10, os.getpid(), {'lines': 10, 'matches': 1}, None)
+        assert result.queue_wait >= 1 and result.seconds >= 0
+        profiled = _run_task((_count_lines, time(), (20, 2), True))
+        assert profiled.counters == {'lines': 20, 'matches': 2}
+        assert '_count_lines' in {function for _, _, function in profiled.profile}  # type: ignore
+    finally:
+        stats.reset()
+    run_stats = Stats()
+    run_stats.start()
+    assert run_stats.merge_task(result) == 10 and run_stats.merge_task(profiled) == 20
+    merged = run_stats.stop()
+    assert merged['counters'] == {'lines': 30, 'matches': 3}
+    [worker] = merged['workers']
+    assert {key: worker[key] for key in ('pid', 'tasks', 'lines', 'matches')} == {
+        'pid': os.getpid(), 'tasks': 2, 'lines': 30, 'matches': 3}
+    assert (worker['seconds'], worker['queue_wait']) == approx(
+        (result.seconds + profiled.seconds, result.queue_wait + profiled.queue_wait))
+
+
+@patch("log_parser.connected_hostnames.logger")
+def test_profile(mock_logger: Mock) -> None:
+    """Check that the profile has the functions run by the workers and the counters of the scan."""
+    with TemporaryDirectory() as tmpdir:
+        stats.start(profile=True)
+        try:
+            get_connected_hostnames('tests/data/example.txt', 1565721477210, 1565725377280, 'Yurith',
+                                    use_multithread=True, workers=2, batch_size=5)
+        finally:
+            result = stats.stop(f"{tmpdir}/profile")
+        functions = {function for _, _, function in pstats.Stats(f"{tmpdir}/profile").stats}  # type: ignore
+    assert {'get_connected_hostnames', 'process_batch'} <= functions
+    assert result['counters']['lines'] == 15
+    assert result['counters']['matches'] == 8
+    assert result['counters']['bytes_read'] == os.path.getsize('tests/data/example.txt')
+    assert {'select', 'split', 'scan', 'output'} <= set(result['timings'])
+
+
+@patch("log_parser.connected_hostnames.logger")
+def test_skipped_lines(mock_logger: Mock) -> None:
+    """Check the counters of a scan in single thread."""
+    stats.start()
+    try:
+        get_connected_hostnames('tests/data/example.txt', 1565725077229, 1565725377270, 'Yurith')
+    finally:
+        result = stats.stop()
+    assert result['counters']['skipped_lines'] == 8
+    assert result['counters']['matches'] == 3
+
+
+def test_follow_stats() -> None:
+    """Check the lag and the rate of the parser."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        with open(input_file, 'w') as f:
+            f.write("1565721477210 A B\n" * 10)
+        follower = Follower(input_file, offset=36)
+        stats.start()
+        try:
+            stats.count(lines=20)
+            with patch("log_parser.unlimited_parser._now", return_value=1565721487210):
+                assert follow_stats(follower, 10, 2) == {'path': input_file, 'position': 36, 'lines': 20,
+                                                         'lines_per_second': 5, 'lag_bytes': 144, 'lag_seconds': None}
+                stats.set(last_timestamp=1565721477210)
+                assert follow_stats(follower, 10, 2)['lag_seconds'] == 10
+            os.remove(input_file)
+            assert follow_stats(follower, 20, 0)['lag_bytes'] is None
+            assert follow_stats(follower, 20, 0)['lines_per_second'] == 0
+        finally:
+            stats.stop()
+
+
+@patch("log_parser.unlimited_parser.logger")
+def test_log_stats_periodically(mock_logger: Mock) -> None:
+    """Check that the progress of the parser is logged every interval as a JSON line."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        with open(input_file, 'w') as f:
+            f.write("1565721477210 A B\n" * 10)
+        follower = Follower(input_file, offset=36)
+
+        async def _run() -> None:
+            task = asyncio.ensure_future(_log_stats_periodically(follower, 0.01))
+            await asyncio.sleep(0)
+            stats.count(lines=2)
+            await asyncio.sleep(0.05)
+            task.cancel()
+        stats.start()
+        try:
+            stats.count(lines=4)
+            asyncio.run(_run())
+        finally:
+            stats.stop()
+    logged = [json.loads(call[1][0]) for call in mock_logger.info.mock_calls]
+    assert len(logged) >= 2 and all(list(line) == ['stats'] for line in logged)
+    assert logged[0]['stats'] == {'path': input_file, 'position': 36, 'lines': 6, 'lines_per_second': approx(200),
+                                  'lag_bytes': 144, 'lag_seconds': None}
+    assert logged[1]['stats']['lines_per_second'] == 0
+
+
+@patch("log_parser.unlimited_parser.logger")
+def test_log_stats_while_reading(mock_logger: Mock) -> None:
+    """Check that the stats are logged while the lines flow, not only when the follower reaches the end."""
+    with TemporaryDirectory() as tmpdir:
+        input_file = f"{tmpdir}/log.txt"
+        with open(input_file, 'w') as f:
+            f.write("1565721477210 A B\n" * 100)
+        follower = Follower(input_file, chunk_size=180)
+        stats.start()
+        try:
+            asyncio.run(_unlimited(follower, SlidingWindow('A', 'B', 1565721477210), False, stats_interval=0))
+        finally:
+            stats.stop()
+    positions = [json.loads(call[1][0])['stats']['position'] for call in mock_logger.info.mock_calls]
+    assert positions and min(positions) < 1800
@@ -1,28 +1,24 @@
 """Test suite for unlimited parser."""
+import asyncio
 from collections import Counter
+from tempfile import TemporaryDirectory
 from unittest.mock import call, Mock, patch
 
-from pytest import raises
+from pytest import mark
 
-from log_parser.unlimited_parser import unlimited
-
-
-class SleepException(Exception):
-    """Exception used to stop unlimited parser."""
-    pass
+from log_parser.constants import HOUR_TIMESTAMP, MINUTE_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.follow import Follower
+from log_parser.unlimited_parser import _unlimited, unlimited
+from log_parser.window import SlidingWindow
+from tests.test_files import write_rotated_logs
 
 
 @patch('log_parser.unlimited_parser.logger')
-@patch('log_parser.unlimited_parser.sleep')
-def test_unlimited(mock_sleep: Mock, mock_logger: Mock) -> None:
-    """Test unlimited function."""
-    def _sleep_side_effect(time: int) -> None:
-        raise SleepException
-    mock_sleep.side_effect = _sleep_side_effect
+def test_unlimited(mock_logger: Mock) -> None:
+    """Test unlimited function, the line before the first period isn't dropped but skipped."""
     mock_log_resume_last_hour = Mock()
     mock_logger.log_resume_last_hour = mock_log_resume_last_hour
-    with raises(SleepException):
-        unlimited('tests/data/example.txt', 'Denija', 'Yurith', 1565721477219)
+    unlimited('tests/data/example.txt', 'Denija', 'Yurith', 1565721477219, follow=False)
 
     # assert mock_log_resume_last_hour.call_count == 3
     expected_actual = {
@@ -36,9 +32,122 @@ def test_unlimited(mock_sleep: Mock, mock_logger: Mock) -> None:
         )
 
     }
-    calls = [
-        call(1565721477219, 'Denija', 'Yurith', expected_actual),
-        call(1565725077219, 'Denija', 'Yurith', expected_actual)
-    ]
-    assert mock_log_resume_last_hour.mock_calls[1] == calls[1]
-    mock_log_resume_last_hour.assert_has_calls(calls, any_order=False)
+    mock_log_resume_last_hour.assert_called_once_with(
+        1565721477219, 'Denija', 'Yurith', expected_actual, window=HOUR_TIMESTAMP)
+    mock_logger.warning.assert_not_called()
+
+
+@patch('log_parser.unlimited_parser.refresh_index')
+@patch('log_parser.unlimited_parser.logger')
+def test_unlimited_index(mock_logger: Mock, mock_refresh_index: Mock) -> None:
+    """Test unlimited function starting at the offset given by the index."""
+    mock_refresh_index.return_value.offset_for.return_value = len("1565721477210 A B\n")
+    unlimited('tests/data/example.txt', 'Denija', 'Yurith', 1565721477219, use_index=True, follow=False)
+    mock_refresh_index.return_value.offset_for.assert_called_once_with(1565721477219)
+    state = mock_logger.log_resume_last_hour.mock_calls[0][1][3]
+    assert state['connected_to'] == {'Marybell', 'Nyson', 'Denija', 'Teniyah'}
+    assert 'A' not in state['counter_connections']
+
+
+@patch('log_parser.unlimited_parser.logger')
+def test_unlimited_sliding(mock_logger: Mock) -> None:
+    """Test unlimited function reporting the last 15 minutes every 5 minutes."""
+    unlimited('tests/data/example.txt', 'Denija', 'Yurith', 1565721420000, window=15 * MINUTE_TIMESTAMP,
+              slide=5 * MINUTE_TIMESTAMP, margin=MINUTE_TIMESTAMP, follow=False)
+    calls = mock_logger.log_resume_last_hour.mock_calls
+    assert calls[0] == call(1565721420000, 'Denija', 'Yurith', {
+        'connected_to': {'Marybell', 'Nyson', 'Denija', 'Teniyah'},
+        'connected_from': {'Vidhu', 'Yurith'},
+        'counter_connections': Counter({
+            'Yurith': 4, 'Denija': 2, 'Marybell': 1, 'Albany': 1, 'Keden': 1, 'Hasya': 1,
+            'Laquarius': 1, 'Nyson': 1, 'Vidhu': 1, 'Teniyah': 1, 'A': 1, 'B': 1
+        })
+    }, window=15 * MINUTE_TIMESTAMP)
+    assert calls[1] == call(1565723820000, 'Denija', 'Yurith', {
+        'connected_to': set(), 'connected_from': set(), 'counter_connections': Counter()
+    }, window=15 * MINUTE_TIMESTAMP)
+
+
+@patch('log_parser.unlimited_parser.logger')
+@patch('log_parser.unlimited_parser._now')
+def test_unlimited_timer(mock_now: Mock, mock_logger: Mock) -> None:
+    """Test that the resume is logged by the timer while waiting for new lines."""
+    mock_now.return_value = 1565721477219 + HOUR_TIMESTAMP + TIMESTAMP_MARGIN
+
+    async def _run(log_file: str) -> None:
+        sliding_window = SlidingWindow('Denija', 'Yurith', 1565721477219)
+        task = asyncio.ensure_future(_unlimited(Follower(log_file), sliding_window, True))
+        await asyncio.sleep(0.2)
+        assert not task.done()
+        task.cancel()
+
+    with TemporaryDirectory() as tmpdir:
+        with open(f"{tmpdir}/log.txt", 'w') as f:
+            f.write("1565721493152 Denija Yurith\n")
+        asyncio.run(_run(f"{tmpdir}/log.txt"))
+    mock_logger.log_resume_last_hour.assert_called_once_with(1565721477219, 'Denija', 'Yurith', {
+        'connected_to': {'Denija'},
+        'connected_from': {'Yurith'},
+        'counter_connections': Counter({'Denija': 1, 'Yurith': 1})
+    }, window=HOUR_TIMESTAMP)
+
+
+@patch('log_parser.unlimited_parser.logger')
+@patch('log_parser.unlimited_parser._now')
+def test_unlimited_checkpoint(mock_now: Mock, mock_logger: Mock) -> None:
+    """Test that unlimited resumes from the checkpoint."""
+    mock_now.return_value = 1565725077219
+    with open('tests/data/example.txt') as f:
+        lines = f.readlines()
+    unlimited('tests/data/example.txt', 'Denija', 'Yurith', 1565721477219, follow=False)
+    expected_calls = mock_logger.log_resume_last_hour.mock_calls
+    assert len(expected_calls) == 1
+    mock_logger.reset_mock()
+    with TemporaryDirectory() as tmpdir:
+        log_file, checkpoint_file = f"{tmpdir}/log.txt", f"{tmpdir}/checkpoint"
+        with open(log_file, 'w') as f:
+            f.writelines(lines[:8])
+        unlimited(log_file, 'Denija', 'Yurith', 1565721477219, follow=False, checkpoint_file=checkpoint_file)
+        assert mock_logger.log_resume_last_hour.mock_calls == []
+        with open(log_file, 'a') as f:
+            f.writelines(lines[8:])
+        unlimited(log_file, 'Denija', 'Yurith', 1565721477219, follow=False, checkpoint_file=checkpoint_file)
+        assert mock_logger.log_resume_last_hour.mock_calls == expected_calls
+        mock_logger.reset_mock()
+        unlimited(log_file, 'Denija', 'Yurith', 1565721477219, follow=False, checkpoint_file=checkpoint_file,
+                  window=2 * HOUR_TIMESTAMP)
+        assert mock_logger.log_resume_last_hour.call_count == 0
+
+
+@mark.parametrize("use_index", [False, True])
+@patch('log_parser.unlimited_parser.logger')
+@patch('log_parser.unlimited_parser._now')
+def test_unlimited_directory(mock_now: Mock, mock_logger: Mock, use_index: bool) -> None:
+    """Test that the rotated logs of a directory are read in order like a single file, the first one compressed."""
+    mock_now.return_value = 1565725077219
+    unlimited('tests/data/example.txt', 'Denija', 'Yurith', 1565721477219, follow=False)
+    expected_calls = mock_logger.log_resume_last_hour.mock_calls
+    mock_logger.reset_mock()
+    with TemporaryDirectory() as tmpdir:
+        write_rotated_logs(tmpdir)
+        unlimited(tmpdir, 'Denija', 'Yurith', 1565721477219, use_index=use_index, follow=False)
+    assert mock_logger.log_resume_last_hour.mock_calls == expected_calls
+
+
+@patch('log_parser.unlimited_parser.logger')
+def test_unlimited_adaptive_margin(mock_logger: Mock) -> None:
+    """Test that with an adaptive margin the periods are reported earlier and the dropped lines are warned."""
+    init_timestamp = 1565647200000
+    with TemporaryDirectory() as tmpdir:
+        log_file = f"{tmpdir}/log.txt"
+        with open(log_file, 'w') as f:
+            f.write(f"{init_timestamp + 10} A B\n{init_timestamp + HOUR_TIMESTAMP + 20000} C B\n"
+                    f"{init_timestamp + HOUR_TIMESTAMP - 1000} D B\n")
+        unlimited(log_file, 'A', 'B', init_timestamp, follow=False)
+        assert mock_logger.log_resume_last_hour.mock_calls[0][1][3]['connected_to'] == {'A', 'D'}
+        mock_logger.warning.assert_not_called()
+        mock_logger.reset_mock()
+        unlimited(log_file, 'A', 'B', init_timestamp, follow=False, adaptive_margin=True)
+        assert mock_logger.log_resume_last_hour.mock_calls[0][1][3]['connected_to'] == {'A'}
+        mock_logger.warning.assert_called_once_with(
+            f"1 lines of {log_file} arrived after their period was reported, up to 21000 ms out of order")
@@ -0,0 +1,34 @@
+"""Test suite for the watermark."""
+from log_parser.constants import MINUTE_TIMESTAMP, TIMESTAMP_MARGIN
+from log_parser.watermark import Watermark
+
+
+def test_fixed_margin() -> None:
+    """Check that with a fixed margin only the lines more than the margin out of order are late."""
+    watermark = Watermark()
+    assert watermark.observe(10 * MINUTE_TIMESTAMP)
+    assert watermark.observe(10 * MINUTE_TIMESTAMP - TIMESTAMP_MARGIN)
+    assert not watermark.observe(10 * MINUTE_TIMESTAMP - TIMESTAMP_MARGIN - 1)
+    assert watermark.margin == TIMESTAMP_MARGIN
+    assert watermark.lateness == TIMESTAMP_MARGIN + 1
+    assert watermark.late_lines == 1
+    assert watermark.passed(5 * MINUTE_TIMESTAMP - 1)
+    assert not watermark.passed(5 * MINUTE_TIMESTAMP)
+
+
+def test_adaptive_margin() -> None:
+    """Check that the adaptive margin follows the greatest lateness observed up to the maximum."""
+    watermark = Watermark(adaptive=True, slack=1000)
+    assert watermark.observe(10 * MINUTE_TIMESTAMP)
+    assert watermark.margin == 1000
+    assert watermark.watermark == 10 * MINUTE_TIMESTAMP - 1000
+    assert watermark.observe(10 * MINUTE_TIMESTAMP - 1000)
+    assert not watermark.observe(10 * MINUTE_TIMESTAMP - 5000)
+    assert watermark.margin == 6000
+    assert watermark.observe(10 * MINUTE_TIMESTAMP - 6000)
+    assert watermark.late_lines == 1
+    assert not watermark.observe(0)
+    assert watermark.lateness == 10 * MINUTE_TIMESTAMP
+    assert watermark.margin == TIMESTAMP_MARGIN
+    assert not watermark.observe(0)
+    assert watermark.late_lines == 3
@@ -0,0 +1,108 @@
+"""Test suite for sliding window."""
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from pytest import raises
+
+from log_parser.constants import MINUTE_TIMESTAMP
+from log_parser.window import SlidingWindow
+
+
+def _expected_state(lines: List[Tuple[int, str, str]], init_timestamp: int, end_timestamp: int) -> Dict:
+    """Computes the state of a period from scratch."""
+    state: Dict = {'connected_to': set(), 'connected_from': set(), 'counter_connections': Counter()}
+    for timestamp, origin, end in lines:
+        if init_timestamp <= timestamp < end_timestamp:
+            if origin == 'host-O':
+                state['connected_from'].add(end)
+            if end == 'host-E':
+                state['connected_to'].add(origin)
+            state['counter_connections'][origin] += 1
+            state['counter_connections'][end] += 1
+    return state
+
+
+def test_sliding_window_matches_rescan() -> None:
+    """Check that every report is equal to the aggregation of its period from scratch."""
+    hosts = ['host-O', 'host-E', 'host-A', 'host-B', 'host-C']
+    lines = [
+        (1000 * i * 7919 % (4 * 60 * 60 * 1000) // 5 + i * 1000, hosts[i % 5], hosts[(i * 3 + 1) % 5])
+        for i in range(3000)
+    ]
+    lines.sort(key=lambda line: line[0] + line[0] % 7 * 1000)
+    window = SlidingWindow('host-O', 'host-E', 0, window=20 * MINUTE_TIMESTAMP, slide=5 * MINUTE_TIMESTAMP,
+                           margin=MINUTE_TIMESTAMP)
+    reports: List[Tuple[int, Dict]] = []
+    for timestamp, origin, end in lines:
+        reports.extend(window.advance(timestamp))
+        assert window.add(timestamp, origin, end)
+    assert len(reports) > 10
+    for window_start, state in reports:
+        assert state == _expected_state(lines, window_start, window_start + 20 * MINUTE_TIMESTAMP)
+    assert window.buckets <= len(window.ring)
+
+
+def test_sliding_window_compaction() -> None:
+    """Check that the hostnames of the expired buckets are dropped and the reports are still right."""
+    lines = [(i * 1000, ['host-O', f"host-{i}"][i % 2], ['host-E', f"host-{i // 3}"][i % 3 % 2]) for i in range(20000)]
+    window = SlidingWindow('host-O', 'host-E', 0, window=5 * MINUTE_TIMESTAMP, slide=MINUTE_TIMESTAMP,
+                           margin=MINUTE_TIMESTAMP)
+    reports: List[Tuple[int, Dict]] = []
+    for timestamp, origin, end in lines:
+        reports.extend(window.advance(timestamp))
+        window.add(timestamp, origin, end)
+        assert len(window.hostnames) <= 4 * 7 * 60
+    assert len(reports) > 300
+    for window_start, state in reports[::50]:
+        assert state == _expected_state(lines, window_start, window_start + 5 * MINUTE_TIMESTAMP)
+    assert window.hostnames.hostname(window.origin_host_id) == 'host-O'
+    assert window.hostnames.hostname(window.end_host_id) == 'host-E'
+
+
+def test_sliding_window_late_line() -> None:
+    """Check that lines before the current period are dropped."""
+    window = SlidingWindow('host-O', 'host-E', 0, window=MINUTE_TIMESTAMP, slide=MINUTE_TIMESTAMP, margin=0)
+    assert window.add(10, 'host-O', 'host-E')
+    assert [start for start, _ in window.advance(MINUTE_TIMESTAMP)] == [0]
+    assert not window.add(20, 'host-O', 'host-E')
+    assert window.state() == {'connected_to': set(), 'connected_from': set(), 'counter_connections': Counter()}
+    assert window.buckets == 0
+
+
+def test_sliding_window_long_gap() -> None:
+    """Check that an idle gap reports only the last empty period."""
+    window = SlidingWindow('host-O', 'host-E', 0, window=2 * MINUTE_TIMESTAMP, slide=MINUTE_TIMESTAMP, margin=0)
+    window.add(10, 'host-A', 'host-E')
+    reports = list(window.advance(10 * MINUTE_TIMESTAMP))
+    assert [start for start, _ in reports] == [0, 8 * MINUTE_TIMESTAMP]
+    assert reports[0][1]['connected_to'] == {'host-A'}
+    assert reports[1][1]['connected_to'] == set()
+
+
+def test_sliding_window_invalid() -> None:
+    """Check that window and slide must be multiples of the bucket."""
+    with raises(ValueError):
+        SlidingWindow('host-O', 'host-E', 0, window=90 * 1000)
+
+
+def test_sliding_window_approximate() -> None:
+    """Check that the approximate mode reports the top hostnames with their bounds."""
+    window = SlidingWindow('host-O', 'host-E', 0, window=2 * MINUTE_TIMESTAMP, slide=MINUTE_TIMESTAMP, margin=0,
+                           top_k=2, capacity=4)
+    lines = [(i * 100, f"host-{i % 7 % 4}", 'host-E' if i % 2 else 'host-Z') for i in range(2400)]
+    reports: List[Tuple[int, Dict]] = []
+    for timestamp, origin, end in lines:
+        reports.extend(window.advance(timestamp))
+        window.add(timestamp, origin, end)
+    assert len(reports) == 2
+    for window_start, state in reports:
+        expected = _expected_state(
+            [(timestamp, origin, end) for timestamp, origin, end in lines], window_start,
+            window_start + 2 * MINUTE_TIMESTAMP)
+        assert 'counter_connections' not in state
+        assert state['connected_to'] == expected['connected_to']
+        assert len(state['top_connections']) == 2
+        for hostname, count, error in state['top_connections']:
+            assert count - error <= expected['counter_connections'][hostname] <= count
+        assert {hostname for hostname, _, _ in state['top_connections']} == {'host-E', 'host-Z'}
+    assert window.hostnames.get('host-Z') is None